@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, desc
 from typing import List, Optional
 from datetime import datetime
 
 from app.core.database import get_db
+from app.core.responses import json_response
 from app.core.security import get_current_admin
 from app.models.user import User
 from app.models.order import Order, OrderItem, OrderStatus
@@ -14,10 +16,21 @@ from app.schemas.admin import (
     SalesMetrics,
     TopProduct,
     RecentOrder,
-    OrderStatusUpdate
+    OrderStatusUpdate,
+    BulkOrderStatusUpdate,
+    BulkOrderStatusReport,
+    OrderStatusResult
 )
-from app.schemas.order import OrderResponse, OrderItemResponse
-from app.schemas.product import ProductResponse
+from app.schemas.order import OrderResponse
+from app.schemas.product import ProductResponse, ProductImportReport
+from app.services.cart_reaper import cart_reaper
+from app.services.cart_service import cart_cache
+from app.services.catalog_cache import catalog_cache
+from app.services.job_queue import job_queue
+from app.services.order_state import transition_orders
+from app.services.order_serializer import order_response, orders_response
+from app.services.product_import import ProductImporter, detect_format
+from app.services.product_export import EXPORTERS, MEDIA_TYPES
 
 
 router = APIRouter()
@@ -153,10 +166,8 @@ def get_all_orders(
     - skip/limit: Paginación
     """
     
-    query = db.query(Order).options(
-        joinedload(Order.user),
-        joinedload(Order.items)
-    )
+    # Solo los items: el usuario no forma parte de la respuesta
+    query = db.query(Order).options(joinedload(Order.items))
     
     # Aplicar filtros
     if status:
@@ -178,43 +189,7 @@ def get_all_orders(
     # Paginación
     orders = query.offset(skip).limit(limit).all()
     
-    return [
-        OrderResponse(
-            id=order.id,
-            user_id=order.user_id,
-            subtotal=order.subtotal,
-            tax=order.tax,
-            total=order.total,
-            status=order.status,
-            shipping_address=order.shipping_address,
-            shipping_city=order.shipping_city,
-            shipping_postal_code=order.shipping_postal_code,
-            contact_email=order.contact_email,
-            contact_phone=order.contact_phone,
-            created_at=order.created_at,
-            updated_at=order.updated_at,
-            paid_at=order.paid_at,
-            shipped_at=order.shipped_at,
-            delivered_at=order.delivered_at,
-            cancelled_at=order.cancelled_at,
-            payment_method=order.payment_method,
-            payment_id=order.payment_id,
-            items=[
-                OrderItemResponse(
-                    id=item.id,
-                    product_id=item.product_id,
-                    product_name=item.product_name,
-                    product_description=item.product_description,
-                    product_image_url=item.product_image_url,
-                    unit_price=item.unit_price,
-                    quantity=item.quantity,
-                    subtotal=item.subtotal
-                )
-                for item in order.items
-            ]
-        )
-        for order in orders
-    ]
+    return orders_response(orders)
 
 @router.put("/orders/{order_id}/status", response_model=OrderResponse)
 def update_order_status(
@@ -232,6 +207,10 @@ def update_order_status(
     - shipped: Enviada
     - delivered: Entregada
     - cancelled: Cancelada
+
+    Solo se avanza (se pueden saltar pasos): volver a un estado anterior o
+    repetir el actual responde 400. Una orden entregada se puede cancelar,
+    pero su stock no vuelve al catalogo.
     """
     
     order = db.query(Order).options(joinedload(Order.items)).filter(
@@ -244,89 +223,68 @@ def update_order_status(
             detail="Orden no encontrada"
         )
     
-    # Validar estado
-    try:
-        new_status = OrderStatus(status_update.status)
-    except ValueError:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Estado inválido: {status_update.status}"
-        )
-    
-    # Validar transiciones de estado
-    if order.status == OrderStatus.CANCELLED:
-        raise HTTPException(
-            status_code=400,
-            detail="No se puede cambiar el estado de una orden cancelada"
-        )
-    
-    if order.status == OrderStatus.DELIVERED and new_status != OrderStatus.CANCELLED:
+    new_status = _parse_status(status_update.status)
+
+    # Transicion segun la tabla de order_state (timestamps y stock incluidos)
+    result = transition_orders(db, [order.id], new_status)
+    if result.errors:
+        db.rollback()
         raise HTTPException(
             status_code=400,
-            detail="No se puede cambiar el estado de una orden entregada"
+            detail=result.errors[order.id]
         )
     
-    # Actualizar estado
-    old_status = order.status
-    order.status = new_status
-    
-    # Actualizar timestamps según el nuevo estado
-    if new_status == OrderStatus.PAID and not order.paid_at:
-        order.paid_at = datetime.now()
-    
-    elif new_status == OrderStatus.SHIPPED and not order.shipped_at:
-        order.shipped_at = datetime.now()
-    
-    elif new_status == OrderStatus.DELIVERED and not order.delivered_at:
-        order.delivered_at = datetime.now()
-    
-    elif new_status == OrderStatus.CANCELLED and not order.cancelled_at:
-        order.cancelled_at = datetime.now()
-        
-        # Si se cancela, restaurar stock
-        if old_status in [OrderStatus.PENDING, OrderStatus.PAID, OrderStatus.PROCESSING]:
-            for item in order.items:
-                product = db.query(Product).filter(Product.id == item.product_id).first()
-                if product:
-                    product.stock += item.quantity
-    
+    if result.restored:
+        catalog_cache.mark_changed(db, list(result.restored))
     db.commit()
     db.refresh(order)
     
-    return OrderResponse(
-        id=order.id,
-        user_id=order.user_id,
-        subtotal=order.subtotal,
-        tax=order.tax,
-        total=order.total,
-        status=order.status,
-        shipping_address=order.shipping_address,
-        shipping_city=order.shipping_city,
-        shipping_postal_code=order.shipping_postal_code,
-        contact_email=order.contact_email,
-        contact_phone=order.contact_phone,
-        created_at=order.created_at,
-        updated_at=order.updated_at,
-        paid_at=order.paid_at,
-        shipped_at=order.shipped_at,
-        delivered_at=order.delivered_at,
-        cancelled_at=order.cancelled_at,
-        payment_method=order.payment_method,
-        payment_id=order.payment_id,
-        items=[
-            OrderItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                product_name=item.product_name,
-                product_description=item.product_description,
-                product_image_url=item.product_image_url,
-                unit_price=item.unit_price,
-                quantity=item.quantity,
-                subtotal=item.subtotal
+    return order_response(order)
+
+@router.put("/orders/status", response_model=BulkOrderStatusReport)
+def bulk_update_order_status(
+    bulk_update: BulkOrderStatusUpdate,
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Cambiar el estado de muchas órdenes en una transacción (admin)
+
+    Ej. marcar como enviadas todas las órdenes despachadas del día. Cada
+    orden se valida contra la tabla de transiciones; las que no se pueden
+    mover quedan en el reporte con su motivo y no impiden mover las demás.
+    """
+    new_status = _parse_status(bulk_update.status)
+
+    result = transition_orders(db, bulk_update.order_ids, new_status)
+    if result.restored:
+        catalog_cache.mark_changed(db, list(result.restored))
+    db.commit()
+
+    moved = set(result.moved)
+    return json_response(BulkOrderStatusReport(
+        status=new_status.value,
+        updated=len(moved),
+        failed=len(result.errors),
+        results=[
+            OrderStatusResult(
+                order_id=order_id,
+                updated=order_id in moved,
+                previous_status=result.previous[order_id].value if order_id in result.previous else None,
+                error=result.errors.get(order_id)
             )
-            for item in order.items
+            for order_id in dict.fromkeys(bulk_update.order_ids)
         ]
-    )
+    ))
+
+def _parse_status(value: str) -> OrderStatus:
+    try:
+        return OrderStatus(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Estado inválido: {value}"
+        )
 
 @router.get("/products", response_model=List[ProductResponse])
 def get_all_products_admin(
@@ -345,6 +303,61 @@ def get_all_products_admin(
     products = query.all()
     return products
 
+@router.get("/products/export")
+def export_products(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_inactive: bool = Query(False),
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Exportar el catálogo completo en streaming (NDJSON o CSV) para feeds (admin)
+
+    Las filas se leen del cursor por lotes y se envían a medida que llegan,
+    así la memoria no depende del tamaño del catálogo. El formato es el mismo
+    que acepta POST /admin/products/import.
+    """
+    return StreamingResponse(
+        EXPORTERS[format](db, include_inactive),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="productos.{format}"'}
+    )
+
+@router.post("/products/import", response_model=ProductImportReport)
+def import_products(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv o ndjson (por defecto según la extensión)"),
+    chunk_size: Optional[int] = Query(None, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Importación masiva de productos desde CSV o NDJSON (admin)
+
+    - Columnas/campos: los de ProductCreate, más `id` e `is_active` opcionales
+    - Filas con `id` existente se actualizan; el resto se inserta
+    - Se escribe por lotes de chunk_size filas, con un commit por lote
+    - Las filas inválidas (mal codificadas, mal formadas o con datos
+      inválidos) se informan en `errors` sin detener la importación
+    - Si un lote no se puede guardar la importación se detiene: responde
+      207 con los lotes ya confirmados en `committed`, o 400 si no hubo
+      ninguno
+    """
+    file_format = detect_format(file.filename, format)
+    if file_format is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Formato no soportado. Usa csv o ndjson"
+        )
+
+    report = ProductImporter(db, chunk_size).run(file.file, file_format)
+    if report.completed:
+        return report
+    return json_response(
+        report,
+        status_code=status.HTTP_207_MULTI_STATUS if report.committed else status.HTTP_400_BAD_REQUEST
+    )
+
 @router.get("/products/low-stock", response_model=List[ProductResponse])
 def get_low_stock_products(
     db: Session = Depends(get_db),
@@ -363,6 +376,49 @@ def get_low_stock_products(
     
     return products
 
+@router.get("/cache/stats")
+def get_cache_stats(
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Estadisticas de la cache del catalogo y de la cache de carritos
+    (hits, misses, tamaño)
+    """
+    return {**catalog_cache.stats(), "carts": cart_cache.stats()}
+
+@router.get("/carts/reaper")
+def get_cart_reaper_stats(
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Metricas del job de limpieza de carritos abandonados
+    (corridas, filas y carritos eliminados, ultima ejecucion)
+    """
+    return cart_reaper.stats()
+
+@router.post("/carts/reap")
+def reap_abandoned_carts(
+    db: Session = Depends(get_db),
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Ejecutar ahora la limpieza de carritos abandonados (admin)
+
+    Borra por lotes los carritos sin actividad por mas de
+    CART_IDLE_TTL_HOURS horas.
+    """
+    return cart_reaper.run_once(db)
+
+@router.get("/jobs")
+def get_job_queue_stats(
+    admin: User = Depends(get_current_admin)
+):
+    """
+    Metricas de la cola de jobs post-checkout
+    (profundidad, en ejecucion, espera, exitos, reintentos y descartados por tipo)
+    """
+    return job_queue.stats()
+
 @router.get("/users", response_model=List[dict])
 def get_all_users(
     db: Session = Depends(get_db),
@@ -1,18 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from typing import List
 
 from app.core.database import get_db
+from app.core.responses import json_response
 from app.core.security import get_current_user
 from app.models.user import User
-from app.models.cart import CartItem
 from app.models.product import Product
 from app.schemas.cart import (
     CartItemCreate,
     CartItemUpdate,
+    CartBatchUpdate,
     CartItemResponse,
-    CartSummary
+    CartSummary,
+    CartTotals,
+    StaleCartItem
 )
+from app.services.cart_service import cart_cache
+from app.services.cart_store import CartLine, CartStore, get_cart_store
+from app.services.stock_reservations import release, reserve
 
 router = APIRouter()
 
@@ -22,6 +28,7 @@ TAX_RATE = 0.19  # 19% IVA Chile
 def add_to_cart(
     item_data: CartItemCreate,
     db: Session = Depends(get_db),
+    cart_store: CartStore = Depends(get_cart_store),
     current_user: User = Depends(get_current_user)
 ):
     product = db.query(Product).filter(
@@ -40,115 +47,231 @@ def add_to_cart(
             status_code=400,
             detail=f"Stock insuficiente. Disponible: {product.stock}"
         )
-    
-    existing_item = db.query(CartItem).filter(
-        CartItem.user_id == current_user.id,
-        CartItem.product_id == item_data.product_id
-    ).first()
 
-    if existing_item:
-       new_quantity = existing_item.quantity + item_data.quantity
+    # El hold cubre la cantidad total de la linea despues de agregar
+    shortfall = reserve(
+        db, current_user.id, {product.id: item_data.quantity},
+        in_cart=lambda product_id: _quantity_in_cart(cart_store, current_user.id, product_id)
+    )
+    if shortfall:
+        db.rollback()
+        in_cart = _quantity_in_cart(cart_store, current_user.id, product.id)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Stock insuficiente. Disponible: {shortfall[product.id]}, en carrito: {in_cart}"
+        )
 
-       if product.stock < new_quantity:
-           raise HTTPException(
-                status_code=400,
-                detail=f"Stock insuficiente. Disponible: {product.stock}, en carrito: {existing_item.quantity}"
-            )
-       
-       existing_item.quantity = new_quantity
-       db.commit()
-       db.refresh(existing_item)
-
-       return CartItemResponse(
-            id=existing_item.id,
-            product_id=existing_item.product_id,
-            product_name=product.name,
-            product_price=product.price,
-            product_image_url=product.image_url,
-            quantity=existing_item.quantity,
-            price_at_addition=existing_item.price_at_addition,
-            subtotal=existing_item.subtotal
+    line = cart_store.add(current_user.id, product, item_data.quantity, product.stock)
+
+    if line is None:
+        # El producto ya estaba en el carrito y la suma supera el stock
+        db.rollback()
+        in_cart = _quantity_in_cart(cart_store, current_user.id, product.id)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Stock insuficiente. Disponible: {product.stock}, en carrito: {in_cart}"
         )
-    
-    cart_item = CartItem(
-        user_id=current_user.id,
-        product_id=item_data.product_id,
-        quantity=item_data.quantity,
-        price_at_addition=product.price
-    )
-    
-    db.add(cart_item)
+
+    cart_cache.mark_changed(db, [current_user.id])
     db.commit()
-    db.refresh(cart_item)
 
-    return CartItemResponse(
-        id=cart_item.id,
-        product_id=cart_item.product_id,
-        product_name=product.name,
-        product_price=product.price,
-        product_image_url=product.image_url,
-        quantity=cart_item.quantity,
-        price_at_addition=cart_item.price_at_addition,
-        subtotal=cart_item.subtotal
+    return json_response(
+        _line_response(line, product),
+        status_code=status.HTTP_201_CREATED
     )
-    
+
 @router.get("/", response_model=CartSummary)
 def get_cart(
     db: Session = Depends(get_db),
+    cart_store: CartStore = Depends(get_cart_store),
     current_user: User = Depends(get_current_user)
 ):
-    cart_items = db.query(CartItem).filter(
-        CartItem.user_id == current_user.id
-    ).options(joinedload(CartItem.product)).all()
+    return json_response(_cart_summary(db, cart_store, current_user.id))
+
+@router.get("/totals", response_model=CartTotals)
+def get_cart_totals(
+    cart_store: CartStore = Depends(get_cart_store),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Totales del carrito para el badge del header
+
+    En SQL es una sola consulta agregada (sin cargar items ni productos);
+    cuenta solo los productos activos, igual que GET /cart.
+    """
+    items_count, total_quantity, subtotal = cart_store.totals(current_user.id)
+
+    tax = subtotal * TAX_RATE
+
+    return json_response(CartTotals(
+        items_count=items_count,
+        total_quantity=total_quantity,
+        subtotal=round(subtotal, 2),
+        tax=round(tax, 2),
+        total=round(subtotal + tax, 2)
+    ))
+
+def _quantity_in_cart(cart_store: CartStore, user_id: int, product_id: int) -> int:
+    return next(
+        (line.quantity for line in cart_store.get_lines(user_id) if line.product_id == product_id),
+        0
+    )
+
+def _line_response(line: CartLine, product: Product) -> CartItemResponse:
+    return CartItemResponse(
+        id=line.id,
+        product_id=line.product_id,
+        product_name=product.name,
+        product_price=product.price,
+        product_image_url=product.image_url,
+        quantity=line.quantity,
+        price_at_addition=line.price_at_addition,
+        subtotal=line.subtotal
+    )
+
+def _cart_summary(db: Session, cart_store: CartStore, user_id: int) -> CartSummary:
+    return cart_cache.get_summary(db, user_id, lambda: _load_cart_summary(db, cart_store, user_id))
+
+def _load_cart_summary(db: Session, cart_store: CartStore, user_id: int):
+    lines = cart_store.get_lines(user_id)
+    products = {
+        product.id: product
+        for product in db.query(Product).filter(
+            Product.id.in_([line.product_id for line in lines])
+        )
+    } if lines else {}
     
     items_response = []
+    stale_items = []
     subtotal = 0
 
-    for item in cart_items:
-        if item.product and item.product.is_active:
-            item_response = CartItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                product_name=item.product.name,
-                product_price=item.product.price,
-                product_image_url=item.product.image_url,
-                quantity=item.quantity,
-                price_at_addition=item.price_at_addition,
-                subtotal=item.subtotal
-            )
-            items_response.append(item_response)
-            subtotal += item.subtotal
+    for line in lines:
+        product = products.get(line.product_id)
+        if product and product.is_active:
+            items_response.append(_line_response(line, product))
+            subtotal += line.subtotal
+            if product.version != line.product_version:
+                stale_items.append(StaleCartItem(
+                    id=line.id,
+                    product_id=product.id,
+                    price_at_addition=line.price_at_addition,
+                    current_price=product.price,
+                    stock=product.stock,
+                    product_version=product.version
+                ))
     
     tax = subtotal * TAX_RATE
     total = subtotal + tax
 
-    return CartSummary(
+    summary = CartSummary(
         items=items_response,
         subtotal=round(subtotal, 2),
         tax=round(tax, 2),
         total=round(total, 2),
-        items_count=len(items_response)
+        items_count=len(items_response),
+        stale_items=stale_items
     )
+    return summary, [line.product_id for line in lines]
+
+@router.post("/refresh", response_model=CartSummary)
+def refresh_cart(
+    db: Session = Depends(get_db),
+    cart_store: CartStore = Depends(get_cart_store),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Aceptar los precios actuales de las lineas desactualizadas
+
+    Las lineas de stale_items pasan al precio y version actuales del
+    producto; el resto del carrito no se toca.
+    """
+    summary = _cart_summary(db, cart_store, current_user.id)
+
+    if summary.stale_items:
+        stale_ids = [item.product_id for item in summary.stale_items]
+        products = {
+            product.id: product
+            for product in db.query(Product).filter(Product.id.in_(stale_ids))
+        }
+        cart_store.refresh(current_user.id, products)
+        cart_cache.mark_changed(db, [current_user.id])
+        db.commit()
+        summary = _cart_summary(db, cart_store, current_user.id)
+
+    return json_response(summary)
+
+@router.put("/items", response_model=CartSummary)
+def update_cart_items(
+    batch: CartBatchUpdate,
+    db: Session = Depends(get_db),
+    cart_store: CartStore = Depends(get_cart_store),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Aplicar varios cambios al carrito en una sola transaccion
+
+    Cada operacion fija la cantidad de un producto (0 = quitarlo). El stock
+    de todos los productos se valida con una sola consulta IN; si alguna
+    operacion es invalida no se aplica ninguna.
+    """
+    # Si un producto se repite gana la ultima operacion
+    quantities = {op.product_id: op.quantity for op in batch.items}
+
+    products = {
+        product.id: product
+        for product in db.query(Product).filter(Product.id.in_(quantities.keys()))
+    }
+
+    errors = []
+    for product_id, quantity in quantities.items():
+        if quantity == 0:
+            continue
+        product = products.get(product_id)
+        if not product or not product.is_active:
+            errors.append(f"Producto {product_id} no encontrado o no disponible")
+        elif product.stock < quantity:
+            errors.append(f"Stock insuficiente para '{product.name}'. Disponible: {product.stock}")
+
+    if errors:
+        raise HTTPException(
+            status_code=400,
+            detail="; ".join(errors)
+        )
+
+    shortfall = reserve(db, current_user.id, quantities)
+    if shortfall:
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="; ".join(
+                f"Stock insuficiente para '{products[product_id].name}'. Disponible: {available}"
+                for product_id, available in shortfall.items()
+            )
+        )
+
+    cart_store.set_quantities(current_user.id, quantities, products)
+    cart_cache.mark_changed(db, [current_user.id])
+    db.commit()
+
+    return json_response(_cart_summary(db, cart_store, current_user.id))
 
 @router.put("/items/{item_id}", response_model=CartItemResponse)
 def update_cart_item(
     item_id: int,
     item_update: CartItemUpdate,
     db: Session = Depends(get_db),
+    cart_store: CartStore = Depends(get_cart_store),
     current_user: User = Depends(get_current_user)
 ):
-    cart_item = db.query(CartItem).filter(
-        CartItem.id == item_id,
-        CartItem.user_id == current_user.id
-    ).first()
+    line = cart_store.get_line(current_user.id, item_id)
 
-    if not cart_item:
+    if not line:
         raise HTTPException(
             status_code=404,
             detail="Item no encontrado en el carrito"
         )
     
-    product = db.query(Product).filter(Product.id == cart_item.product_id).first()
+    product = db.query(Product).filter(Product.id == line.product_id).first()
 
     if not product or not product.is_active:
         raise HTTPException(
@@ -160,40 +283,40 @@ def update_cart_item(
             status_code=400,
             detail=f"Stock insuficiente. Disponible: {product.stock}"
         )
+
+    shortfall = reserve(db, current_user.id, {line.product_id: item_update.quantity})
+    if shortfall:
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Stock insuficiente. Disponible: {shortfall[line.product_id]}"
+        )
     
-    cart_item.quantity = item_update.quantity
+    cart_store.set_quantities(current_user.id, {line.product_id: item_update.quantity}, {product.id: product})
+    cart_cache.mark_changed(db, [current_user.id])
     db.commit()
-    db.refresh(cart_item)
-    
-    return CartItemResponse(
-        id=cart_item.id,
-        product_id=cart_item.product_id,
-        product_name=product.name,
-        product_price=product.price,
-        product_image_url=product.image_url,
-        quantity=cart_item.quantity,
-        price_at_addition=cart_item.price_at_addition,
-        subtotal=cart_item.subtotal
-    )
+
+    line.quantity = item_update.quantity
+    return json_response(_line_response(line, product))
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 def remove_from_cart(
     item_id: int,
     db: Session = Depends(get_db),
+    cart_store: CartStore = Depends(get_cart_store),
     current_user: User = Depends(get_current_user)
 ):
-    cart_item = db.query(CartItem).filter(
-        CartItem.id == item_id,
-        CartItem.user_id == current_user.id
-    ).first()
+    line = cart_store.get_line(current_user.id, item_id)
 
-    if not cart_item:
+    if not line:
         raise HTTPException(
             status_code=404,
             detail="Item no encontrado en el carrito"
         )
     
-    db.delete(cart_item)
+    cart_store.remove(current_user.id, line.product_id)
+    release(db, current_user.id, [line.product_id])
+    cart_cache.mark_changed(db, [current_user.id])
     db.commit()
 
     return None
@@ -201,10 +324,13 @@ def remove_from_cart(
 @router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
 def clear_cart(
     db: Session = Depends(get_db),
+    cart_store: CartStore = Depends(get_cart_store),
     current_user: User = Depends(get_current_user)
 ):
     
-    db.query(CartItem).filter(CartItem.user_id == current_user.id).delete()
+    cart_store.clear(current_user.id)
+    release(db, current_user.id)
+    cart_cache.mark_changed(db, [current_user.id])
     db.commit()
 
-    return None
\ No newline at end of file
+    return None
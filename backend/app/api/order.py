@@ -1,19 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy import bindparam, func, insert, select, update
 from sqlalchemy.orm import Session, joinedload
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 from app.core.database import get_db
+from app.core.pagination import decode_cursor, encode_cursor, keyset_after, keyset_order, set_next_cursor
+from app.core.responses import json_response
 from app.core.security import get_current_user
 from app.models.user import User
-from app.models.cart import CartItem
 from app.models.product import Product
 from app.models.order import Order, OrderItem, OrderStatus
+from app.models.stock_movement import StockMovementReason
+from app.services.cart_service import cart_cache
+from app.services.cart_store import CartStore, get_cart_store
+from app.services.idempotency import idempotent, record_response
+from app.services.inventory import record_movements
+from app.services.job_queue import enqueue_after_commit
+from app.services import order_jobs  # registra los handlers de jobs
+from app.services.order_state import CUSTOMER_CANCELLABLE, transition_orders
+from app.services.stock_reservations import available_stock, release, stock_condition
+from app.services.catalog_cache import catalog_cache
+from app.services.order_serializer import order_response
 from app.schemas.order import (
     OrderCreate,
     OrderResponse,
-    OrderSummary,
-    OrderItemResponse
+    OrderSummary
 )
 
 router = APIRouter()
@@ -21,16 +33,17 @@ router = APIRouter()
 TAX_RATE = 0.19
 
 @router.post("/", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
+@idempotent("POST /orders/", status_code=status.HTTP_201_CREATED)
 def create_order(
     order_data: OrderCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    cart_store: CartStore = Depends(get_cart_store),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, max_length=255)
 ):
     
-    # 1. Obtener items del carrito
-    cart_items = db.query(CartItem).filter(
-        CartItem.user_id == current_user.id
-    ).options(joinedload(CartItem.product)).all()
+    # 1. Obtener items del carrito (el carrito se materializa en SQL aqui)
+    cart_items = cart_store.get_lines(current_user.id)
     
     if not cart_items:
         raise HTTPException(
@@ -42,21 +55,31 @@ def create_order(
     subtotal = 0
     order_items_data = []
     
+    products = {
+        product.id: product
+        for product in db.query(Product).filter(
+            Product.id.in_([cart_item.product_id for cart_item in cart_items])
+        )
+    }
+
+    # Con reservas activas, el stock retenido por otros carritos no esta disponible
+    available = available_stock(db, products.values(), current_user.id)
+
     for cart_item in cart_items:
-        product = cart_item.product
+        product = products.get(cart_item.product_id)
         
         # Verificar que el producto existe y está activo
         if not product or not product.is_active:
             raise HTTPException(
                 status_code=400,
-                detail=f"El producto '{cart_item.product.name if product else 'desconocido'}' ya no está disponible"
+                detail=f"El producto '{product.name if product else 'desconocido'}' ya no está disponible"
             )
         
         # Verificar stock suficiente
-        if product.stock < cart_item.quantity:
+        if available[product.id] < cart_item.quantity:
             raise HTTPException(
                 status_code=400,
-                detail=f"Stock insuficiente para '{product.name}'. Disponible: {product.stock}, solicitado: {cart_item.quantity}"
+                detail=f"Stock insuficiente para '{product.name}'. Disponible: {available[product.id]}, solicitado: {cart_item.quantity}"
             )
         
         # Calcular subtotal del item (usar precio actual del producto)
@@ -75,108 +98,175 @@ def create_order(
     tax = subtotal * TAX_RATE
     total = subtotal + tax
     
-    # 4. Crear la orden
-    new_order = Order(
-        user_id=current_user.id,
-        subtotal=round(subtotal, 2),
-        tax=round(tax, 2),
-        total=round(total, 2),
-        status=OrderStatus.PENDING,
-        shipping_address=order_data.shipping_address,
-        shipping_city=order_data.shipping_city,
-        shipping_postal_code=order_data.shipping_postal_code,
-        contact_email=order_data.contact_email,
-        contact_phone=order_data.contact_phone,
-        payment_method=order_data.payment_method
-    )
-    
-    db.add(new_order)
-    db.flush() # Para obtener el ID de la orden sin hacer commit aún
+    # 4. Crear la orden (RETURNING de la fila completa: sin flush ni refresh del ORM)
+    now = datetime.now()
+    order_values = {
+        'user_id': current_user.id,
+        'subtotal': round(subtotal, 2),
+        'tax': round(tax, 2),
+        'total': round(total, 2),
+        'status': OrderStatus.PENDING,
+        'shipping_address': order_data.shipping_address,
+        'shipping_city': order_data.shipping_city,
+        'shipping_postal_code': order_data.shipping_postal_code,
+        'contact_email': order_data.contact_email,
+        'contact_phone': order_data.contact_phone,
+        'payment_method': order_data.payment_method,
+        'created_at': now,
+        'updated_at': now
+    }
+    order = db.execute(insert(Order).values(**order_values).returning(*Order.__table__.c)).one()
+    order_id = order.id
 
-    # 5. Crear los items de la orden y reducir stock
-    for item_data in order_items_data:
-        product = item_data['product']
-        
-        # Crear OrderItem con snapshot del producto
-        order_item = OrderItem(
-            order_id=new_order.id,
-            product_id=product.id,
-            product_name=product.name,
-            product_description=product.description,
-            product_image_url=product.image_url,
-            unit_price=item_data['unit_price'],
-            quantity=item_data['quantity'],
-            subtotal=item_data['subtotal']
+    # 5. Crear los items de la orden en un solo INSERT, con snapshot de los
+    # productos ya cargados; RETURNING devuelve las filas en el mismo orden
+    item_rows = [
+        {
+            'order_id': order_id,
+            'product_id': item_data['product'].id,
+            'product_name': item_data['product'].name,
+            'product_description': item_data['product'].description,
+            'product_image_url': item_data['product'].image_url,
+            'unit_price': item_data['unit_price'],
+            'quantity': item_data['quantity'],
+            'subtotal': item_data['subtotal']
+        }
+        for item_data in order_items_data
+    ]
+    items = db.execute(
+        insert(OrderItem).returning(*OrderItem.__table__.c, sort_by_parameter_order=True),
+        item_rows
+    ).all()
+
+    # 6. Reducir stock con un UPDATE condicional por linea, enviado como un
+    # executemany sobre la tabla (no el UPDATE por PK del ORM). Verificacion
+    # y descuento son atomicos, asi dos checkouts concurrentes no pueden
+    # vender la misma unidad; si alguna linea no actualiza su fila, el stock
+    # ya no alcanza.
+    result = db.execute(
+        update(Product.__table__)
+        .where(
+            Product.id == bindparam('line_product_id'),
+            stock_condition(bindparam('line_product_id'), current_user.id, bindparam('line_quantity'))
         )
-        
-        db.add(order_item)
-        
-        # Reducir stock del producto
-        product.stock -= item_data['quantity']
+        .values(stock=Product.stock - bindparam('line_quantity'), version=Product.version + 1),
+        [
+            {'line_product_id': item_data['product'].id, 'line_quantity': item_data['quantity']}
+            for item_data in order_items_data
+        ]
+    )
+    if result.rowcount != len(order_items_data):
+        db.rollback()
+        short = _first_short_product(db, order_items_data)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Stock insuficiente para '{short}'. Otro pedido tomó las unidades disponibles"
+        )
+
+    # Registrar la salida de stock de cada linea
+    record_movements(db, items, StockMovementReason.SALE, -1)
 
-    # 6. Vaciar el carrito
-    db.query(CartItem).filter(CartItem.user_id == current_user.id).delete()
+    # 7. Vaciar el carrito (al confirmar la transaccion) y liberar reservas
+    cart_store.clear_on_commit(current_user.id)
+    release(db, current_user.id)
 
-    # 7. Hacer commit de todo
+    # 8. Efectos que el cliente no necesita esperar: se encolan al hacer commit
+    enqueue_after_commit(db, "orders.send_confirmation", order_id=order_id)
+    if order_data.payment_method == "stripe":
+        enqueue_after_commit(db, "orders.create_payment_intent", order_id=order_id)
+
+    # 9. Respuesta con las filas que devolvio el RETURNING (sin refresh),
+    # guardada para la Idempotency-Key en la misma transaccion
+    response = record_response(db, order_response(order, items, status_code=status.HTTP_201_CREATED))
+
+    # 10. Hacer commit de todo (las caches del catalogo y del carrito se
+    # invalidan al confirmar)
+    catalog_cache.mark_changed(db, [item_data['product'].id for item_data in order_items_data])
+    cart_cache.mark_changed(db, [current_user.id])
     db.commit()
-    db.refresh(new_order)
 
-    # 8. Preparar respuesta con items
-    return OrderResponse(
-        id=new_order.id,
-        user_id=new_order.user_id,
-        subtotal=new_order.subtotal,
-        tax=new_order.tax,
-        total=new_order.total,
-        status=new_order.status,
-        shipping_address=new_order.shipping_address,
-        shipping_city=new_order.shipping_city,
-        shipping_postal_code=new_order.shipping_postal_code,
-        contact_email=new_order.contact_email,
-        contact_phone=new_order.contact_phone,
-        created_at=new_order.created_at,
-        updated_at=new_order.updated_at,
-        paid_at=new_order.paid_at,
-        shipped_at=new_order.shipped_at,
-        delivered_at=new_order.delivered_at,
-        cancelled_at=new_order.cancelled_at,
-        payment_method=new_order.payment_method,
-        payment_id=new_order.payment_id,
-        items=[
-            OrderItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                product_name=item.product_name,
-                product_description=item.product_description,
-                product_image_url=item.product_image_url,
-                unit_price=item.unit_price,
-                quantity=item.quantity,
-                subtotal=item.subtotal
-            )
-            for item in new_order.items
-        ]
-    )
+    return response
+
+def _first_short_product(db: Session, order_items_data: list) -> str:
+    """Nombre del primer producto cuyo stock ya no cubre la linea (tras el rollback)"""
+    stocks = dict(db.query(Product.id, Product.stock).filter(
+        Product.id.in_([item_data['product'].id for item_data in order_items_data])
+    ))
+    for item_data in order_items_data:
+        if stocks.get(item_data['product'].id, 0) < item_data['quantity']:
+            return item_data['product'].name
+    return order_items_data[0]['product'].name
 
 @router.get("/", response_model=List[OrderSummary])
 def get_my_orders(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    after: Optional[str] = None
 ):
-    
-    orders = db.query(Order).filter(
+    """
+    Historial de ordenes del usuario, mas recientes primero
+
+    - limit: tamaño de pagina; sin limit se devuelve el historial completo
+    - after: cursor opaco recibido en el header X-Next-Cursor
+
+    La pagina se recorre por (created_at, id) sobre el indice
+    (user_id, created_at); items_count sale de un COUNT agrupado solo sobre
+    las ordenes de la pagina, sin cargar los items.
+    """
+    page = select(Order.id, Order.status, Order.total, Order.created_at).where(
         Order.user_id == current_user.id
-    ).options(joinedload(Order.items)).order_by(Order.created_at.desc()).all()
+    )
+
+    if after: #Continuar despues de la ultima orden de la pagina anterior
+        cursor = decode_cursor(after)
+        try:
+            created_at = datetime.fromisoformat(cursor["created_at"])
+            last_id = int(cursor["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=400,
+                detail="Cursor de paginación inválido"
+            )
+        page = page.where(keyset_after(Order.created_at, Order.id, created_at, last_id, descending=True))
+
+    page = page.order_by(*keyset_order(Order.created_at, Order.id, descending=True))
+    if limit is not None:
+        # Una fila extra para saber si existe una pagina siguiente
+        page = page.limit(limit + 1)
+    page = page.subquery()
+
+    items_count = select(
+        OrderItem.order_id, func.count(OrderItem.id).label("items_count")
+    ).where(
+        OrderItem.order_id.in_(select(page.c.id))
+    ).group_by(OrderItem.order_id).subquery()
 
-    return [
-        OrderSummary(
-            id=order.id,
-            status=order.status,
-            total=order.total,
-            items_count=len(order.items),
-            created_at=order.created_at
+    rows = db.execute(
+        select(
+            page.c.id,
+            page.c.status,
+            page.c.total,
+            page.c.created_at,
+            func.coalesce(items_count.c.items_count, 0).label("items_count")
         )
-        for order in orders
-    ]
+        .outerjoin(items_count, items_count.c.order_id == page.c.id)
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+    ).all()
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        set_next_cursor(response, request, encode_cursor({
+            "created_at": rows[-1].created_at.isoformat(),
+            "id": rows[-1].id
+        }))
+
+    return json_response(
+        [OrderSummary.model_validate(row) for row in rows],
+        response=response
+    )
 
 @router.get("/{order_id}", response_model=OrderResponse)
 def get_order(
@@ -196,40 +286,7 @@ def get_order(
             detail="Orden no encontrada"
         )
     
-    return OrderResponse(
-        id=order.id,
-        user_id=order.user_id,
-        subtotal=order.subtotal,
-        tax=order.tax,
-        total=order.total,
-        status=order.status,
-        shipping_address=order.shipping_address,
-        shipping_city=order.shipping_city,
-        shipping_postal_code=order.shipping_postal_code,
-        contact_email=order.contact_email,
-        contact_phone=order.contact_phone,
-        created_at=order.created_at,
-        updated_at=order.updated_at,
-        paid_at=order.paid_at,
-        shipped_at=order.shipped_at,
-        delivered_at=order.delivered_at,
-        cancelled_at=order.cancelled_at,
-        payment_method=order.payment_method,
-        payment_id=order.payment_id,
-        items=[
-            OrderItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                product_name=item.product_name,
-                product_description=item.product_description,
-                product_image_url=item.product_image_url,
-                unit_price=item.unit_price,
-                quantity=item.quantity,
-                subtotal=item.subtotal
-            )
-            for item in order.items
-        ]
-    )
+    return order_response(order)
 
 @router.put("/{order_id}/cancel", response_model=OrderResponse)
 def cancel_order(
@@ -250,56 +307,25 @@ def cancel_order(
         )
     
     # Verificar que se puede cancelar
-    if order.status not in [OrderStatus.PENDING, OrderStatus.PAID]:
+    if order.status not in CUSTOMER_CANCELLABLE:
         raise HTTPException(
             status_code=400,
             detail=f"No se puede cancelar una orden con status '{order.status.value}'"
         )
     
-    # Devolver stock a los productos
-    for item in order.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if product:
-            product.stock += item.quantity
-    
-    # Actualizar status de la orden
-    order.status = OrderStatus.CANCELLED
-    order.cancelled_at = datetime.now()
+    # Cancelar con un UPDATE condicionado al estado actual; el stock vuelve
+    # con un solo UPDATE para todas las lineas
+    result = transition_orders(db, [order.id], OrderStatus.CANCELLED, allowed_from=CUSTOMER_CANCELLABLE)
+    if result.errors:
+        db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=result.errors[order.id]
+        )
     
+    if result.restored:
+        catalog_cache.mark_changed(db, list(result.restored))
     db.commit()
     db.refresh(order)
 
-    return OrderResponse(
-        id=order.id,
-        user_id=order.user_id,
-        subtotal=order.subtotal,
-        tax=order.tax,
-        total=order.total,
-        status=order.status,
-        shipping_address=order.shipping_address,
-        shipping_city=order.shipping_city,
-        shipping_postal_code=order.shipping_postal_code,
-        contact_email=order.contact_email,
-        contact_phone=order.contact_phone,
-        created_at=order.created_at,
-        updated_at=order.updated_at,
-        paid_at=order.paid_at,
-        shipped_at=order.shipped_at,
-        delivered_at=order.delivered_at,
-        cancelled_at=order.cancelled_at,
-        payment_method=order.payment_method,
-        payment_id=order.payment_id,
-        items=[
-            OrderItemResponse(
-                id=item.id,
-                product_id=item.product_id,
-                product_name=item.product_name,
-                product_description=item.product_description,
-                product_image_url=item.product_image_url,
-                unit_price=item.unit_price,
-                quantity=item.quantity,
-                subtotal=item.subtotal
-            )
-            for item in order.items
-        ]
-    )
\ No newline at end of file
+    return order_response(order)
\ No newline at end of file
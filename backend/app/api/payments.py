@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
 from sqlalchemy.orm import Session
-from datetime import datetime
 from typing import Optional
 import stripe
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.core.config import settings
+from app.core.responses import json_response
 from app.models.user import User
 from app.models.order import Order, OrderStatus
 from app.schemas.payment import (
@@ -13,15 +13,19 @@ from app.schemas.payment import (
     PaymentIntentResponse,
     PaymentConfirmation
 )
+from app.services.idempotency import idempotent, record_response
+from app.services.order_state import transition_orders
 from app.services.stripe_service import StripeService
 
 router = APIRouter()
 
 @router.post("/create-payment-intent", response_model=PaymentIntentResponse)
+@idempotent("POST /payments/create-payment-intent")
 def create_payment_intent(
     payment_data: PaymentIntentCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, max_length=255)
 ):
     """
     Crear un Payment Intent de Stripe para una orden
@@ -76,19 +80,21 @@ def create_payment_intent(
             detail=f"Error al crear Payment Intent: {str(e)}"
         )
     
-    # 5. Guardar payment_intent_id en la orden
+    # 5. Guardar payment_intent_id en la orden, junto con la respuesta
+    # de la Idempotency-Key
     order.payment_id = payment_intent.id
     order.payment_method = "stripe"
-    db.commit()
-    
-    # 6. Retornar client_secret para el frontend
-    return PaymentIntentResponse(
+    response = record_response(db, json_response(PaymentIntentResponse(
         client_secret=payment_intent.client_secret,
         payment_intent_id=payment_intent.id,
         amount=payment_intent.amount,
         currency=payment_intent.currency,
         order_id=order.id
-    )
+    )))
+    db.commit()
+    
+    # 6. Retornar client_secret para el frontend
+    return response
 
 @router.post("/webhook")
 async def stripe_webhook(
@@ -169,16 +175,20 @@ def _handle_payment_succeeded(payment_intent: dict, db: Session):
     """
     payment_intent_id = payment_intent['id']
     
-    order = db.query(Order).filter(
+    order_id = db.query(Order.id).filter(
         Order.payment_id == payment_intent_id
-    ).first()
+    ).scalar()
     
-    if order:
-        order.status = OrderStatus.PAID
-        order.paid_at = datetime.now()
+    if order_id:
+        # Solo una orden pendiente pasa a PAID: un reintento del webhook o una
+        # orden ya cancelada no cambian de estado
+        result = transition_orders(db, [order_id], OrderStatus.PAID, allowed_from=[OrderStatus.PENDING])
         db.commit()
         
-        print(f"Orden #{order.id} marcada como PAID")
+        if result.moved:
+            print(f"Orden #{order_id} marcada como PAID")
+        else:
+            print(f"Pago recibido para orden #{order_id} sin cambio de estado: {result.errors[order_id]}")
 
 def _handle_payment_failed(payment_intent: dict, db: Session):
     """
@@ -1,37 +1,108 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import Integer, and_, case, cast, func
 from sqlalchemy.orm import Session  
 from typing import List, Optional
 
 from app.core.database import get_db
+from app.core.http_cache import is_not_modified, make_etag, not_modified_response, set_validators
+from app.core.pagination import decode_cursor, encode_cursor, keyset_after, keyset_order, set_next_cursor
+from app.core.responses import json_response
 from app.models.product import Product, ProductCategory
 from app.schemas.product import (
     ProductCreate, 
     ProductResponse, 
     ProductCategoryEnum,
-    ProductUpdate
+    ProductUpdate,
+    ProductBatchResponse,
+    ProductFacets,
+    CategoryFacet,
+    PriceBucket
 )
+from app.services.catalog_cache import catalog_cache
+from app.services.search_service import apply_search
 
 router = APIRouter()
 
+# Maximo de ids por consulta en GET /products/batch
+MAX_BATCH_IDS = 200
+
+# Campos por los que se puede ordenar el catalogo ("-" = descendente)
+SORT_FIELDS = {
+    "id": Product.id,
+    "price": Product.price,
+    "name": Product.name,
+}
+
+# Tipos JSON validos para el valor de orden guardado en el cursor
+SORT_VALUE_TYPES = {
+    "id": (int,),
+    "price": (int, float),
+    "name": (str,),
+    "relevance": (int, float),
+}
+
 @router.get("/", response_model=List[ProductResponse]) #Obtener todos los productos activos
 def get_products(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     category: Optional[ProductCategoryEnum] = None,
     search: Optional[str] = None,
     min_price: Optional[float] = Query(None, ge=0),
-    max_price: Optional[float] = Query(None, ge=0)
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: Optional[str] = Query(None, pattern=r"^(-?(id|price|name)|relevance)$"),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    after: Optional[str] = None
 ):
+    """
+    Listado del catalogo con paginacion por cursor (keyset)
+
+    - sort: id, price, name (prefijo "-" = descendente) o relevance (con search)
+    - limit: tamaño de pagina; sin limit se devuelve el listado completo
+    - after: cursor opaco recibido en el header X-Next-Cursor
+
+    Los resultados se sirven desde la cache del catalogo (clave = filtros).
+    Responde 304 si If-None-Match coincide con la version del catalogo.
+    """
+    catalog = catalog_cache.sync(db)
+    etag = make_etag("catalog", catalog.version)
+    if is_not_modified(request, etag, catalog.last_modified):
+        return not_modified_response(etag, catalog.last_modified)
+
+    cache_key = (
+        category.value if category else None, search, min_price, max_price, sort, limit, after
+    )
+    products, next_cursor = catalog_cache.get_list(
+        cache_key,
+        lambda: _load_products(db, category, search, min_price, max_price, sort, limit, after)
+    )
+
+    set_next_cursor(response, request, next_cursor)
+    set_validators(response, etag, catalog.last_modified)
+    return json_response(products, response=response)
+
+def build_products_query(
+    db: Session,
+    category: Optional[ProductCategoryEnum] = None,
+    search: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: Optional[str] = None,
+    after: Optional[str] = None
+):
+    """
+    Construir la consulta filtrada y ordenada del catalogo
+
+    Devuelve (query, sort efectivo, columna de relevancia o None).
+    """
     query = db.query(Product).filter(Product.is_active == True)
+    rank = None
 
     if category: #Filtrar por categoria
         query = query.filter(Product.category == category.value)
 
-    if search: #Busqueda por nombre y descripcion
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Product.name.ilike(search_term)) |
-            (Product.description.ilike(search_term))
-        )
+    if search: #Busqueda full-text por nombre y descripcion
+        query, rank = apply_search(query, db, search)
     
     if min_price is not None: #Filtrar por precio
         query = query.filter(Product.price >= min_price)
@@ -39,7 +110,107 @@ def get_products(
     if max_price is not None: 
         query = query.filter(Product.price <= max_price)
 
-    return query.all()
+    # Orden: por defecto relevancia si hay busqueda, si no por id
+    if sort is None:
+        sort = "relevance" if rank is not None else "id"
+
+    descending = sort.startswith("-")
+    sort_name = sort.lstrip("-")
+
+    if sort_name == "relevance":
+        if rank is None:
+            raise HTTPException(
+                status_code=400,
+                detail="El orden por relevancia requiere un término de búsqueda"
+            )
+        sort_column = rank
+    else:
+        sort_column = SORT_FIELDS[sort_name]
+
+    if after: #Continuar despues de la ultima fila de la pagina anterior
+        value, last_id = _cursor_position(after, sort)
+        query = query.filter(
+            keyset_after(sort_column, Product.id, value, last_id, descending)
+        )
+
+    query = query.order_by(*keyset_order(sort_column, Product.id, descending))
+
+    return query, sort, rank
+
+def _is_cursor_value(value, types) -> bool:
+    # bool es subclase de int, pero no es un valor de orden valido
+    return isinstance(value, types) and not isinstance(value, bool)
+
+def _cursor_position(after: str, sort: str):
+    """
+    Decodificar el cursor y validar sus campos contra el orden activo
+
+    Devuelve (valor de orden, id); el valor es None cuando se ordena por id.
+    Un cursor de otro orden o con campos del tipo equivocado responde 400
+    en vez de llegar a la consulta.
+    """
+    cursor = decode_cursor(after)
+    if cursor.get("sort") != sort:
+        raise HTTPException(
+            status_code=400,
+            detail="El cursor no corresponde al orden solicitado"
+        )
+
+    sort_name = sort.lstrip("-")
+    last_id = cursor.get("id")
+    value = cursor.get("value")
+    if not _is_cursor_value(last_id, SORT_VALUE_TYPES["id"]) or (
+        sort_name != "id" and not _is_cursor_value(value, SORT_VALUE_TYPES[sort_name])
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="Cursor de paginación inválido"
+        )
+
+    if sort_name == "id":
+        return None, last_id
+    return (float(value) if sort_name in ("price", "relevance") else value), last_id
+
+def _load_products(
+    db: Session,
+    category: Optional[ProductCategoryEnum],
+    search: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    sort: Optional[str],
+    limit: Optional[int],
+    after: Optional[str]
+):
+    """Consultar una pagina del catalogo; devuelve (productos, cursor siguiente)"""
+    query, sort, rank = build_products_query(
+        db, category, search, min_price, max_price, sort, after
+    )
+    sort_name = sort.lstrip("-")
+
+    if limit is None:
+        return _to_response(query.all()), None
+
+    # Se pide una fila extra para saber si existe una pagina siguiente
+    if sort_name == "relevance":
+        rows = query.add_columns(rank).limit(limit + 1).all()
+        products = [product for product, _ in rows]
+        sort_values = [value for _, value in rows]
+    else:
+        products = query.limit(limit + 1).all()
+        sort_values = [getattr(product, sort_name) for product in products]
+
+    next_cursor = None
+    if len(products) > limit:
+        next_cursor = encode_cursor({
+            "sort": sort,
+            "value": sort_values[limit - 1],
+            "id": products[limit - 1].id
+        })
+
+    return _to_response(products[:limit]), next_cursor
+
+def _to_response(products: List[Product]) -> List[ProductResponse]:
+    return [ProductResponse.model_validate(product) for product in products]
 
 @router.post("/", response_model=ProductResponse)
 def create_product(
@@ -48,19 +219,183 @@ def create_product(
 ):
     db_product  = Product(**product.model_dump())
     db.add(db_product)
+    db.flush()
+    catalog_cache.mark_changed(db, [db_product.id])
     db.commit()
     db.refresh(db_product)
-    return db_product
+    return json_response(ProductResponse.model_validate(db_product))
+
+@router.get("/facets", response_model=ProductFacets)
+def get_product_facets(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    category: Optional[ProductCategoryEnum] = None,
+    search: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    bucket_size: float = Query(5000, gt=0)
+):
+    """
+    Conteos por categoria e histograma de precios para los filtros del catalogo
+
+    Acepta los mismos filtros que GET /products. Cada faceta ignora su propio
+    filtro para mostrar las alternativas disponibles:
+    - categories: cuenta con search + rango de precio (sin filtro de categoria)
+    - histogram: cuenta con search + categoria (sin filtro de precio)
+    - total, min_price, max_price: productos que cumplen todos los filtros
+    """
+    catalog = catalog_cache.sync(db)
+    etag = make_etag("facets", catalog.version)
+    if is_not_modified(request, etag, catalog.last_modified):
+        return not_modified_response(etag, catalog.last_modified)
+
+    cache_key = (
+        "facets", category.value if category else None, search, min_price, max_price, bucket_size
+    )
+    facets = catalog_cache.get_list(
+        cache_key,
+        lambda: _load_facets(db, category, search, min_price, max_price, bucket_size)
+    )
+
+    set_validators(response, etag, catalog.last_modified)
+    return json_response(facets, response=response)
+
+def _load_facets(
+    db: Session,
+    category: Optional[ProductCategoryEnum],
+    search: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    bucket_size: float
+) -> ProductFacets:
+    """Una sola consulta agregada por (categoria, bucket de precio)"""
+    query, _, _ = build_products_query(db, search=search)
+
+    price_conditions = []
+    if min_price is not None:
+        price_conditions.append(Product.price >= min_price)
+    if max_price is not None:
+        price_conditions.append(Product.price <= max_price)
+    in_price_range = and_(*price_conditions) if price_conditions else None
+
+    bucket = cast(Product.price / bucket_size, Integer)
+    if in_price_range is not None:
+        in_range_count = func.sum(case((in_price_range, 1), else_=0))
+        in_range_min = func.min(case((in_price_range, Product.price)))
+        in_range_max = func.max(case((in_price_range, Product.price)))
+    else:
+        in_range_count = func.count(Product.id)
+        in_range_min = func.min(Product.price)
+        in_range_max = func.max(Product.price)
+
+    rows = query.order_by(None).with_entities(
+        Product.category,
+        bucket.label("bucket"),
+        func.count(Product.id).label("count"),
+        in_range_count.label("in_range_count"),
+        in_range_min.label("in_range_min"),
+        in_range_max.label("in_range_max")
+    ).group_by(Product.category, bucket).all()
+
+    category_counts = {}
+    bucket_counts = {}
+    total = 0
+    prices = []
+
+    for row in rows:
+        row_category = row.category.value if row.category else None
+        category_counts[row_category] = category_counts.get(row_category, 0) + row.in_range_count
+
+        if category and row_category != category.value:
+            continue
+
+        bucket_counts[row.bucket] = bucket_counts.get(row.bucket, 0) + row.count
+        total += row.in_range_count
+        if row.in_range_min is not None:
+            prices.extend([row.in_range_min, row.in_range_max])
+
+    return ProductFacets(
+        total=total,
+        min_price=min(prices) if prices else None,
+        max_price=max(prices) if prices else None,
+        bucket_size=bucket_size,
+        categories=[
+            CategoryFacet(category=category_value, count=count)
+            for category_value, count in sorted(category_counts.items(), key=lambda item: -item[1])
+            if count > 0
+        ],
+        histogram=[
+            PriceBucket(
+                min_price=index * bucket_size,
+                max_price=(index + 1) * bucket_size,
+                count=bucket_counts[index]
+            )
+            for index in sorted(bucket_counts)
+        ]
+    )
+
+@router.get("/batch", response_model=ProductBatchResponse)
+def get_products_batch(
+    request: Request,
+    response: Response,
+    ids: str = Query(..., pattern=r"^\d+(,\d+)*$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Resolver varios productos en una sola consulta (ej. ?ids=3,1,2)
+
+    Mantiene el orden pedido, ignora ids repetidos y reporta los ids que no
+    existen en `missing`. Los productos ya cacheados no tocan la base de datos.
+    """
+    product_ids = list(dict.fromkeys(int(product_id) for product_id in ids.split(",")))
+
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {MAX_BATCH_IDS} productos por consulta"
+        )
+
+    catalog = catalog_cache.sync(db)
+    etag = make_etag("batch", catalog.version)
+    if is_not_modified(request, etag, catalog.last_modified):
+        return not_modified_response(etag, catalog.last_modified)
+
+    found = catalog_cache.get_products_many(product_ids, lambda missing: _load_products_by_id(db, missing))
+
+    set_validators(response, etag, catalog.last_modified)
+    return json_response(ProductBatchResponse(
+        items=[found[product_id] for product_id in product_ids if product_id in found],
+        missing=[product_id for product_id in product_ids if product_id not in found]
+    ), response=response)
+
+def _load_products_by_id(db: Session, product_ids: List[int]) -> dict:
+    products = db.query(Product).filter(Product.id.in_(product_ids)).all()
+    return {product.id: ProductResponse.model_validate(product) for product in products}
 
 @router.get("/{product_id}", response_model=ProductResponse)
 def get_product(
     product_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    catalog = catalog_cache.sync(db)
+    product = catalog_cache.get_product(product_id, lambda: _load_product(db, product_id))
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return product
+
+    # Despues del 404: If-None-Match: * solo coincide si el producto existe
+    etag = make_etag("product", product_id, catalog.version)
+    if is_not_modified(request, etag, catalog.last_modified):
+        return not_modified_response(etag, catalog.last_modified)
+
+    set_validators(response, etag, catalog.last_modified)
+    return json_response(product, response=response)
+
+def _load_product(db: Session, product_id: int) -> Optional[ProductResponse]:
+    product = db.query(Product).filter(Product.id == product_id).first()
+    return ProductResponse.model_validate(product) if product else None
 
 @router.put("/{product_id}", response_model=ProductResponse)
 def update_product(
@@ -77,9 +412,10 @@ def update_product(
     for field, value in update_data.items():
         setattr(product, field, value)
     
+    catalog_cache.mark_changed(db, [product.id])
     db.commit()
     db.refresh(product)
-    return product
+    return json_response(ProductResponse.model_validate(product))
 
 @router.delete("/{product_id}", status_code=204)
 def delete_product(
@@ -92,6 +428,7 @@ def delete_product(
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
     product.is_active = False
+    catalog_cache.mark_changed(db, [product.id])
     db.commit()
     return None
     
\ No newline at end of file
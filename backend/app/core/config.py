@@ -13,6 +13,55 @@ class Settings(BaseSettings):
     # Payment settings
     CURRENCY: str = "clp"  # Peso chileno
 
+    # Busqueda de productos: "auto" (segun dialecto), "fts5" o "like"
+    SEARCH_BACKEND: str = "auto"
+
+    # Cache en memoria del catalogo (entradas por tipo de consulta, TTL en segundos)
+    CATALOG_CACHE_SIZE: int = 512
+    CATALOG_CACHE_TTL: float = 300
+
+    # Almacenamiento del carrito: "sql" (tabla cart_items), "memory" (en proceso) o "redis"
+    CART_STORE: str = "sql"
+    CART_REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Limpieza de carritos abandonados: horas sin actividad antes de borrarlos,
+    # intervalo del job en segundos y filas borradas por lote/commit
+    CART_IDLE_TTL_HOURS: float = 72
+    CART_REAPER_ENABLED: bool = True
+    CART_REAPER_INTERVAL: float = 3600
+    CART_REAPER_BATCH_SIZE: int = 500
+    CART_REAPER_MAX_BATCHES: int = 100
+
+    # Reservas de stock al agregar al carrito (opcional): minutos que dura cada hold
+    STOCK_RESERVATIONS_ENABLED: bool = False
+    STOCK_RESERVATION_MINUTES: float = 15
+
+    # Cache en memoria del CartSummary por usuario (usuarios, TTL en segundos)
+    CART_CACHE_SIZE: int = 1024
+    CART_CACHE_TTL: float = 300
+
+    # Idempotency-Key en POST /orders/ y /payments/create-payment-intent: horas que
+    # se guarda cada respuesta, segundos que un duplicado espera a la solicitud en
+    # curso y segundos tras los que una solicitud en curso se da por abandonada
+    IDEMPOTENCY_TTL_HOURS: float = 24
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 30
+    IDEMPOTENCY_LOCK_TIMEOUT: float = 120
+    # Limpieza periodica de las claves vencidas (independiente del reaper de carritos)
+    IDEMPOTENCY_REAPER_ENABLED: bool = True
+    IDEMPOTENCY_REAPER_INTERVAL: float = 3600
+
+    # Cola de jobs post-checkout: hilos worker, procesos para ejecutar los
+    # handlers (0 = en los mismos hilos), intentos y backoff de reintentos (s)
+    JOB_QUEUE_ENABLED: bool = True
+    JOB_QUEUE_WORKERS: int = 2
+    JOB_QUEUE_PROCESSES: int = 0
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BACKOFF: float = 1
+    JOB_RETRY_BACKOFF_MAX: float = 300
+
+    # Importacion masiva de productos (filas por lote/commit)
+    IMPORT_CHUNK_SIZE: int = 1000
+
     class Config:
         env_file = ".env"
 
@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine #function is fundamental for establishing a connection to a database.
+from typing import Callable
+from sqlalchemy import create_engine, event, inspect, text #function is fundamental for establishing a connection to a database.
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base #function that returns a new base class
-from sqlalchemy.orm import sessionmaker #enerates new Session objects with a fixed configuration.
+from sqlalchemy.orm import Session, sessionmaker #enerates new Session objects with a fixed configuration.
 from .config import settings
 
 engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
@@ -12,4 +14,122 @@ def get_db():
     try:
         yield db
     finally: 
-        db.close()
\ No newline at end of file
+        db.close()
+
+# INSERT con ON CONFLICT (upsert) de cada dialecto soportado
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def check_upsert_support(bind=engine):
+    """
+    Validar al iniciar que la base soporta los upserts de la app
+
+    SQLite y PostgreSQL comparten la sintaxis ON CONFLICT (index_elements,
+    excluded, RETURNING); con otro dialecto la app no arranca.
+    """
+    dialect = bind.dialect.name
+    if dialect not in UPSERT_INSERTS:
+        raise RuntimeError(
+            f"DATABASE_URL usa el dialecto '{dialect}': se requiere SQLite o PostgreSQL"
+        )
+
+
+def upsert_insert(db: Session, table):
+    """INSERT del dialecto de la sesion, con on_conflict_do_update/do_nothing"""
+    return UPSERT_INSERTS[db.get_bind().dialect.name](table)
+
+AFTER_COMMIT_KEY = "after_commit_callbacks"
+
+
+def after_commit(db: Session, callback: Callable[[], None]):
+    """
+    Ejecutar callback() cuando la transaccion actual de `db` haga commit
+
+    Para efectos fuera de la base (caches en memoria, carrito en Redis, cola
+    de jobs) que solo deben ocurrir si las escrituras SQL se confirman; con
+    rollback el callback se descarta.
+    """
+    # Asegurar una transaccion abierta: su commit o rollback decide el callback
+    db.connection()
+    db.info.setdefault(AFTER_COMMIT_KEY, []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session):
+    for callback in session.info.pop(AFTER_COMMIT_KEY, []):
+        callback()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_commit(session: Session, previous_transaction):
+    session.info.pop(AFTER_COMMIT_KEY, None)
+
+def analyze_database(bind=engine, indexes_created: bool = False):
+    """
+    Actualizar las estadisticas del planner al iniciar
+
+    Sin estadisticas SQLite asume que `is_active = 1` es muy selectivo y
+    prefiere el indice (is_active, category, price) aun cuando los indices
+    parciales de productos activos evitan el ordenamiento temporal.
+
+    ANALYZE completo solo si se acaban de crear indices o la base nunca se
+    analizo; en los demas arranques (cada worker) basta PRAGMA optimize,
+    que no hace nada si las estadisticas siguen vigentes.
+    """
+    with bind.begin() as conn:
+        if bind.dialect.name != "sqlite":
+            if indexes_created:
+                conn.execute(text("ANALYZE"))
+            return
+
+        analyzed = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        ).first() is not None
+        conn.execute(text("PRAGMA optimize" if analyzed and not indexes_created else "ANALYZE"))
+
+
+def ensure_columns(table, bind=engine):
+    """
+    Agregar a una tabla existente las columnas nuevas del modelo
+
+    create_all no altera tablas ya creadas; las columnas NOT NULL nuevas
+    deben tener server_default para poder agregarse con ALTER TABLE. Si la
+    columna solo tiene default en Python (ej. updated_at=datetime.now) las
+    filas existentes toman ese valor al agregarla.
+    """
+    existing = {column["name"] for column in inspect(bind).get_columns(table.name)}
+    missing = [column for column in table.columns if column.name not in existing]
+    if not missing:
+        return
+
+    with bind.begin() as conn:
+        for column in missing:
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+            if column.server_default is not None:
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                ddl += f" DEFAULT {column.server_default.arg}"
+            conn.execute(text(ddl))
+
+            default = column.default
+            if column.server_default is None and default is not None and (default.is_scalar or default.is_callable):
+                value = default.arg(None) if default.is_callable else default.arg
+                conn.execute(table.update().where(column.is_(None)).values({column.name: value}))
+
+
+def ensure_indexes(table, bind=engine) -> list:
+    """
+    Crear en una tabla existente los indices nuevos del modelo (create_all no lo hace)
+
+    Devuelve los nombres de los indices creados.
+    """
+    existing = {index["name"] for index in inspect(bind).get_indexes(table.name)}
+    created = []
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(bind=bind)
+            created.append(index.name)
+    return created
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+def make_etag(*parts) -> str:
+    """ETag debil construido a partir de la version del recurso"""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def stable_last_modified(changed_at: Optional[datetime], now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Last-Modified (resolucion de segundos) para un cambio con hora exacta `changed_at` (UTC)
+
+    None mientras no termine el segundo del cambio: otra escritura en ese
+    mismo segundo tendria el mismo Last-Modified, y un If-Modified-Since
+    guardado antes de ella responderia 304 con datos viejos. Una vez que
+    el segundo paso, cualquier cambio posterior cae en un segundo mayor.
+    """
+    if changed_at is None:
+        return None
+    last_modified = changed_at.replace(microsecond=0)
+    if (now or datetime.now(timezone.utc)) < last_modified + timedelta(seconds=1):
+        return None
+    return last_modified
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluar If-None-Match / If-Modified-Since (RFC 9110)
+
+    If-None-Match tiene prioridad y se compara de forma debil; If-Modified-Since
+    solo se considera cuando el cliente no envio If-None-Match. `If-None-Match: *`
+    coincide con cualquier representacion existente: las rutas de un recurso
+    que puede no existir lo evaluan despues de su 404.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        current = _strip_weak(etag)
+        return any(_strip_weak(tag) == current for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Respuesta 304 sin cuerpo con los mismos validadores"""
+    response = Response(status_code=304)
+    set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,65 @@
+import base64
+import json
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+# Headers con los que se expone la siguiente pagina al cliente
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(data: dict) -> str:
+    """Serializar la posicion de la ultima fila en un cursor opaco"""
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decodificar un cursor generado por encode_cursor (400 si es invalido)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(data, dict):
+            raise ValueError
+        return data
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Cursor de paginación inválido"
+        )
+
+
+def keyset_after(column, tie_breaker, value, last_id, descending: bool = False):
+    """
+    Condicion keyset "despues de (value, last_id)"
+
+    Equivale a (column, tie_breaker) > (value, last_id) expandido con OR para
+    que el planner pueda usar el indice compuesto (column, tie_breaker).
+    El desempate sigue la misma direccion que el orden, asi el indice se
+    puede recorrer en reversa para los ordenes descendentes.
+    """
+    if descending:
+        if column is tie_breaker:
+            return tie_breaker < last_id
+        return or_(column < value, and_(column == value, tie_breaker < last_id))
+
+    if column is tie_breaker:
+        return tie_breaker > last_id
+    return or_(column > value, and_(column == value, tie_breaker > last_id))
+
+
+def keyset_order(column, tie_breaker, descending: bool = False) -> list:
+    """Clausulas ORDER BY que corresponden a keyset_after"""
+    if column is tie_breaker:
+        return [column.desc() if descending else column.asc()]
+    if descending:
+        return [column.desc(), tie_breaker.desc()]
+    return [column.asc(), tie_breaker.asc()]
+
+
+def set_next_cursor(response, request, next_cursor: str):
+    """Publicar el cursor de la siguiente pagina en headers X-Next-Cursor y Link"""
+    if not next_cursor:
+        return
+    response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    next_url = request.url.include_query_params(after=next_cursor)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
@@ -0,0 +1,48 @@
+from functools import lru_cache
+from typing import Any, List, Optional, Type
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+# Clase de respuesta por defecto de la app: orjson para todo lo que no pasa
+# por json_response (dicts, listas simples, errores)
+DefaultResponse = ORJSONResponse
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def dump_json(content: Any) -> bytes:
+    """Serializar modelos (o listas de modelos) directamente con pydantic-core"""
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode()
+    if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+        return _list_adapter(type(content[0])).dump_json(content)
+    return ORJSONResponse(content).body
+
+
+def json_response(
+    content: Any,
+    status_code: int = 200,
+    response: Optional[Response] = None
+) -> Response:
+    """
+    Respuesta JSON para rutas que ya construyeron su response_model
+
+    FastAPI vuelve a validar y a convertir a dict lo que devuelve una ruta
+    con response_model antes de serializarlo; devolver un Response evita ese
+    segundo paso. `response` es el Response inyectado en la ruta: sus headers
+    (ETag, cursores) se copian a la respuesta final.
+    """
+    result = Response(
+        content=dump_json(content),
+        status_code=status_code,
+        media_type="application/json"
+    )
+    if response is not None:
+        result.headers.raw.extend(
+            (key, value) for key, value in response.headers.raw if key != b"content-length"
+        )
+    return result
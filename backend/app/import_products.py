@@ -0,0 +1,50 @@
+"""
+Importar productos desde un archivo CSV o NDJSON
+
+Uso (desde backend/):
+    python -m app.import_products catalogo.csv
+    python -m app.import_products catalogo.ndjson --chunk-size 5000
+"""
+import argparse
+import sys
+
+from app.core.database import SessionLocal, engine, Base
+from app.services.product_import import ProductImporter, SUPPORTED_FORMATS, detect_format
+from app.services.search_service import ensure_search_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importación masiva de productos")
+    parser.add_argument("path", help="Archivo CSV o NDJSON")
+    parser.add_argument("--format", choices=SUPPORTED_FORMATS, default=None)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    file_format = detect_format(args.path, args.format)
+    if file_format is None:
+        parser.error("No se pudo deducir el formato; usa --format csv|ndjson")
+
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as stream:
+            report = ProductImporter(db, args.chunk_size).run(stream, file_format)
+    finally:
+        db.close()
+
+    print(f"📦 Filas leídas: {report.total_rows}")
+    print(f"✅ Insertados: {report.inserted}")
+    print(f"🔄 Actualizados: {report.updated}")
+    print(f"❌ Con errores: {report.failed}")
+    for error in report.errors:
+        print(f"   Fila {error.row}: {'; '.join(error.errors)}")
+    if not report.completed:
+        print(f"⚠️ Importación detenida; filas ya confirmadas: {report.committed}")
+
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
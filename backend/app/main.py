@@ -1,11 +1,49 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.database import Base, engine
+from app.core.config import settings
+from app.core.database import (
+    Base, engine, analyze_database, check_upsert_support, ensure_columns, ensure_indexes
+)
+from app.core.responses import DefaultResponse
 from app.api import products, auth, cart, order, payments, admin
+from app.models import CartItem, Order, Product
+from app.services.cart_reaper import cart_reaper
+from app.services.cart_service import merge_duplicate_cart_lines
+from app.services.idempotency import idempotency_reaper
+from app.services.job_queue import job_queue
+from app.services.search_service import ensure_search_index
 
+check_upsert_support(engine)
 Base.metadata.create_all(bind=engine)
+merge_duplicate_cart_lines(engine)
+indexes_created = []
+for model in (Product, CartItem, Order):
+    ensure_columns(model.__table__, engine)
+    indexes_created += ensure_indexes(model.__table__, engine)
+ensure_search_index(engine)
+analyze_database(engine, indexes_created=bool(indexes_created))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Jobs en segundo plano
+    if settings.CART_REAPER_ENABLED:
+        cart_reaper.start()
+    if settings.IDEMPOTENCY_REAPER_ENABLED:
+        idempotency_reaper.start()
+    if settings.JOB_QUEUE_ENABLED:
+        job_queue.start()
+    yield
+    job_queue.stop()
+    idempotency_reaper.stop()
+    cart_reaper.stop()
 
-app = FastAPI(title="Natural Triade API", description="API para tienda e-commerce Natural Triade")
+app = FastAPI(
+    title="Natural Triade API",
+    description="API para tienda e-commerce Natural Triade",
+    default_response_class=DefaultResponse,
+    lifespan=lifespan
+)
 
 # Configurar CORS
 app.add_middleware(
@@ -14,6 +52,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link", "ETag", "Last-Modified"],
 )
 
 app.include_router(products.router, prefix="/products", tags=["Products"])
@@ -2,6 +2,11 @@ from app.models.product import Product, ProductCategory
 from app.models.user import User
 from app.models.cart import CartItem
 from app.models.order import Order, OrderItem, OrderStatus
+from app.models.reservation import StockReservation
+from app.models.idempotency import IdempotencyKey
+from app.models.stock_movement import StockMovement, StockMovementReason
+from app.models.catalog_state import CatalogState
+from app.models.cart_state import CartState
 from sqlalchemy.orm import configure_mappers, relationship
 
 CartItem.user = relationship("User", back_populates="cart_items")
@@ -22,5 +27,11 @@ __all__ = [
     "CartItem", 
     "Order", 
     "OrderItem", 
-    "OrderStatus"
+    "OrderStatus",
+    "StockReservation",
+    "IdempotencyKey",
+    "StockMovement",
+    "StockMovementReason",
+    "CatalogState",
+    "CartState"
 ]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -6,12 +6,21 @@ from app.core.database import Base
 
 class CartItem(Base):
      __tablename__ = "cart_items"
+     __table_args__ = (
+          # Una fila por producto y usuario: add_to_cart hace upsert sobre este indice
+          Index("uq_cart_items_user_product", "user_id", "product_id", unique=True),
+          # Ultima actividad por carrito (MAX(updated_at) agrupado por usuario) para el reaper
+          Index("ix_cart_items_user_updated", "user_id", "updated_at"),
+     )
      id = Column(Integer, primary_key=True, index=True)
      user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
      product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
      quantity = Column(Integer, default=1, nullable=False)
      price_at_addition = Column(Float, nullable=False)
-     created_at = Column(DateTime, default=datetime.now())
+     # Product.version cuando se fijo price_at_addition; si difiere la linea esta desactualizada
+     product_version = Column(Integer, nullable=False, default=1, server_default="1")
+     created_at = Column(DateTime, default=datetime.now)
+     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
      @property
      def subtotal(self):
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, ForeignKey
+
+from app.core.database import Base
+
+class CartState(Base):
+     """
+     Version del carrito de cada usuario, compartida por todos los procesos
+
+     Cada escritura del carrito la incrementa en su misma transaccion
+     (cart_cache.mark_changed); el resumen en cache de un worker solo se usa
+     si fue leido con la version vigente.
+     """
+     __tablename__ = "cart_state"
+
+     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+     version = Column(Integer, nullable=False, default=0)
+
+     def __repr__(self):
+          return f"<CartState(user_id={self.user_id}, version={self.version})>"
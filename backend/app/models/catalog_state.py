@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, DateTime
+
+from app.core.database import Base
+
+# Fila unica de catalog_state
+CATALOG_STATE_ID = 1
+
+class CatalogState(Base):
+     """
+     Generacion del catalogo compartida por todos los procesos
+
+     Cada escritura de productos o stock la incrementa en su misma
+     transaccion (catalog_cache.mark_changed); cada worker la compara con la
+     ultima que vio para descartar su cache local.
+     """
+     __tablename__ = "catalog_state"
+
+     id = Column(Integer, primary_key=True)
+     generation = Column(Integer, nullable=False, default=0)
+     # UTC, con microsegundos
+     changed_at = Column(DateTime, nullable=True)
+
+     def __repr__(self):
+          return f"<CatalogState(generation={self.generation}, changed_at={self.changed_at})>"
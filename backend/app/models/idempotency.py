@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, ForeignKey, Index
+from datetime import datetime
+
+from app.core.database import Base
+
+class IdempotencyKey(Base):
+     __tablename__ = "idempotency_keys"
+     __table_args__ = (
+          # Una clave por usuario y endpoint; el INSERT ... ON CONFLICT la reclama
+          Index("uq_idempotency_keys_user_scope_key", "user_id", "scope", "key", unique=True),
+     )
+
+     id = Column(Integer, primary_key=True, index=True)
+     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+     scope = Column(String(100), nullable=False)
+     key = Column(String(255), nullable=False)
+     request_hash = Column(String(64), nullable=False)
+
+     # in_progress mientras la solicitud original se ejecuta, completed con la respuesta guardada
+     status = Column(String(20), nullable=False, default="in_progress")
+     response_status = Column(Integer, nullable=True)
+     response_body = Column(LargeBinary, nullable=True)
+
+     created_at = Column(DateTime, default=datetime.now)
+     expires_at = Column(DateTime, nullable=False, index=True)
+
+     def __repr__(self):
+          return f"<IdempotencyKey(user_id={self.user_id}, scope='{self.scope}', status='{self.status}')>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Enum, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, Enum, Text, Index, event, inspect, text
 import enum
 from app.core.database import Base
 from sqlalchemy.orm import relationship
@@ -20,5 +20,33 @@ class Product(Base):
     category = Column(Enum(ProductCategory), nullable=True, index=True)
     image_url = Column(String(500), nullable=True)
     image_urls = Column(Text, nullable=True)
+    # Se incrementa con cada cambio de precio o stock (ver _bump_version)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    cart_items = relationship("CartItem", back_populates="product")
\ No newline at end of file
+    cart_items = relationship("CartItem", back_populates="product")
+
+    # Indices para las combinaciones de filtros de GET /products:
+    # - (is_active, category, price): categoria + rango/orden por precio
+    # - parciales sobre productos activos: rango/orden por precio y orden por
+    #   nombre, con id como desempate de la paginacion keyset
+    __table_args__ = (
+        Index("ix_products_active_category_price", "is_active", "category", "price"),
+        Index(
+            "ix_products_active_price", "price", "id",
+            sqlite_where=text("is_active = 1"),
+            postgresql_where=text("is_active")
+        ),
+        Index(
+            "ix_products_active_name", "name", "id",
+            sqlite_where=text("is_active = 1"),
+            postgresql_where=text("is_active")
+        ),
+    )
+
+@event.listens_for(Product, "before_update")
+def _bump_version(mapper, connection, target):
+    """Incrementar la version del producto cuando cambia su precio o su stock"""
+    state = inspect(target)
+    if state.attrs.price.history.has_changes() or state.attrs.stock.history.has_changes():
+        # Expresion SQL: el incremento lo hace la base, sin perder updates concurrentes
+        target.version = Product.version + 1
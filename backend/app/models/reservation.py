@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from datetime import datetime
+
+from app.core.database import Base
+
+class StockReservation(Base):
+     __tablename__ = "stock_reservations"
+     __table_args__ = (
+          # Un hold por linea de carrito (usuario, producto)
+          Index("uq_stock_reservations_user_product", "user_id", "product_id", unique=True),
+          # SUM(quantity) de holds activos por producto sin tocar la fila del producto
+          Index("ix_stock_reservations_product_expires", "product_id", "expires_at", "quantity"),
+     )
+
+     id = Column(Integer, primary_key=True, index=True)
+     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+     quantity = Column(Integer, nullable=False)
+     expires_at = Column(DateTime, nullable=False, index=True)
+     created_at = Column(DateTime, default=datetime.now)
+
+     def __repr__(self):
+          return f"<StockReservation(user_id={self.user_id}, product_id={self.product_id}, qty={self.quantity})>"
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Enum, Index
+from datetime import datetime
+import enum
+
+from app.core.database import Base
+
+class StockMovementReason(str, enum.Enum):
+     SALE = "sale"                   # Checkout de una orden
+     CANCELLATION = "cancellation"   # Orden cancelada: stock devuelto
+
+class StockMovement(Base):
+     __tablename__ = "stock_movements"
+     __table_args__ = (
+          # Historial de movimientos por producto
+          Index("ix_stock_movements_product_created", "product_id", "created_at"),
+     )
+
+     id = Column(Integer, primary_key=True, index=True)
+     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+     order_id = Column(Integer, ForeignKey("orders.id", ondelete="SET NULL"), nullable=True, index=True)
+     # Positivo = entra stock, negativo = sale
+     quantity = Column(Integer, nullable=False)
+     reason = Column(Enum(StockMovementReason), nullable=False)
+     created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+     def __repr__(self):
+          return f"<StockMovement(product_id={self.product_id}, qty={self.quantity}, reason={self.reason})>"
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -39,6 +39,25 @@ class OrderStatusUpdate(BaseModel):
     """Update de estado de orden"""
     status: str  # 'paid', 'processing', 'shipped', 'delivered', 'cancelled'
 
+class BulkOrderStatusUpdate(BaseModel):
+    """Cambio de estado de varias órdenes en una transacción"""
+    order_ids: List[int] = Field(..., min_length=1, max_length=1000)
+    status: str
+
+class OrderStatusResult(BaseModel):
+    """Resultado por orden de un cambio de estado en lote"""
+    order_id: int
+    updated: bool
+    previous_status: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkOrderStatusReport(BaseModel):
+    """Reporte de un cambio de estado en lote"""
+    status: str
+    updated: int
+    failed: int
+    results: List[OrderStatusResult]
+
 class AllOrdersFilter(BaseModel):
     """Filtros para ver todas las órdenes"""
     status: Optional[str] = None
@@ -11,6 +11,13 @@ class CartItemCreate(CartItemBase):
 class CartItemUpdate(BaseModel):
     quantity: int = Field(..., gt=0)
 
+class CartItemSet(BaseModel):
+    product_id: int
+    quantity: int = Field(..., ge=0)  # 0 = quitar del carrito
+
+class CartBatchUpdate(BaseModel):
+    items: List[CartItemSet] = Field(..., min_length=1, max_length=100)
+
 class CartItemResponse(BaseModel):
     id: int
     product_id: int
@@ -24,9 +31,26 @@ class CartItemResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class StaleCartItem(BaseModel):
+    """Linea cuyo producto cambio de precio o stock desde que se agrego"""
+    id: int
+    product_id: int
+    price_at_addition: float
+    current_price: float
+    stock: int
+    product_version: int
+
 class CartSummary(BaseModel):
     items: List[CartItemResponse]
     subtotal: float
     tax: float
     total: float
-    items_count: int
\ No newline at end of file
+    items_count: int
+    stale_items: List[StaleCartItem] = []
+
+class CartTotals(BaseModel):
+    items_count: int
+    total_quantity: int
+    subtotal: float
+    tax: float
+    total: float
@@ -31,6 +31,46 @@ class ProductUpdate(BaseModel):
 class ProductResponse(ProductBase):
     id: int 
     is_active: bool
+    version: int = 1
 
     class Config: 
         from_attributes = True
+
+class ProductBatchResponse(BaseModel):
+    items: List[ProductResponse]
+    missing: List[int]
+
+class ProductImportRow(ProductCreate):
+    """Fila de importacion: con id actualiza el producto, sin id lo crea"""
+    id: Optional[int] = Field(None, gt=0)
+    is_active: bool = True
+
+class ProductImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ProductImportReport(BaseModel):
+    total_rows: int
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[ProductImportError]
+    committed: int = 0      # filas ya confirmadas en la base
+    completed: bool = True  # False si la importacion se detuvo antes del final del archivo
+
+class CategoryFacet(BaseModel):
+    category: Optional[ProductCategoryEnum]
+    count: int
+
+class PriceBucket(BaseModel):
+    min_price: float  # incluido
+    max_price: float  # excluido
+    count: int
+
+class ProductFacets(BaseModel):
+    total: int
+    min_price: Optional[float]
+    max_price: Optional[float]
+    bucket_size: float
+    categories: List[CategoryFacet]
+    histogram: List[PriceBucket]
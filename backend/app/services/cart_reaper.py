@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.cart import CartItem
+from app.services.cart_service import cart_cache
+from app.services.cart_store import purge_expired_carts
+from app.services.stock_reservations import sweep_expired
+
+logger = logging.getLogger(__name__)
+
+
+class CartReaper:
+    """
+    Job en segundo plano que borra carritos abandonados
+
+    Un carrito esta inactivo cuando la ultima actividad de todas sus lineas
+    (MAX(updated_at) por usuario) es anterior a CART_IDLE_TTL_HOURS. Se
+    borra por lotes de `batch_size` filas con un commit por lote, para no
+    retener el lock de escritura de SQLite; `max_batches` acota cada corrida.
+    Cada corrida tambien borra las reservas de stock vencidas.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        ttl_hours: float = settings.CART_IDLE_TTL_HOURS,
+        interval: float = settings.CART_REAPER_INTERVAL,
+        batch_size: int = settings.CART_REAPER_BATCH_SIZE,
+        max_batches: int = settings.CART_REAPER_MAX_BATCHES
+    ):
+        self.session_factory = session_factory
+        self.ttl_hours = ttl_hours
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.rows_purged = 0
+        self.carts_purged = 0
+        self.reservations_released = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_rows_purged = 0
+        self.last_duration_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def run_once(self, db: Optional[Session] = None, now: Optional[datetime] = None) -> dict:
+        """Una corrida completa; usa `db` si se entrega o abre una sesion propia"""
+        with self._lock:
+            started = time.perf_counter()
+            owns_session = db is None
+            db = db or self.session_factory()
+            try:
+                rows, user_ids, batches = self._purge(db, now or datetime.now())
+                reservations = sweep_expired(db, now)
+            finally:
+                if owns_session:
+                    db.close()
+            rows += purge_expired_carts()
+
+            self.runs += 1
+            self.rows_purged += rows
+            self.carts_purged += len(user_ids)
+            self.reservations_released += reservations
+            self.last_run_at = datetime.now()
+            self.last_rows_purged = rows
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            self.last_error = None
+
+            return {
+                "rows_purged": rows,
+                "carts_purged": len(user_ids),
+                "batches": batches,
+                "reservations_released": reservations
+            }
+
+    def _purge(self, db: Session, now: datetime):
+        cutoff = now - timedelta(hours=self.ttl_hours)
+        idle_users = select(CartItem.user_id).group_by(CartItem.user_id).having(
+            func.max(CartItem.updated_at) < cutoff
+        )
+
+        rows = 0
+        user_ids = set()
+        batches = 0
+        while batches < self.max_batches:
+            batch_ids = select(CartItem.id).where(
+                CartItem.user_id.in_(idle_users)
+            ).limit(self.batch_size)
+            deleted = db.execute(
+                delete(CartItem).where(CartItem.id.in_(batch_ids)).returning(CartItem.user_id)
+            ).scalars().all()
+            cart_cache.mark_changed(db, deleted)
+            db.commit()
+
+            if not deleted:
+                break
+            batches += 1
+            rows += len(deleted)
+            user_ids.update(deleted)
+            if len(deleted) < self.batch_size:
+                break
+
+        return rows, user_ids, batches
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = self.run_once()
+                if result["rows_purged"]:
+                    logger.info("Carritos abandonados eliminados: %s", result)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Error limpiando carritos abandonados")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="cart-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "ttl_hours": self.ttl_hours,
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "rows_purged": self.rows_purged,
+            "carts_purged": self.carts_purged,
+            "reservations_released": self.reservations_released,
+            "last_run_at": self.last_run_at,
+            "last_rows_purged": self.last_rows_purged,
+            "last_duration_ms": self.last_duration_ms,
+            "last_error": self.last_error
+        }
+
+
+cart_reaper = CartReaper()
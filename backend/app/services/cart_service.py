@@ -0,0 +1,132 @@
+import threading
+from typing import Callable, Iterable, Optional
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import after_commit, upsert_insert
+from app.models.cart import CartItem
+from app.models.cart_state import CartState
+from app.services.catalog_cache import LRUCache, MISSING, catalog_cache
+
+CART_UNIQUE_INDEX = "uq_cart_items_user_product"
+
+
+class CartSummaryCache:
+    """
+    Cache del CartSummary por usuario
+
+    Cada entrada guarda el resumen junto a los ids de todos los productos
+    del carrito (incluidos los inactivos, que no aparecen en el resumen pero
+    lo cambian al reactivarse) y la version con que se leyo: la del carrito
+    (tabla cart_state) y la del catalogo (catalog_state). Las escrituras del
+    carrito llaman a mark_changed() antes de su commit; una entrada leida
+    con otra version se descarta, asi los cambios hechos en otro worker se
+    ven en la lectura siguiente. En el mismo proceso las escrituras de
+    productos llegan ademas via catalog_cache y descartan solo los carritos
+    que contienen esos productos.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.summaries = LRUCache(maxsize, ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_summary(self, db: Session, user_id: int, loader: Callable):
+        """loader() debe devolver (summary, product_ids)"""
+        # Versiones vigentes antes de leer: el resumen nunca es mas viejo que ellas
+        cart_version = db.execute(
+            select(CartState.version).where(CartState.user_id == user_id)
+        ).scalar() or 0
+        stamp = (cart_version, catalog_cache.sync(db).version)
+
+        entry = self.summaries.get(user_id)
+        if entry is not MISSING and entry[2] == stamp:
+            return entry[0]
+
+        generation = self._generation
+        summary, product_ids = loader()
+
+        # No guardar un resumen leido antes de una invalidacion concurrente
+        with self._lock:
+            if generation == self._generation:
+                self.summaries.set(user_id, (summary, frozenset(product_ids), stamp))
+        return summary
+
+    def mark_changed(self, db: Session, user_ids: Iterable[int]):
+        """
+        Incrementar la version del carrito de cada usuario en la transaccion de `db`
+
+        Al hacer commit tambien se descartan sus resumenes en este proceso.
+        """
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        statement = upsert_insert(db, CartState).values([
+            {"user_id": user_id, "version": 1} for user_id in user_ids
+        ])
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[CartState.user_id],
+            set_={"version": CartState.version + 1}
+        ))
+
+        def invalidate():
+            for user_id in user_ids:
+                self.invalidate_user(user_id)
+
+        after_commit(db, invalidate)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._generation += 1
+            self.summaries.pop(user_id)
+
+    def invalidate_products(self, product_ids: Optional[Iterable[int]] = None):
+        with self._lock:
+            self._generation += 1
+            if product_ids is None:
+                self.summaries.clear()
+                return
+            changed = set(product_ids)
+            self.summaries.pop_where(lambda entry: not changed.isdisjoint(entry[1]))
+
+    def clear(self):
+        self.invalidate_products()
+
+    def stats(self) -> dict:
+        return self.summaries.stats()
+
+
+cart_cache = CartSummaryCache(
+    maxsize=settings.CART_CACHE_SIZE,
+    ttl=settings.CART_CACHE_TTL
+)
+catalog_cache.add_listener(cart_cache.invalidate_products)
+
+
+def merge_duplicate_cart_lines(engine):
+    """
+    Fusionar las lineas repetidas (user_id, product_id) de bases antiguas
+
+    Las columnas e indices nuevos de cart_items los agregan ensure_columns
+    y ensure_indexes; el indice unico (user_id, product_id) no se puede
+    crear mientras existan duplicados, asi que este paso corre antes y los
+    fusiona sumando sus cantidades.
+    """
+    indexes = {index["name"] for index in inspect(engine).get_indexes(CartItem.__tablename__)}
+    if CART_UNIQUE_INDEX in indexes:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE cart_items SET quantity = (
+                SELECT SUM(duplicate.quantity) FROM cart_items AS duplicate
+                WHERE duplicate.user_id = cart_items.user_id
+                AND duplicate.product_id = cart_items.product_id
+            )
+            WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id HAVING COUNT(*) > 1)
+        """))
+        conn.execute(text("""
+            DELETE FROM cart_items
+            WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id)
+        """))
@@ -0,0 +1,479 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from fastapi import Depends
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import after_commit, get_db, upsert_insert
+from app.models.cart import CartItem
+from app.models.product import Product
+
+
+@dataclass
+class CartLine:
+    """Linea del carrito, independiente del backend que la almacena"""
+    id: int
+    product_id: int
+    quantity: int
+    price_at_addition: float
+    product_version: int = 1  # Product.version al agregar (o al ultimo refresh)
+
+    @property
+    def subtotal(self):
+        return self.price_at_addition * self.quantity
+
+
+class CartStore(ABC):
+    """
+    Interfaz de almacenamiento del carrito
+
+    Las escrituras del backend SQL participan de la transaccion de la sesion
+    (la ruta hace db.commit()); las del backend clave-valor se aplican de
+    inmediato, salvo clear_on_commit(). Los carritos pasan a SQL solo como
+    OrderItems en create_order.
+    """
+
+    @abstractmethod
+    def get_lines(self, user_id: int) -> List[CartLine]:
+        """Lineas del carrito ordenadas por id"""
+
+    def get_line(self, user_id: int, item_id: int) -> Optional[CartLine]:
+        return next((line for line in self.get_lines(user_id) if line.id == item_id), None)
+
+    @abstractmethod
+    def add(self, user_id: int, product: Product, quantity: int, max_quantity: int) -> Optional[CartLine]:
+        """Sumar unidades a la linea del producto; None si el total supera max_quantity"""
+
+    @abstractmethod
+    def set_quantities(self, user_id: int, quantities: Dict[int, int], products: Dict[int, Product]):
+        """Fijar cantidades por producto (0 = quitar); `products` da precio y version de lineas nuevas"""
+
+    @abstractmethod
+    def refresh(self, user_id: int, products: Dict[int, Product]):
+        """Actualizar precio y version de las lineas de esos productos a los actuales"""
+
+    @abstractmethod
+    def remove(self, user_id: int, product_id: int):
+        """Quitar la linea del producto"""
+
+    @abstractmethod
+    def clear(self, user_id: int):
+        """Vaciar el carrito"""
+
+    @abstractmethod
+    def clear_on_commit(self, user_id: int):
+        """Vaciar el carrito solo si la transaccion de la sesion hace commit"""
+
+    @abstractmethod
+    def totals(self, user_id: int) -> Tuple[int, int, float]:
+        """(lineas, unidades, subtotal) contando solo productos activos"""
+
+
+class SQLCartStore(CartStore):
+    """Carrito en la tabla cart_items"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _lines_query(self, user_id: int):
+        return self.db.query(
+            CartItem.id, CartItem.product_id, CartItem.quantity, CartItem.price_at_addition,
+            CartItem.product_version
+        ).filter(CartItem.user_id == user_id)
+
+    def get_lines(self, user_id: int) -> List[CartLine]:
+        return [CartLine(*row) for row in self._lines_query(user_id).order_by(CartItem.id)]
+
+    def get_line(self, user_id: int, item_id: int) -> Optional[CartLine]:
+        row = self._lines_query(user_id).filter(CartItem.id == item_id).first()
+        return CartLine(*row) if row else None
+
+    def add(self, user_id: int, product: Product, quantity: int, max_quantity: int) -> Optional[CartLine]:
+        # INSERT ... ON CONFLICT (user_id, product_id) DO UPDATE: una sola
+        # sentencia, con el control de stock en el WHERE del DO UPDATE
+        statement = upsert_insert(self.db, CartItem).values(
+            user_id=user_id,
+            product_id=product.id,
+            quantity=quantity,
+            price_at_addition=product.price,
+            product_version=product.version
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={
+                "quantity": CartItem.quantity + statement.excluded.quantity,
+                "updated_at": statement.excluded.updated_at
+            },
+            where=CartItem.quantity + statement.excluded.quantity <= max_quantity
+        ).returning(CartItem.id, CartItem.quantity, CartItem.price_at_addition, CartItem.product_version)
+
+        row = self.db.execute(statement).first()
+        return CartLine(row.id, product.id, row.quantity, row.price_at_addition, row.product_version) if row else None
+
+    def set_quantities(self, user_id: int, quantities: Dict[int, int], products: Dict[int, Product]):
+        existing_items = {
+            item.product_id: item
+            for item in self.db.query(CartItem).filter(
+                CartItem.user_id == user_id,
+                CartItem.product_id.in_(quantities.keys())
+            )
+        }
+
+        for product_id, quantity in quantities.items():
+            cart_item = existing_items.get(product_id)
+            if quantity == 0:
+                if cart_item:
+                    self.db.delete(cart_item)
+            elif cart_item:
+                cart_item.quantity = quantity
+            else:
+                self.db.add(CartItem(
+                    user_id=user_id,
+                    product_id=product_id,
+                    quantity=quantity,
+                    price_at_addition=products[product_id].price,
+                    product_version=products[product_id].version
+                ))
+
+    def refresh(self, user_id: int, products: Dict[int, Product]):
+        for product in products.values():
+            self.db.query(CartItem).filter(
+                CartItem.user_id == user_id,
+                CartItem.product_id == product.id
+            ).update(
+                {CartItem.price_at_addition: product.price, CartItem.product_version: product.version},
+                synchronize_session=False
+            )
+
+    def remove(self, user_id: int, product_id: int):
+        self.db.query(CartItem).filter(
+            CartItem.user_id == user_id,
+            CartItem.product_id == product_id
+        ).delete()
+
+    def clear(self, user_id: int):
+        self.db.query(CartItem).filter(CartItem.user_id == user_id).delete()
+
+    def clear_on_commit(self, user_id: int):
+        # El DELETE ya es parte de la transaccion
+        self.clear(user_id)
+
+    def totals(self, user_id: int) -> Tuple[int, int, float]:
+        return self.db.query(
+            func.count(CartItem.id),
+            func.coalesce(func.sum(CartItem.quantity), 0),
+            func.coalesce(func.sum(CartItem.price_at_addition * CartItem.quantity), 0)
+        ).join(Product, Product.id == CartItem.product_id).filter(
+            CartItem.user_id == user_id,
+            Product.is_active == True
+        ).one()
+
+
+class InMemoryKeyValue:
+    """
+    Subconjunto en proceso de los comandos de Redis que usa KeyValueCartStore
+
+    Mismas firmas que redis-py con decode_responses=True, para poder
+    intercambiarlo por un cliente Redis real. Las claves con EXPIRE vencidas
+    se descartan al accederlas o con purge_expired(). pipeline() aplica sus
+    comandos bajo el mismo lock, como MULTI/EXEC.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _get(self, key: str, default=None):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key, default)
+
+    def _bucket(self, key: str) -> dict:
+        bucket = self._get(key)
+        if bucket is None:
+            bucket = self._data[key] = {}
+        return bucket
+
+    def hgetall(self, key: str) -> dict:
+        with self._lock:
+            return dict(self._get(key, {}))
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        with self._lock:
+            return self._get(key, {}).get(field)
+
+    def hset(self, key: str, field: str, value) -> int:
+        with self._lock:
+            bucket = self._bucket(key)
+            created = field not in bucket
+            bucket[field] = str(value)
+            return int(created)
+
+    def hsetnx(self, key: str, field: str, value) -> int:
+        with self._lock:
+            bucket = self._bucket(key)
+            if field in bucket:
+                return 0
+            bucket[field] = str(value)
+            return 1
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        with self._lock:
+            bucket = self._bucket(key)
+            value = int(bucket.get(field, 0)) + amount
+            bucket[field] = str(value)
+            return value
+
+    def hincrby_capped(self, key: str, field: str, amount: int, cap: int) -> int:
+        """Equivalente en proceso del script HINCRBY_CAPPED"""
+        with self._lock:
+            bucket = self._bucket(key)
+            value = int(bucket.get(field, 0)) + amount
+            if value > cap:
+                return -1
+            bucket[field] = str(value)
+            return value
+
+    def hdel(self, key: str, *fields: str) -> int:
+        with self._lock:
+            bucket = self._get(key, {})
+            removed = sum(1 for field in fields if bucket.pop(field, None) is not None)
+            if not bucket:
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return removed
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            removed = 0
+            for key in keys:
+                self._expires.pop(key, None)
+                removed += self._data.pop(key, None) is not None
+            return removed
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = int(self._get(key, 0)) + amount
+            self._data[key] = value
+            return value
+
+    def expire(self, key: str, seconds: int) -> bool:
+        with self._lock:
+            if self._get(key) is None:
+                return False
+            self._expires[key] = time.monotonic() + seconds
+            return True
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryPipeline":
+        return InMemoryPipeline(self)
+
+    def purge_expired(self) -> int:
+        """Descartar todas las claves vencidas; devuelve cuantas se eliminaron"""
+        with self._lock:
+            now = time.monotonic()
+            expired = [key for key, expires_at in self._expires.items() if expires_at <= now]
+            for key in expired:
+                self._data.pop(key, None)
+                del self._expires[key]
+            return len(expired)
+
+
+class InMemoryPipeline:
+    """Comandos encolados que execute() aplica juntos, sin intercalar otros"""
+
+    def __init__(self, client: InMemoryKeyValue):
+        self.client = client
+        self._commands = []
+
+    def __getattr__(self, name: str):
+        command = getattr(self.client, name)
+
+        def queue(*args):
+            self._commands.append((command, args))
+            return self
+        return queue
+
+    def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        with self.client._lock:
+            return [command(*args) for command, args in commands]
+
+
+# HINCRBY solo si el resultado no supera el tope (ARGV[3]); si lo supera
+# devuelve -1 sin escribir. Lua se ejecuta atomicamente en Redis.
+HINCRBY_CAPPED = """
+local value = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0') + tonumber(ARGV[2])
+if value > tonumber(ARGV[3]) then
+    return -1
+end
+return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+"""
+
+
+class KeyValueCartStore(CartStore):
+    """
+    Carrito en un almacen clave-valor (en proceso o Redis)
+
+    Un hash por usuario, `cart:{user_id}`, con dos campos por producto:
+    `q:{product_id}` (cantidad, sumada con HINCRBY_CAPPED para que dos add
+    concurrentes no se pisen ni superen el stock) y `m:{product_id}` (id de
+    linea y precio al agregar, escrito una sola vez con HSETNX). Los ids de
+    linea salen del contador `cart:ids`. Cada escritura renueva el EXPIRE
+    del hash, asi los carritos inactivos vencen solos despues de
+    CART_IDLE_TTL_HOURS.
+    """
+
+    IDS_KEY = "cart:ids"
+
+    def __init__(self, db: Session, client):
+        self.db = db
+        self.client = client
+        if isinstance(client, InMemoryKeyValue):
+            self._hincrby_capped = client.hincrby_capped
+        else:
+            script = client.register_script(HINCRBY_CAPPED)
+            self._hincrby_capped = lambda key, field, amount, cap: script(keys=[key], args=[field, amount, cap])
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"cart:{user_id}"
+
+    def get_lines(self, user_id: int) -> List[CartLine]:
+        data = self.client.hgetall(self._key(user_id))
+        lines = []
+        for field, value in data.items():
+            if not field.startswith("m:"):
+                continue
+            product_id = int(field[2:])
+            quantity = int(data.get(f"q:{product_id}", 0))
+            if quantity > 0:
+                meta = json.loads(value)
+                lines.append(CartLine(meta["id"], product_id, quantity, meta["price"], meta.get("version", 1)))
+        return sorted(lines, key=lambda line: line.id)
+
+    def _touch(self, key: str):
+        self.client.expire(key, int(settings.CART_IDLE_TTL_HOURS * 3600))
+
+    def _new_meta(self, product: Product) -> str:
+        return json.dumps({
+            "id": self.client.incr(self.IDS_KEY),
+            "price": product.price,
+            "version": product.version
+        })
+
+    def _meta(self, key: str, product: Product) -> dict:
+        field = f"m:{product.id}"
+        meta = self.client.hget(key, field)
+        if meta is None:
+            self.client.hsetnx(key, field, self._new_meta(product))
+            meta = self.client.hget(key, field)
+        return json.loads(meta)
+
+    def add(self, user_id: int, product: Product, quantity: int, max_quantity: int) -> Optional[CartLine]:
+        key = self._key(user_id)
+
+        # Comparar con el tope y sumar en un solo paso atomico
+        new_quantity = self._hincrby_capped(key, f"q:{product.id}", quantity, max_quantity)
+        if new_quantity < 0:
+            return None
+
+        meta = self._meta(key, product)
+        self._touch(key)
+        return CartLine(meta["id"], product.id, new_quantity, meta["price"], meta["version"])
+
+    def set_quantities(self, user_id: int, quantities: Dict[int, int], products: Dict[int, Product]):
+        # La ruta ya valido el stock de todas las lineas; aqui todo se
+        # escribe en una transaccion MULTI/EXEC, o se aplica todo o nada
+        key = self._key(user_id)
+        existing = self.client.hgetall(key)
+        new_meta = {
+            product_id: self._new_meta(products[product_id])
+            for product_id, quantity in quantities.items()
+            if quantity > 0 and f"m:{product_id}" not in existing
+        }
+
+        pipe = self.client.pipeline(transaction=True)
+        for product_id, quantity in quantities.items():
+            if quantity == 0:
+                pipe.hdel(key, f"q:{product_id}", f"m:{product_id}")
+                continue
+            if product_id in new_meta:
+                pipe.hsetnx(key, f"m:{product_id}", new_meta[product_id])
+            pipe.hset(key, f"q:{product_id}", quantity)
+        pipe.expire(key, int(settings.CART_IDLE_TTL_HOURS * 3600))
+        pipe.execute()
+
+    def refresh(self, user_id: int, products: Dict[int, Product]):
+        key = self._key(user_id)
+        for product in products.values():
+            meta = self.client.hget(key, f"m:{product.id}")
+            if meta is None:
+                continue
+            meta = dict(json.loads(meta), price=product.price, version=product.version)
+            self.client.hset(key, f"m:{product.id}", json.dumps(meta))
+        self._touch(key)
+
+    def remove(self, user_id: int, product_id: int):
+        self.client.hdel(self._key(user_id), f"q:{product_id}", f"m:{product_id}")
+
+    def clear(self, user_id: int):
+        self.client.delete(self._key(user_id))
+
+    def clear_on_commit(self, user_id: int):
+        # El hash no es parte de la transaccion SQL: si el commit falla el
+        # carrito debe seguir ahi
+        after_commit(self.db, lambda: self.clear(user_id))
+
+    def totals(self, user_id: int) -> Tuple[int, int, float]:
+        lines = self.get_lines(user_id)
+        if not lines:
+            return 0, 0, 0
+        active_ids = {
+            product_id for (product_id,) in self.db.query(Product.id).filter(
+                Product.id.in_([line.product_id for line in lines]),
+                Product.is_active == True
+            )
+        }
+        active = [line for line in lines if line.product_id in active_ids]
+        return len(active), sum(line.quantity for line in active), sum(line.subtotal for line in active)
+
+
+_kv_client = None
+_kv_lock = threading.Lock()
+
+
+def _get_kv_client():
+    global _kv_client
+    with _kv_lock:
+        if _kv_client is None:
+            if settings.CART_STORE == "redis":
+                try:
+                    import redis
+                except ImportError as e:
+                    raise RuntimeError("CART_STORE=redis requiere el paquete 'redis'") from e
+                _kv_client = redis.Redis.from_url(settings.CART_REDIS_URL, decode_responses=True)
+            else:
+                _kv_client = InMemoryKeyValue()
+        return _kv_client
+
+
+def purge_expired_carts() -> int:
+    """Carritos clave-valor vencidos en el backend en proceso (Redis los expira solo)"""
+    if isinstance(_kv_client, InMemoryKeyValue):
+        return _kv_client.purge_expired()
+    return 0
+
+
+def get_cart_store(db: Session = Depends(get_db)) -> CartStore:
+    """Dependencia de FastAPI: backend de carrito segun settings.CART_STORE"""
+    if settings.CART_STORE == "sql":
+        return SQLCartStore(db)
+    return KeyValueCartStore(db, _get_kv_client())
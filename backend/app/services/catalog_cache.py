@@ -0,0 +1,270 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Hashable, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import after_commit
+from app.core.http_cache import stable_last_modified
+from app.models.catalog_state import CATALOG_STATE_ID, CatalogState
+
+# Centinela de LRUCache.get para una clave ausente o expirada (None es un valor valido)
+MISSING = object()
+
+
+class LRUCache:
+    """Cache en memoria acotada con expulsion LRU y expiracion por TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        """Valor guardado, o MISSING si la clave no esta o ya expiro"""
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                self.misses += 1
+                return MISSING
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable) -> int:
+        """Descartar las entradas cuyo valor cumple predicate(value)"""
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+class CatalogVersion(NamedTuple):
+    """Validadores HTTP del catalogo leidos de catalog_state"""
+    version: str
+    last_modified: Optional[datetime]
+
+
+class CatalogCache:
+    """
+    Cache read-through del catalogo de productos
+
+    - lists: resultados de GET /products (clave = tupla de filtros)
+    - products: detalle de GET /products/{id}
+
+    La cache vive en cada proceso; la generacion del catalogo en la base
+    (tabla catalog_state) la coordina entre workers. Las escrituras de
+    productos o stock llaman a mark_changed() antes del commit: incrementa
+    la generacion en la misma transaccion y, tras el commit, descarta el
+    detalle de los productos afectados y todos los listados de este proceso
+    (un cambio de precio o stock puede mover un producto entre filtros).
+    Las lecturas llaman a sync(), que compara la generacion de la base con
+    la ultima vista y vacia la cache local si otro proceso escribio.
+
+    La generacion y la hora exacta del ultimo cambio son tambien los
+    validadores HTTP (ETag, Last-Modified): salen de la base, asi todos los
+    workers y reinicios responden lo mismo para el mismo catalogo. Un
+    contador local evita guardar resultados leidos antes de una invalidacion
+    concurrente.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.lists = LRUCache(maxsize, ttl)
+        self.products = LRUCache(maxsize, ttl)
+        self._generation = 0
+        self._db_generation = None
+        self._changed_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable] = []
+
+    @property
+    def version(self) -> str:
+        """Version del catalogo (ultima generacion vista); cambia con cada escritura"""
+        return str(self._db_generation or 0)
+
+    def sync(self, db: Session) -> CatalogVersion:
+        """
+        Leer la generacion de la base y vaciar la cache local si cambio
+
+        Un SELECT por clave primaria sobre catalog_state; si otro proceso
+        escribio desde la ultima lectura se descartan listados y detalles.
+        Devuelve los validadores HTTP de esa generacion.
+        """
+        row = db.execute(
+            select(CatalogState.generation, CatalogState.changed_at)
+            .where(CatalogState.id == CATALOG_STATE_ID)
+        ).first()
+        generation, changed_at = row if row else (0, None)
+        if changed_at is not None:
+            changed_at = changed_at.replace(tzinfo=timezone.utc)
+
+        with self._lock:
+            changed = generation != self._db_generation
+            self._db_generation = generation
+            self._changed_at = changed_at
+        if changed:
+            self.invalidate()
+
+        return CatalogVersion(str(generation), stable_last_modified(changed_at))
+
+    def mark_changed(self, db: Session, product_ids: Optional[Iterable[int]] = None):
+        """
+        Registrar una escritura de productos o stock en la transaccion de `db`
+
+        Incrementa la generacion compartida junto a las escrituras; la cache
+        local se invalida solo si la transaccion hace commit.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        generation = db.execute(
+            update(CatalogState)
+            .where(CatalogState.id == CATALOG_STATE_ID)
+            .values(generation=CatalogState.generation + 1, changed_at=now)
+            .returning(CatalogState.generation)
+        ).scalar()
+        if generation is None:
+            generation = 1
+            db.execute(insert(CatalogState).values(
+                id=CATALOG_STATE_ID, generation=generation, changed_at=now
+            ))
+
+        product_ids = None if product_ids is None else list(product_ids)
+
+        def invalidate():
+            with self._lock:
+                # Con escrituras de otros procesos entre medio, sync() vaciara todo
+                if self._db_generation == generation - 1:
+                    self._db_generation = generation
+            self.invalidate(product_ids)
+
+        after_commit(db, invalidate)
+
+    def get_list(self, key: Hashable, loader: Callable):
+        return self._read_through(self.lists, key, loader)
+
+    def get_product(self, product_id: int, loader: Callable):
+        return self._read_through(self.products, product_id, loader)
+
+    def get_products_many(self, product_ids: List[int], loader: Callable) -> dict:
+        """
+        Resolver varios productos; los que no estan en cache se cargan juntos
+
+        loader(ids_faltantes) debe devolver {id: producto} con los encontrados.
+        """
+        found = {}
+        missing = []
+        for product_id in product_ids:
+            value = self.products.get(product_id)
+            if value is MISSING:
+                missing.append(product_id)
+            else:
+                found[product_id] = value
+
+        if missing:
+            generation = self._generation
+            loaded = loader(missing)
+            with self._lock:
+                if generation == self._generation:
+                    for product_id, value in loaded.items():
+                        self.products.set(product_id, value)
+            found.update(loaded)
+
+        return found
+
+    def _read_through(self, cache: LRUCache, key: Hashable, loader: Callable):
+        value = cache.get(key)
+        if value is not MISSING:
+            return value
+
+        generation = self._generation
+        value = loader()
+
+        # No cachear ausencias (404) ni datos leidos antes de una invalidacion
+        with self._lock:
+            if value is not None and generation == self._generation:
+                cache.set(key, value)
+        return value
+
+    def invalidate(self, product_ids: Optional[Iterable[int]] = None):
+        """Descartar entradas de este proceso (todas si product_ids es None)"""
+        with self._lock:
+            self._generation += 1
+            self.lists.clear()
+            if product_ids is None:
+                self.products.clear()
+            else:
+                product_ids = list(product_ids)
+                for product_id in product_ids:
+                    self.products.pop(product_id)
+
+        for listener in self._listeners:
+            listener(product_ids)
+
+    def add_listener(self, listener: Callable):
+        """Registrar otra cache que depende de productos: listener(product_ids | None)"""
+        self._listeners.append(listener)
+
+    def clear(self):
+        with self._lock:
+            self._db_generation = None
+        self.invalidate()
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "generation": self._db_generation,
+            "last_modified": self._changed_at,
+            "lists": self.lists.stats(),
+            "products": self.products.stats()
+        }
+
+
+catalog_cache = CatalogCache(
+    maxsize=settings.CATALOG_CACHE_SIZE,
+    ttl=settings.CATALOG_CACHE_TTL
+)
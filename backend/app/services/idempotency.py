@@ -0,0 +1,295 @@
+"""
+Idempotency-Key para los POST con efectos (checkout, Payment Intent)
+
+La primera solicitud con una clave la reclama con un INSERT ... ON CONFLICT
+DO NOTHING sobre (user_id, scope, key), ejecuta el endpoint y guarda el
+status y el cuerpo de la respuesta. El endpoint llama a record_response()
+antes de su db.commit(), asi la respuesta guardada y sus escrituras se
+confirman en la misma transaccion. Los reintentos con la misma clave
+devuelven esa respuesta sin volver a ejecutar nada; un duplicado que llega
+mientras la original sigue en curso la espera (Event en el mismo proceso,
+sondeo de la tabla entre procesos) en vez de ejecutarse dos veces.
+
+Solo se guardan respuestas exitosas: si el endpoint lanza un error la clave
+se libera y el cliente puede reintentar. Las claves vencen a las
+IDEMPOTENCY_TTL_HOURS y idempotency_reaper las borra con purge_expired()
+cada IDEMPOTENCY_REAPER_INTERVAL segundos.
+"""
+
+import functools
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal, upsert_insert
+from app.core.responses import json_response
+from app.models.idempotency import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+REPLAY_HEADER = "Idempotent-Replayed"
+POLL_INTERVAL = 0.05
+
+# Clave en db.info con la reclamacion en curso de esta sesion
+CLAIM_INFO_KEY = "idempotency_claim"
+
+# Solicitudes en curso en este proceso: (user_id, scope, key) -> Event
+_inflight: Dict[Tuple[int, str, str], threading.Event] = {}
+_inflight_lock = threading.Lock()
+
+
+def _fingerprint(kwargs: dict) -> str:
+    """Hash del cuerpo de la solicitud: la misma clave no puede usarse con otro cuerpo"""
+    body = {
+        name: value.model_dump(mode="json")
+        for name, value in kwargs.items()
+        if isinstance(value, BaseModel)
+    }
+    return hashlib.sha256(orjson.dumps(body, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _claim(db: Session, user_id: int, scope: str, key: str, request_hash: str) -> bool:
+    """Reclamar la clave; False si otra solicitud ya la tiene"""
+    now = datetime.now()
+    # Una clave vencida se puede reutilizar aunque el reaper aun no la borre
+    db.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.scope == scope,
+        IdempotencyKey.key == key,
+        IdempotencyKey.expires_at <= now
+    ))
+    statement = upsert_insert(db, IdempotencyKey).values(
+        user_id=user_id,
+        scope=scope,
+        key=key,
+        request_hash=request_hash,
+        status=IN_PROGRESS,
+        created_at=now,
+        expires_at=now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+    ).on_conflict_do_nothing(
+        index_elements=[IdempotencyKey.user_id, IdempotencyKey.scope, IdempotencyKey.key]
+    ).returning(IdempotencyKey.id)
+    claimed = db.execute(statement).first() is not None
+    db.commit()
+    return claimed
+
+
+def _replay(record: IdempotencyKey) -> Response:
+    return Response(
+        content=record.response_body,
+        status_code=record.response_status,
+        media_type="application/json",
+        headers={REPLAY_HEADER: "true"}
+    )
+
+
+def _acquire(db: Session, user_id: int, scope: str, key: str, request_hash: str) -> Optional[Response]:
+    """
+    Reclamar la clave o resolver el duplicado
+
+    Devuelve None si esta solicitud debe ejecutarse, o la respuesta guardada
+    si la clave ya se completo. Espera mientras otra solicitud la tenga en
+    curso, hasta IDEMPOTENCY_WAIT_TIMEOUT.
+    """
+    token = (user_id, scope, key)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+
+    while True:
+        if _claim(db, user_id, scope, key, request_hash):
+            return None
+
+        record = db.execute(select(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key
+        )).scalar_one_or_none()
+        if record is None:
+            # La original fallo y libero la clave entre medio: reintentar el claim
+            continue
+
+        if record.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail="La Idempotency-Key ya se usó con una solicitud distinta"
+            )
+        if record.status == COMPLETED:
+            return _replay(record)
+
+        if record.created_at < datetime.now() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            # El proceso que la reclamo murio sin completarla
+            _release(db, user_id, scope, key)
+            continue
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Hay una solicitud con la misma Idempotency-Key en curso"
+            )
+
+        event = _inflight.get(token)
+        if event is not None:
+            event.wait(remaining)
+        else:
+            time.sleep(min(POLL_INTERVAL, remaining))
+        db.expire_all()
+
+
+def _release(db: Session, user_id: int, scope: str, key: str):
+    """Liberar una clave en curso para que un reintento vuelva a ejecutarse"""
+    db.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.scope == scope,
+        IdempotencyKey.key == key,
+        IdempotencyKey.status == IN_PROGRESS
+    ))
+    db.commit()
+
+
+def _store_response(db: Session, user_id: int, scope: str, key: str, response: Response):
+    db.execute(
+        update(IdempotencyKey)
+        .where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key
+        )
+        .values(status=COMPLETED, response_status=response.status_code, response_body=response.body)
+    )
+
+
+def record_response(db: Session, response: Response) -> Response:
+    """
+    Guardar la respuesta de la clave reclamada dentro de la transaccion de `db`
+
+    El endpoint la llama justo antes de su db.commit(): si el commit falla la
+    clave no queda completada con una respuesta que nunca se confirmo. Sin
+    Idempotency-Key no hace nada. Devuelve la misma respuesta.
+    """
+    claim = db.info.get(CLAIM_INFO_KEY)
+    if claim is not None:
+        _store_response(db, *claim["token"], response)
+        claim["recorded"] = True
+    return response
+
+
+def idempotent(scope: str, status_code: int = status.HTTP_200_OK) -> Callable:
+    """
+    Decorador para rutas con header Idempotency-Key
+
+    La ruta debe declarar `idempotency_key` (Header), `db` y `current_user`,
+    y pasar su respuesta por record_response() antes de hacer commit. Sin
+    header la ruta se ejecuta como siempre. Si la ruta responde sin llamar a
+    record_response() (ej. sin escrituras) la respuesta se guarda al final
+    en su propia transaccion; `status_code` se usa cuando la ruta devuelve
+    un modelo en vez de un Response.
+    """
+    def decorator(endpoint: Callable) -> Callable:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            key = kwargs.get("idempotency_key")
+            if not key:
+                return endpoint(*args, **kwargs)
+
+            db: Session = kwargs["db"]
+            user_id = kwargs["current_user"].id
+            token = (user_id, scope, key)
+
+            replay = _acquire(db, user_id, scope, key, _fingerprint(kwargs))
+            if replay is not None:
+                return replay
+
+            event = threading.Event()
+            with _inflight_lock:
+                _inflight[token] = event
+            claim = db.info[CLAIM_INFO_KEY] = {"token": token, "recorded": False}
+            try:
+                try:
+                    result = endpoint(*args, **kwargs)
+                except BaseException:
+                    db.rollback()
+                    _release(db, user_id, scope, key)
+                    raise
+
+                response = result if isinstance(result, Response) else json_response(result, status_code=status_code)
+                if not claim["recorded"]:
+                    _store_response(db, user_id, scope, key, response)
+                    db.commit()
+                return response
+            finally:
+                db.info.pop(CLAIM_INFO_KEY, None)
+                with _inflight_lock:
+                    _inflight.pop(token, None)
+                event.set()
+
+        return wrapper
+    return decorator
+
+
+def purge_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """Borrar las claves vencidas; devuelve cuantas se borraron"""
+    result = db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at <= (now or datetime.now()))
+    )
+    db.commit()
+    return result.rowcount
+
+
+class IdempotencyKeyReaper:
+    """
+    Job en segundo plano que borra las Idempotency-Key vencidas
+
+    Corre aparte del reaper de carritos (IDEMPOTENCY_REAPER_ENABLED): la
+    tabla se sigue limpiando aunque CART_REAPER_ENABLED este apagado.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = settings.IDEMPOTENCY_REAPER_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        db = self.session_factory()
+        try:
+            return purge_expired(db, now)
+        finally:
+            db.close()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                purged = self.run_once()
+                if purged:
+                    logger.info("Idempotency-Key vencidas eliminadas: %s", purged)
+            except Exception:
+                logger.exception("Error limpiando Idempotency-Key vencidas")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="idempotency-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+idempotency_reaper = IdempotencyKeyReaper()
@@ -0,0 +1,78 @@
+"""
+Movimientos de inventario de las ordenes
+
+Devolver stock al cancelar es un unico UPDATE products SET stock = stock +
+CASE id WHEN ... END sobre todos los productos de las lineas: sin un SELECT
+por item y sin leer-sumar-escribir en Python, que perdia unidades cuando dos
+cancelaciones tocaban el mismo producto. Cada linea queda registrada en
+stock_movements (ventas en negativo, devoluciones en positivo).
+
+Las escrituras quedan en la transaccion de la sesion; la ruta hace commit e
+invalida la cache del catalogo.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import case, insert, update
+from sqlalchemy.orm import Session
+
+from app.models.product import Product
+from app.models.stock_movement import StockMovement, StockMovementReason
+
+
+def record_movements(
+    db: Session,
+    lines: Iterable[Any],
+    reason: StockMovementReason,
+    sign: int
+):
+    """Registrar un movimiento por linea (objetos con order_id, product_id y quantity)"""
+    now = datetime.now()
+    rows = [
+        {
+            "product_id": line.product_id,
+            "order_id": line.order_id,
+            "quantity": sign * line.quantity,
+            "reason": reason,
+            "created_at": now
+        }
+        for line in lines
+    ]
+    if rows:
+        db.execute(insert(StockMovement), rows)
+
+
+def restore_stock(
+    db: Session,
+    lines: Iterable[Any],
+    reason: StockMovementReason = StockMovementReason.CANCELLATION
+) -> Dict[int, int]:
+    """
+    Devolver al stock las cantidades de las lineas de una o varias ordenes
+
+    `lines` son OrderItem (o filas con order_id, product_id y quantity).
+    Devuelve {product_id: unidades devueltas} de los productos que aun
+    existen; las lineas de productos borrados se omiten.
+    """
+    lines = list(lines)
+    quantities: Dict[int, int] = defaultdict(int)
+    for line in lines:
+        quantities[line.product_id] += line.quantity
+    if not quantities:
+        return {}
+
+    restored: List[int] = db.execute(
+        update(Product.__table__)
+        .where(Product.id.in_(quantities.keys()))
+        .values(
+            stock=Product.stock + case(quantities, value=Product.id, else_=0),
+            version=Product.version + 1
+        )
+        .returning(Product.id)
+    ).scalars().all()
+
+    restored_ids = set(restored)
+    record_movements(db, [line for line in lines if line.product_id in restored_ids], reason, 1)
+    return {product_id: quantities[product_id] for product_id in restored_ids}
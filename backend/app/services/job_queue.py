@@ -0,0 +1,287 @@
+"""
+Cola de jobs en proceso para efectos secundarios fuera del request
+
+Las rutas encolan trabajo que el cliente no necesita esperar (pre-crear el
+Payment Intent, avisos de confirmacion) con enqueue_after_commit(): el job
+se encola solo si la transaccion de la sesion hace commit, y se descarta si
+hace rollback. enqueue() nunca ejecuta el handler en el hilo que encola:
+los jobs esperan en la cola hasta que start() levante los workers, y se
+descartan (con un aviso en el log) si la cola esta deshabilitada o detenida.
+
+Los workers son hilos del mismo proceso; con JOB_QUEUE_PROCESSES > 0 cada
+handler se ejecuta en un pool de procesos (los handlers son funciones de
+modulo y sus argumentos valores simples, asi se pueden serializar). Cada
+proceso del pool abre su propio engine con la URL de la base de
+`session_factory`, no la de settings.
+
+Un job que falla se reintenta hasta JOB_MAX_ATTEMPTS veces con backoff
+exponencial (JOB_RETRY_BACKOFF * 2^(intento-1), tope JOB_RETRY_BACKOFF_MAX);
+despues queda en la lista de jobs muertos de stats(). La cola vive en
+memoria: los jobs pendientes se pierden si el proceso se detiene.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.core.database import SessionLocal, after_commit
+
+logger = logging.getLogger(__name__)
+
+# Nombre del job -> handler(**kwargs)
+_handlers: Dict[str, Callable] = {}
+
+
+def job(name: str) -> Callable:
+    """Registrar un handler de jobs bajo `name`"""
+    def decorator(handler: Callable) -> Callable:
+        _handlers[name] = handler
+        return handler
+    return decorator
+
+
+@dataclass(order=True)
+class Job:
+    run_at: float
+    seq: int
+    name: str = field(compare=False)
+    kwargs: dict = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+    last_error: Optional[str] = field(default=None, compare=False)
+
+
+class JobQueue:
+    """Cola con prioridad por hora de ejecucion; los reintentos se reprograman en ella"""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        enabled: bool = settings.JOB_QUEUE_ENABLED,
+        workers: int = settings.JOB_QUEUE_WORKERS,
+        processes: int = settings.JOB_QUEUE_PROCESSES,
+        max_attempts: int = settings.JOB_MAX_ATTEMPTS,
+        backoff: float = settings.JOB_RETRY_BACKOFF,
+        backoff_max: float = settings.JOB_RETRY_BACKOFF_MAX
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.workers = workers
+        self.processes = processes
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        self._heap: List[Job] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._stopping = False
+        self._in_flight = 0
+
+        self.enqueued = Counter()
+        self.succeeded = Counter()
+        self.failed_attempts = Counter()
+        self.retried = Counter()
+        self.dropped = Counter()
+        self.dead: deque = deque(maxlen=100)
+        self.max_depth = 0
+        self.last_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    @contextmanager
+    def session(self):
+        """Sesion de base de datos para un handler"""
+        db: Session = self.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def enqueue(self, name: str, **kwargs):
+        """
+        Encolar un job para los workers
+
+        Si aun no corren, el job espera a start(). Con la cola deshabilitada
+        o detenida se descarta y queda en `dropped`. Lanza KeyError si `name`
+        no tiene handler registrado.
+        """
+        if name not in _handlers:
+            raise KeyError(f"Job sin handler: {name}")
+
+        now = time.monotonic()
+        item = Job(run_at=now, seq=next(self._seq), name=name, kwargs=kwargs, enqueued_at=now)
+
+        with self._cond:
+            if not self.enabled or self._stopping:
+                self.dropped[name] += 1
+                logger.warning("Cola de jobs %s: job %s descartado", "detenida" if self.enabled else "deshabilitada", name)
+                return
+            self.enqueued[name] += 1
+            heapq.heappush(self._heap, item)
+            self.max_depth = max(self.max_depth, len(self._heap))
+            self._cond.notify()
+
+    def _next_job(self) -> Optional[Job]:
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                now = time.monotonic()
+                if self._heap and self._heap[0].run_at <= now:
+                    self._in_flight += 1
+                    return heapq.heappop(self._heap)
+                timeout = self._heap[0].run_at - now if self._heap else None
+                self._cond.wait(timeout)
+
+    def _worker(self):
+        while True:
+            item = self._next_job()
+            if item is None:
+                return
+            try:
+                self._execute(item)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _execute(self, item: Job):
+        wait_ms = (time.monotonic() - item.run_at) * 1000
+        self.last_wait_ms = round(wait_ms, 2)
+        self.max_wait_ms = round(max(self.max_wait_ms, wait_ms), 2)
+
+        handler = _handlers[item.name]
+        try:
+            if self._pool is not None:
+                self._pool.submit(handler, **item.kwargs).result()
+            else:
+                handler(**item.kwargs)
+        except Exception as e:
+            item.attempts += 1
+            item.last_error = str(e)
+            self.failed_attempts[item.name] += 1
+
+            if item.attempts >= self.max_attempts:
+                self.dead.append({
+                    "name": item.name,
+                    "kwargs": item.kwargs,
+                    "attempts": item.attempts,
+                    "error": item.last_error
+                })
+                logger.exception("Job %s descartado tras %s intentos", item.name, item.attempts)
+                return
+
+            delay = min(self.backoff * 2 ** (item.attempts - 1), self.backoff_max)
+            logger.warning("Job %s fallo (intento %s), reintento en %.1fs: %s", item.name, item.attempts, delay, e)
+            self.retried[item.name] += 1
+            item.run_at = time.monotonic() + delay
+            with self._cond:
+                heapq.heappush(self._heap, item)
+                self._cond.notify()
+        else:
+            self.succeeded[item.name] += 1
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        if self.processes > 0:
+            database_url = self.session_factory.kw["bind"].url.render_as_string(hide_password=False)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                initializer=_init_worker_process,
+                initargs=(database_url,)
+            )
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5):
+        with self._cond:
+            self._stopping = True
+            dropped, self._heap = len(self._heap), []
+            self._cond.notify_all()
+        if dropped:
+            logger.warning("Cola de jobs detenida con %s jobs pendientes", dropped)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Esperar a que no queden jobs listos ni en ejecucion (los reintentos programados no cuentan)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight or (self._heap and self._heap[0].run_at <= time.monotonic()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.1)
+        return True
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            ready = [item for item in self._heap if item.run_at <= now]
+            depth = len(self._heap)
+            in_flight = self._in_flight
+            oldest = max((now - item.enqueued_at for item in ready), default=0.0)
+
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "processes": self.processes,
+            "depth": depth,
+            "ready": len(ready),
+            "scheduled_retries": depth - len(ready),
+            "in_flight": in_flight,
+            "max_depth": self.max_depth,
+            "oldest_ready_seconds": round(oldest, 3),
+            "last_wait_ms": self.last_wait_ms,
+            "max_wait_ms": self.max_wait_ms,
+            "enqueued": dict(self.enqueued),
+            "succeeded": dict(self.succeeded),
+            "failed_attempts": dict(self.failed_attempts),
+            "retried": dict(self.retried),
+            "dropped": dict(self.dropped),
+            "dead": list(self.dead)
+        }
+
+
+job_queue = JobQueue()
+
+
+def _init_worker_process(database_url: str):
+    """Inicializador del pool: sesiones de los handlers contra la base del padre"""
+    connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+    engine = create_engine(database_url, connect_args=connect_args)
+    job_queue.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def enqueue_after_commit(db: Session, name: str, **kwargs):
+    """Encolar el job cuando la transaccion actual de `db` haga commit"""
+    if name not in _handlers:
+        raise KeyError(f"Job sin handler: {name}")
+    after_commit(db, lambda: job_queue.enqueue(name, **kwargs))
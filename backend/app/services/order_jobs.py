@@ -0,0 +1,54 @@
+"""
+Jobs que siguen a un checkout
+
+Se encolan con enqueue_after_commit() desde create_order y corren en los
+workers de job_queue, fuera del request.
+"""
+
+import logging
+
+from sqlalchemy import update
+
+from app.models.order import Order, OrderStatus
+from app.services.job_queue import job, job_queue
+from app.services.stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
+
+
+@job("orders.create_payment_intent")
+def create_payment_intent(order_id: int):
+    """
+    Pre-crear el Payment Intent de una orden que se pagara con Stripe
+
+    Cuando el cliente llama a /payments/create-payment-intent el intent ya
+    existe y se reutiliza. Si el endpoint crea a la vez que el job, ambos
+    usan la misma idempotency key de Stripe y reciben el mismo intent.
+    """
+    with job_queue.session() as db:
+        order = db.query(Order).filter(Order.id == order_id).first()
+        if not order or order.status != OrderStatus.PENDING or order.payment_id:
+            return
+
+        payment_intent = StripeService.create_payment_intent(order)
+        db.execute(
+            update(Order.__table__)
+            .where(Order.id == order_id, Order.payment_id.is_(None))
+            .values(payment_id=payment_intent.id, payment_method="stripe")
+        )
+        db.commit()
+
+
+@job("orders.send_confirmation")
+def send_confirmation(order_id: int):
+    """
+    Aviso de confirmacion de la orden al email de contacto
+
+    Aun no hay proveedor de correo configurado: el aviso queda en el log.
+    """
+    with job_queue.session() as db:
+        order = db.query(Order.id, Order.contact_email, Order.total).filter(Order.id == order_id).first()
+        if not order:
+            return
+
+        logger.info("Confirmación de orden #%s enviada a %s (total %s)", order.id, order.contact_email, order.total)
@@ -0,0 +1,91 @@
+"""
+Serializacion de ordenes para las respuestas JSON
+
+Las ordenes que devuelve la API vienen de nuestra propia base (objetos ORM o
+filas de un RETURNING), con los tipos que ya declara OrderResponse: floats,
+OrderStatus, datetimes naive. En vez de construir un OrderResponse y un
+OrderItemResponse por item (validacion campo a campo) se leen los atributos
+de una vez y se escribe el JSON con orjson, que produce los mismos bytes que
+model_dump_json para estos tipos.
+
+En un objeto ORM ya cargado los valores estan en su __dict__; leerlos de ahi
+evita el descriptor instrumentado de cada atributo. Si falta alguno
+(atributos expirados tras un commit) se cae a attrgetter, que los recarga.
+
+Los campos float son la excepcion: SQLite devuelve un REAL entero como int
+en las filas de un RETURNING (2000 en vez de 2000.0), asi que se pasan por
+float() para que POST y GET escriban los mismos bytes.
+
+Los campos salen de los schemas: agregar uno a OrderResponse lo agrega aqui.
+Ver benchmarks/bench_order_serializer.py.
+"""
+
+from operator import attrgetter, itemgetter
+from typing import Any, Iterable, Optional
+
+import orjson
+from fastapi import Response
+
+from app.schemas.order import OrderItemResponse, OrderResponse
+
+ORDER_FIELDS = tuple(name for name in OrderResponse.model_fields if name != "items")
+ITEM_FIELDS = tuple(OrderItemResponse.model_fields)
+
+_order_attrs = attrgetter(*ORDER_FIELDS)
+_order_state = itemgetter(*ORDER_FIELDS)
+_item_attrs = attrgetter(*ITEM_FIELDS)
+_item_state = itemgetter(*ITEM_FIELDS)
+
+ORDER_FLOAT_FIELDS = tuple(name for name in ORDER_FIELDS if OrderResponse.model_fields[name].annotation is float)
+ITEM_FLOAT_FIELDS = tuple(name for name in ITEM_FIELDS if OrderItemResponse.model_fields[name].annotation is float)
+
+
+def _values(obj: Any, state_getter: itemgetter, attr_getter: attrgetter) -> tuple:
+    state = getattr(obj, "__dict__", None)
+    if state is not None:
+        try:
+            return state_getter(state)
+        except KeyError:
+            pass
+    return attr_getter(obj)
+
+
+def order_to_dict(order: Any, items: Optional[Iterable[Any]] = None) -> dict:
+    """
+    Dict con la forma de OrderResponse
+
+    `order` es cualquier objeto con los atributos de OrderResponse (Order o
+    una fila); `items` reemplaza a order.items cuando los items vienen aparte.
+    """
+    data = dict(zip(ORDER_FIELDS, _values(order, _order_state, _order_attrs)))
+    for name in ORDER_FLOAT_FIELDS:
+        data[name] = float(data[name])
+
+    data["items"] = []
+    for item in (order.items if items is None else items):
+        item_data = dict(zip(ITEM_FIELDS, _values(item, _item_state, _item_attrs)))
+        for name in ITEM_FLOAT_FIELDS:
+            item_data[name] = float(item_data[name])
+        data["items"].append(item_data)
+    return data
+
+
+def order_response(
+    order: Any,
+    items: Optional[Iterable[Any]] = None,
+    status_code: int = 200
+) -> Response:
+    """Respuesta JSON de una orden"""
+    return Response(
+        content=orjson.dumps(order_to_dict(order, items)),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
+
+def orders_response(orders: Iterable[Any]) -> Response:
+    """Respuesta JSON de una lista de ordenes (items cargados con joinedload)"""
+    return Response(
+        content=orjson.dumps([order_to_dict(order) for order in orders]),
+        media_type="application/json"
+    )
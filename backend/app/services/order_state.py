@@ -0,0 +1,175 @@
+"""
+Maquina de estados de las ordenes
+
+Tabla unica de transiciones permitidas, con sus efectos: el timestamp que
+se fija al entrar a cada estado y la devolucion de stock al cancelar una
+orden cuyos productos aun no salieron de bodega. La usan la cancelacion del
+cliente, el cambio de estado del admin (uno o en lote) y el webhook de Stripe.
+
+transition_orders() mueve cualquier cantidad de ordenes con UPDATEs por
+conjunto: UPDATE orders ... WHERE id IN (...) AND status IN (origenes
+permitidos) RETURNING id. La condicion sobre el estado actual va en la
+misma sentencia, asi dos cancelaciones concurrentes no devuelven el stock
+dos veces. Las escrituras quedan en la transaccion de la sesion.
+
+Cambio respecto de la validacion anterior del admin (que solo bloqueaba
+salir de 'cancelled' y de 'delivered' salvo para cancelar): ahora tambien
+se rechazan con 400 los retrocesos (ej. 'shipped' -> 'paid') y fijar el
+mismo estado que ya tiene la orden. 'delivered' -> 'cancelled' se sigue
+permitiendo, sin devolver stock porque los productos ya salieron.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.order import Order, OrderItem, OrderStatus
+from app.services.inventory import restore_stock
+
+# Estado actual -> estados a los que se puede pasar. El admin puede saltarse
+# pasos hacia adelante, nunca volver atras ni repetir el estado actual; una
+# orden cancelada es final.
+TRANSITIONS: Dict[OrderStatus, FrozenSet[OrderStatus]] = {
+    OrderStatus.PENDING: frozenset({
+        OrderStatus.PAID, OrderStatus.PROCESSING, OrderStatus.SHIPPED,
+        OrderStatus.DELIVERED, OrderStatus.CANCELLED
+    }),
+    OrderStatus.PAID: frozenset({
+        OrderStatus.PROCESSING, OrderStatus.SHIPPED, OrderStatus.DELIVERED, OrderStatus.CANCELLED
+    }),
+    OrderStatus.PROCESSING: frozenset({
+        OrderStatus.SHIPPED, OrderStatus.DELIVERED, OrderStatus.CANCELLED
+    }),
+    OrderStatus.SHIPPED: frozenset({OrderStatus.DELIVERED, OrderStatus.CANCELLED}),
+    OrderStatus.DELIVERED: frozenset({OrderStatus.CANCELLED}),
+    OrderStatus.CANCELLED: frozenset(),
+}
+
+# Timestamp que se fija (si esta vacio) al entrar a cada estado
+TIMESTAMPS: Dict[OrderStatus, str] = {
+    OrderStatus.PAID: "paid_at",
+    OrderStatus.SHIPPED: "shipped_at",
+    OrderStatus.DELIVERED: "delivered_at",
+    OrderStatus.CANCELLED: "cancelled_at",
+}
+
+# Al cancelar desde estos estados el stock vuelve al catalogo
+RESTOCK_ON_CANCEL: FrozenSet[OrderStatus] = frozenset({
+    OrderStatus.PENDING, OrderStatus.PAID, OrderStatus.PROCESSING
+})
+
+# Estados desde los que el cliente puede cancelar su propia orden
+CUSTOMER_CANCELLABLE: FrozenSet[OrderStatus] = frozenset({OrderStatus.PENDING, OrderStatus.PAID})
+
+
+@dataclass
+class TransitionResult:
+    """Resultado de transition_orders"""
+    status: OrderStatus
+    moved: List[int] = field(default_factory=list)                # ids actualizados
+    errors: Dict[int, str] = field(default_factory=dict)          # id -> motivo
+    previous: Dict[int, OrderStatus] = field(default_factory=dict)  # id -> estado anterior
+    restored: Dict[int, int] = field(default_factory=dict)        # product_id -> unidades
+
+
+def sources_for(new_status: OrderStatus) -> FrozenSet[OrderStatus]:
+    """Estados desde los que se puede llegar a `new_status`"""
+    return frozenset(current for current, targets in TRANSITIONS.items() if new_status in targets)
+
+
+def transition_error(
+    current: OrderStatus,
+    new_status: OrderStatus,
+    sources: Optional[FrozenSet[OrderStatus]] = None
+) -> Optional[str]:
+    """Motivo por el que no se permite current -> new_status (None si se permite)"""
+    if current in (sources_for(new_status) if sources is None else sources):
+        return None
+    if current == OrderStatus.CANCELLED:
+        return "No se puede cambiar el estado de una orden cancelada"
+    if current == OrderStatus.DELIVERED:
+        return "No se puede cambiar el estado de una orden entregada"
+    return f"No se puede pasar una orden de '{current.value}' a '{new_status.value}'"
+
+
+def transition_orders(
+    db: Session,
+    order_ids: Iterable[int],
+    new_status: OrderStatus,
+    allowed_from: Optional[Iterable[OrderStatus]] = None,
+    now: Optional[datetime] = None
+) -> TransitionResult:
+    """
+    Pasar las ordenes a `new_status` aplicando la tabla de transiciones
+
+    `allowed_from` restringe ademas los estados de origen (ej. la
+    cancelacion del cliente). Las ordenes que no se pueden mover quedan en
+    `errors` con su motivo; las demas se actualizan con un UPDATE por grupo
+    de origen y, si se cancelan antes de salir de bodega, su stock vuelve
+    con un solo UPDATE para todas sus lineas.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    result = TransitionResult(status=new_status)
+    if not order_ids:
+        return result
+
+    sources = sources_for(new_status)
+    if allowed_from is not None:
+        sources &= frozenset(allowed_from)
+
+    result.previous = dict(db.execute(
+        select(Order.id, Order.status).where(Order.id.in_(order_ids))
+    ).all())
+
+    candidates = []
+    for order_id in order_ids:
+        current = result.previous.get(order_id)
+        if current is None:
+            result.errors[order_id] = "Orden no encontrada"
+        elif current not in sources:
+            result.errors[order_id] = transition_error(current, new_status, sources)
+        else:
+            candidates.append(order_id)
+
+    if not candidates:
+        return result
+
+    now = now or datetime.now()
+    values = {"status": new_status, "updated_at": now}
+    timestamp = TIMESTAMPS.get(new_status)
+    if timestamp:
+        column = getattr(Order, timestamp)
+        values[timestamp] = func.coalesce(column, now)
+
+    groups = [(sources, False)]
+    if new_status == OrderStatus.CANCELLED:
+        groups = [(sources & RESTOCK_ON_CANCEL, True), (sources - RESTOCK_ON_CANCEL, False)]
+
+    for group_sources, restock in groups:
+        if not group_sources:
+            continue
+        moved: List[int] = db.execute(
+            update(Order.__table__)
+            .where(Order.id.in_(candidates), Order.status.in_(group_sources))
+            .values(**values)
+            .returning(Order.id)
+        ).scalars().all()
+        result.moved.extend(moved)
+
+        if restock and moved:
+            lines = db.execute(
+                select(OrderItem.order_id, OrderItem.product_id, OrderItem.quantity)
+                .where(OrderItem.order_id.in_(moved))
+            ).all()
+            result.restored = restore_stock(db, lines)
+
+    moved_ids = set(result.moved)
+    for order_id in candidates:
+        if order_id not in moved_ids:
+            # Otra transaccion la cambio entre la lectura y el UPDATE
+            result.errors[order_id] = "La orden cambió de estado durante la actualización"
+
+    return result
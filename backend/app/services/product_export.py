@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from typing import Iterator
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.product import Product
+
+# Filas por lote leidas del cursor y escritas al cliente
+EXPORT_BATCH_SIZE = 1000
+
+# Mismas columnas que acepta la importacion (ProductImportRow)
+EXPORT_COLUMNS = [
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    Product.stock,
+    Product.is_active,
+    Product.category,
+    Product.image_url,
+    Product.image_urls,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _iter_batches(db: Session, include_inactive: bool, batch_size: int):
+    """Recorrer el catalogo por lotes sin materializarlo (yield_per)"""
+    statement = select(*EXPORT_COLUMNS).order_by(Product.id)
+    if not include_inactive:
+        statement = statement.where(Product.is_active == True)
+
+    result = db.execute(
+        statement.execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for batch in result.partitions():
+        yield [
+            dict(zip(EXPORT_FIELDS, row), category=row.category.value if row.category else None)
+            for row in batch
+        ]
+
+
+def export_ndjson(db: Session, include_inactive: bool = False, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    for batch in _iter_batches(db, include_inactive, batch_size):
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch)
+
+
+def export_csv(db: Session, include_inactive: bool = False, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+
+    # El header sale de inmediato, antes de la primera consulta
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for batch in _iter_batches(db, include_inactive, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+EXPORTERS = {
+    "ndjson": export_ndjson,
+    "csv": export_csv,
+}
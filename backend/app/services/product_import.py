@@ -0,0 +1,200 @@
+import csv
+import io
+import json
+import re
+from typing import IO, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.product import Product
+from app.schemas.product import ProductImportError, ProductImportReport, ProductImportRow
+from app.services.catalog_cache import catalog_cache
+
+SUPPORTED_FORMATS = ("csv", "ndjson")
+
+# Maximo de errores detallados en el reporte (el conteo `failed` es completo)
+MAX_REPORTED_ERRORS = 1000
+
+# Bytes que no son UTF-8 valido, decodificados con errors="surrogateescape"
+_INVALID_BYTES = re.compile("[\udc80-\udcff]")
+INVALID_ENCODING = "Codificación inválida (se esperaba UTF-8)"
+
+
+class ProductImporter:
+    """
+    Importacion masiva de productos desde CSV o NDJSON
+
+    Las filas se leen en streaming, se validan con ProductImportRow y se
+    escriben por lotes de `chunk_size`: una consulta IN para saber que ids ya
+    existen, un INSERT executemany para los nuevos y un UPDATE executemany
+    por clave primaria para los existentes, con un commit por lote.
+
+    Las filas mal codificadas, mal formadas o invalidas se informan en
+    `errors` y la importacion sigue. Si un lote no se puede escribir la
+    importacion se detiene: los lotes anteriores ya estan confirmados
+    (`committed`) y el reporte queda con completed=False.
+    """
+
+    def __init__(self, db: Session, chunk_size: Optional[int] = None):
+        self.db = db
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.total_rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.committed = 0
+        self.completed = True
+        self.errors: List[ProductImportError] = []
+
+    def run(self, stream: IO[bytes], file_format: str) -> ProductImportReport:
+        rows = iter_csv_rows(stream) if file_format == "csv" else iter_ndjson_rows(stream)
+
+        chunk = []
+        first_row = None
+        try:
+            for row_number, data in rows:
+                self.total_rows += 1
+                row = self._validate(row_number, data)
+                if row is None:
+                    continue
+
+                first_row = first_row or row_number
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    self._write_chunk(chunk)
+                    chunk, first_row = [], None
+
+            if chunk:
+                self._write_chunk(chunk)
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            self.completed = False
+            self.failed += len(chunk)
+            self._add_error(first_row or self.total_rows, [
+                f"Lote de {len(chunk)} filas no guardado, importación detenida: {e.__class__.__name__}"
+            ], count=False)
+
+        return ProductImportReport(
+            total_rows=self.total_rows,
+            inserted=self.inserted,
+            updated=self.updated,
+            failed=self.failed,
+            errors=self.errors,
+            committed=self.committed,
+            completed=self.completed
+        )
+
+    def _validate(self, row_number: int, data) -> Optional[dict]:
+        if isinstance(data, Exception):
+            self._add_error(row_number, [str(data)])
+            return None
+
+        try:
+            return ProductImportRow.model_validate(data).model_dump(exclude_unset=True)
+        except ValidationError as e:
+            self._add_error(row_number, [
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            ])
+            return None
+
+    def _add_error(self, row_number: int, messages: List[str], count: bool = True):
+        if count:
+            self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(ProductImportError(row=row_number, errors=messages))
+
+    def _write_chunk(self, chunk: List[dict]):
+        # Si un id se repite dentro del lote gana la ultima fila
+        with_id = {row["id"]: row for row in chunk if "id" in row}
+        new_rows = [row for row in chunk if "id" not in row]
+        updates = []
+
+        if with_id:
+            existing = {
+                product_id for (product_id,) in
+                self.db.query(Product.id).filter(Product.id.in_(with_id.keys()))
+            }
+            updates = [row for product_id, row in with_id.items() if product_id in existing]
+            new_rows.extend(row for product_id, row in with_id.items() if product_id not in existing)
+
+            if updates:
+                self.db.execute(update(Product), updates)
+                # El UPDATE por clave primaria no pasa por los eventos del ORM
+                self.db.query(Product).filter(
+                    Product.id.in_([row["id"] for row in updates])
+                ).update({Product.version: Product.version + 1}, synchronize_session=False)
+
+        if new_rows:
+            self.db.execute(insert(Product), new_rows)
+
+        catalog_cache.mark_changed(self.db)
+        self.db.commit()
+        # Los contadores solo suman lotes confirmados
+        self.updated += len(updates)
+        self.inserted += len(new_rows)
+        self.committed += len(chunk)
+
+
+def _text_stream(stream: IO[bytes]) -> IO[str]:
+    # surrogateescape: un byte invalido marca su fila en vez de cortar la lectura
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", errors="surrogateescape", newline="")
+
+
+def iter_csv_rows(stream: IO[bytes]) -> Iterator[Tuple[int, object]]:
+    """Filas del CSV (con header); celdas vacias se tratan como ausentes"""
+    reader = csv.DictReader(_text_stream(stream))
+    while True:
+        line_num = reader.line_num
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # El lector ya consumio la linea; algunos errores no actualizan line_num
+            yield max(reader.line_num, line_num + 1), ValueError(f"CSV inválido: {e}")
+            continue
+
+        cells = {
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if key and value is not None and value.strip() != ""
+        }
+        if any(_INVALID_BYTES.search(text) for cell in cells.items() for text in cell):
+            yield reader.line_num, ValueError(INVALID_ENCODING)
+            continue
+        yield reader.line_num, cells
+
+
+def iter_ndjson_rows(stream: IO[bytes]) -> Iterator[Tuple[int, object]]:
+    """Un objeto JSON por linea; las lineas invalidas se reportan como error"""
+    for line_number, line in enumerate(_text_stream(stream), start=1):
+        if not line.strip():
+            continue
+        if _INVALID_BYTES.search(line):
+            yield line_number, ValueError(INVALID_ENCODING)
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"JSON inválido: {e}")
+            continue
+        if not isinstance(data, dict):
+            yield line_number, ValueError("Cada línea debe ser un objeto JSON")
+            continue
+        yield line_number, data
+
+
+def detect_format(filename: Optional[str], file_format: Optional[str] = None) -> Optional[str]:
+    """Formato explicito o deducido de la extension (.csv, .ndjson, .jsonl)"""
+    if file_format:
+        return file_format.lower() if file_format.lower() in SUPPORTED_FORMATS else None
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
@@ -0,0 +1,177 @@
+import re
+from sqlalchemy import DDL, event, false, literal_column, or_, select, text
+from sqlalchemy.orm import Query, Session
+
+from app.core.config import settings
+from app.models.product import Product
+
+FTS_TABLE = "products_fts"
+
+# Peso de cada columna en el ranking bm25 (name, description)
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# DDL del indice FTS5: tabla virtual con contenido externo sobre `products`
+# y triggers que la mantienen sincronizada con cada INSERT/UPDATE/DELETE
+_FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+for _statement in _FTS_DDL:
+    event.listen(
+        Product.__table__,
+        "after_create",
+        DDL(_statement).execute_if(dialect="sqlite")
+    )
+
+event.listen(
+    Product.__table__,
+    "before_drop",
+    DDL(f"DROP TABLE IF EXISTS {FTS_TABLE}").execute_if(dialect="sqlite")
+)
+
+
+def tokenize(search: str) -> list:
+    """Separar el texto de busqueda en terminos alfanumericos"""
+    return _TOKEN_RE.findall(search.lower())
+
+
+class LikeSearchBackend:
+    """Busqueda por ILIKE sobre nombre y descripcion (cualquier base de datos)
+
+    Los backends devuelven (query filtrada, columna de relevancia o None).
+    """
+    name = "like"
+
+    def apply(self, query: Query, search: str):
+        terms = tokenize(search)
+        if not terms:
+            return query.filter(false()), None
+
+        for term in terms:
+            pattern = f"%{term}%"
+            query = query.filter(
+                or_(Product.name.ilike(pattern), Product.description.ilike(pattern))
+            )
+        return query, None
+
+
+class SQLiteFTSSearchBackend:
+    """Busqueda full-text con el indice FTS5 de SQLite
+
+    - Cada termino se busca por prefijo ("hidra" encuentra "hidratante")
+    - Todos los terminos deben aparecer (AND implicito de FTS5)
+    - Expone la relevancia (bm25, menor es mejor; el nombre pesa mas)
+    """
+    name = "fts5"
+
+    @staticmethod
+    def build_match(terms: list) -> str:
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def apply(self, query: Query, search: str):
+        terms = tokenize(search)
+        if not terms:
+            return query.filter(false()), None
+
+        matches = select(
+            literal_column("rowid").label("product_id"),
+            literal_column(
+                f"bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT})"
+            ).label("rank")
+        ).select_from(
+            text(FTS_TABLE)
+        ).where(
+            text(f"{FTS_TABLE} MATCH :fts_match").bindparams(fts_match=self.build_match(terms))
+        ).subquery("fts_matches")
+
+        query = query.join(matches, matches.c.product_id == Product.id)
+        return query, matches.c.rank
+
+
+SEARCH_BACKENDS = {
+    "like": LikeSearchBackend(),
+    "fts5": SQLiteFTSSearchBackend(),
+}
+
+# Backend por defecto segun el dialecto de la base de datos
+DIALECT_BACKENDS = {
+    "sqlite": "fts5",
+}
+
+
+def register_backend(name: str, backend, dialect: str = None):
+    """Registrar un backend de busqueda (ej. Postgres tsvector)"""
+    SEARCH_BACKENDS[name] = backend
+    if dialect:
+        DIALECT_BACKENDS[dialect] = name
+
+
+def get_search_backend(db: Session):
+    """Resolver el backend configurado en SEARCH_BACKEND o el del dialecto"""
+    if settings.SEARCH_BACKEND != "auto":
+        return SEARCH_BACKENDS[settings.SEARCH_BACKEND]
+
+    dialect = db.get_bind().dialect.name
+    return SEARCH_BACKENDS[DIALECT_BACKENDS.get(dialect, "like")]
+
+
+def apply_search(query: Query, db: Session, search: str):
+    """Filtrar por busqueda; devuelve (query, columna de relevancia o None)"""
+    return get_search_backend(db).apply(query, search)
+
+
+def ensure_search_index(engine):
+    """
+    Crear el indice FTS5 en bases de datos existentes
+
+    create_all no dispara `after_create` si la tabla products ya existia,
+    asi que al iniciar la app se crean (si faltan) la tabla virtual y los
+    triggers. Los triggers mantienen el indice al dia; solo se repuebla
+    desde products cuando la tabla FTS es nueva o su cantidad de documentos
+    no coincide con la de products (ej. filas escritas antes del trigger).
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.begin() as conn:
+        created = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}
+        ).first() is None
+        for statement in _FTS_DDL:
+            conn.execute(text(statement))
+
+        # {FTS_TABLE}_docsize guarda una fila por documento indexado
+        indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}_docsize")).scalar()
+        total = conn.execute(text("SELECT count(*) FROM products")).scalar()
+        if created or indexed != total:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
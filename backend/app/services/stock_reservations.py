@@ -0,0 +1,146 @@
+"""
+Reservas de stock por linea de carrito (STOCK_RESERVATIONS_ENABLED)
+
+Cada linea del carrito mantiene un hold de su cantidad durante
+STOCK_RESERVATION_MINUTES, renovado en cada cambio de la linea. El stock
+disponible para un usuario es Product.stock menos los holds activos de los
+demas usuarios; se calcula con un SUM sobre stock_reservations (indice
+product_id, expires_at) sin escribir ni bloquear la fila del producto.
+
+Los holds vencidos dejan de contar apenas expiran (liberacion perezosa) y
+el reaper de carritos los borra con sweep_expired().
+"""
+
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import upsert_insert
+from app.models.product import Product
+from app.models.reservation import StockReservation
+
+
+def reservations_enabled() -> bool:
+    return settings.STOCK_RESERVATIONS_ENABLED
+
+
+def _held_by_others(product_id, user_id: int, now: datetime):
+    return select(func.coalesce(func.sum(StockReservation.quantity), 0)).where(
+        StockReservation.product_id == product_id,
+        StockReservation.user_id != user_id,
+        StockReservation.expires_at > now
+    ).scalar_subquery()
+
+
+def available_stock(db: Session, products: Iterable[Product], user_id: int) -> Dict[int, int]:
+    """Stock disponible para `user_id`: stock menos holds activos de otros usuarios"""
+    products = list(products)
+    available = {product.id: product.stock for product in products}
+    if not reservations_enabled() or not products:
+        return available
+
+    held = db.query(
+        StockReservation.product_id, func.sum(StockReservation.quantity)
+    ).filter(
+        StockReservation.product_id.in_(available.keys()),
+        StockReservation.user_id != user_id,
+        StockReservation.expires_at > datetime.now()
+    ).group_by(StockReservation.product_id)
+
+    for product_id, quantity in held:
+        available[product_id] -= quantity
+    return available
+
+
+def stock_condition(product_id: int, user_id: int, quantity: int):
+    """Condicion SQL sobre products: hay `quantity` unidades disponibles para el usuario"""
+    if not reservations_enabled():
+        return Product.stock >= quantity
+    return Product.stock - _held_by_others(product_id, user_id, datetime.now()) >= quantity
+
+
+def reserve(
+    db: Session,
+    user_id: int,
+    quantities: Dict[int, int],
+    in_cart: Optional[Callable[[int], int]] = None
+) -> Dict[int, int]:
+    """
+    Fijar los holds del usuario a las cantidades dadas (0 = liberar)
+
+    Con `in_cart` las cantidades son unidades que se suman a la linea: el
+    hold cubre in_cart(product_id) + cantidad. in_cart solo se consulta con
+    las reservas activas; sin ellas no hace nada y devuelve {}.
+
+    Cada hold es un INSERT ... SELECT ... WHERE stock - holds_de_otros >= cantidad
+    ON CONFLICT DO UPDATE: la verificacion y la escritura son una sola
+    sentencia. Devuelve {product_id: disponible} de los que no alcanzaron;
+    las escrituras quedan en la transaccion de la sesion.
+    """
+    if not reservations_enabled():
+        return {}
+    if in_cart is not None:
+        quantities = {product_id: in_cart(product_id) + quantity for product_id, quantity in quantities.items()}
+
+    now = datetime.now()
+    expires_at = now + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+
+    release(db, user_id, [product_id for product_id, quantity in quantities.items() if quantity == 0])
+
+    failed = []
+    for product_id, quantity in quantities.items():
+        if quantity == 0:
+            continue
+
+        stock = select(Product.stock).where(
+            Product.id == product_id,
+            Product.is_active == True
+        ).scalar_subquery()
+        candidate = select(
+            literal(user_id), literal(product_id), literal(quantity), literal(expires_at), literal(now)
+        ).where(stock - _held_by_others(product_id, user_id, now) >= quantity)
+
+        statement = upsert_insert(db, StockReservation).from_select(
+            ["user_id", "product_id", "quantity", "expires_at", "created_at"],
+            candidate
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[StockReservation.user_id, StockReservation.product_id],
+            set_={
+                "quantity": statement.excluded.quantity,
+                "expires_at": statement.excluded.expires_at
+            }
+        ).returning(StockReservation.id)
+
+        if db.execute(statement).first() is None:
+            failed.append(product_id)
+
+    if not failed:
+        return {}
+    products = db.query(Product).filter(Product.id.in_(failed)).all()
+    return available_stock(db, products, user_id)
+
+
+def release(db: Session, user_id: int, product_ids: Optional[Iterable[int]] = None):
+    """Liberar holds del usuario (todos si product_ids es None)"""
+    if not reservations_enabled():
+        return
+
+    statement = delete(StockReservation).where(StockReservation.user_id == user_id)
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        statement = statement.where(StockReservation.product_id.in_(product_ids))
+    db.execute(statement)
+
+
+def sweep_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """Borrar los holds vencidos; devuelve cuantos se liberaron"""
+    result = db.execute(
+        delete(StockReservation).where(StockReservation.expires_at <= (now or datetime.now()))
+    )
+    db.commit()
+    return result.rowcount
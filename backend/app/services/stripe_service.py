@@ -24,6 +24,13 @@ class StripeService:
         # CLP no tiene decimales, así que multiplicamos por 1
         amount = int(order.total)
 
+        # El job post-checkout y el endpoint pueden crear a la vez: con la
+        # misma clave Stripe devuelve un solo intent. Reemplazar un intent
+        # previo (ej. cancelado) usa otra clave
+        idempotency_key = f"order-{order.id}-payment-intent"
+        if order.payment_id:
+            idempotency_key += f"-replaces-{order.payment_id}"
+
         try:
             payment_intent = stripe.PaymentIntent.create(
                 amount=amount,
@@ -36,7 +43,8 @@ class StripeService:
                 automatic_payment_methods={
                     'enabled': True,
                 },
-                description=f"Orden #{order.id} - Natural Triade"
+                description=f"Orden #{order.id} - Natural Triade",
+                idempotency_key=idempotency_key
             )
             
             return payment_intent
@@ -1,9 +1,13 @@
 import pytest
+from fastapi import Depends
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine 
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.core.database import Base, get_db
+from app.services.cart_store import InMemoryKeyValue, KeyValueCartStore, get_cart_store
+from app.services.catalog_cache import catalog_cache
+from app.services.job_queue import job_queue
 
 DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
@@ -17,12 +21,16 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+# Los jobs post-checkout abren sus propias sesiones: usar la base de tests
+job_queue.session_factory = TestingSessionLocal
 
 @pytest.fixture
 def client():
     Base.metadata.create_all(bind=engine)
+    catalog_cache.clear()
     with TestClient(app) as c:
         yield c
+        job_queue.join(timeout=5)
     Base.metadata.drop_all(bind=engine)
     
 @pytest.fixture
@@ -45,4 +53,16 @@ def auth_token(client, test_user):
 
 @pytest.fixture
 def auth_headers(auth_token):
-    return {"Authorization": f"Bearer {auth_token}"}
\ No newline at end of file
+    return {"Authorization": f"Bearer {auth_token}"}
+
+@pytest.fixture
+def memory_cart_store():
+    """Usar el backend clave-valor en proceso para el carrito"""
+    kv = InMemoryKeyValue()
+
+    def override_get_cart_store(db=Depends(get_db)):
+        return KeyValueCartStore(db, kv)
+
+    app.dependency_overrides[get_cart_store] = override_get_cart_store
+    yield kv
+    app.dependency_overrides.pop(get_cart_store, None)
@@ -1,3 +1,5 @@
+import time
+
 import pytest
 
 
@@ -292,6 +294,112 @@ def test_regular_user_cannot_update_order_status(client, auth_headers, test_orde
     assert response.status_code == 403
 
 
+def test_admin_cannot_move_order_backwards(client, admin_headers, test_orders_data):
+    """Test the transition table rejects going back from shipped to paid"""
+    order_id = test_orders_data[0]["id"]
+    client.put(f"/admin/orders/{order_id}/status", headers=admin_headers, json={"status": "shipped"})
+
+    response = client.put(f"/admin/orders/{order_id}/status", headers=admin_headers, json={"status": "paid"})
+
+    assert response.status_code == 400
+    assert "'shipped' a 'paid'" in response.json()["detail"]
+
+    orders = {order["id"]: order for order in client.get("/admin/orders", headers=admin_headers).json()}
+    order = orders[order_id]
+    assert order["status"] == "shipped"
+    assert order["paid_at"] is None
+
+
+def test_admin_rejects_backward_and_same_status_in_bulk(client, admin_headers, test_orders_data):
+    """Test bulk updates report backward and same-status moves as errors"""
+    delivered, processing, pending = (order["id"] for order in test_orders_data)
+    client.put(f"/admin/orders/{delivered}/status", headers=admin_headers, json={"status": "delivered"})
+    client.put(f"/admin/orders/{processing}/status", headers=admin_headers, json={"status": "processing"})
+
+    response = client.put(
+        "/admin/orders/status",
+        headers=admin_headers,
+        json={"order_ids": [delivered, processing, pending], "status": "processing"}
+    )
+
+    report = response.json()
+    assert report["updated"] == 1
+    results = {result["order_id"]: result for result in report["results"]}
+    assert "entregada" in results[delivered]["error"]
+    assert "'processing' a 'processing'" in results[processing]["error"]
+    assert results[pending]["updated"]
+
+
+def test_admin_cancel_delivered_order_keeps_stock(client, admin_headers, test_orders_data, test_products):
+    """Test a delivered order can still be cancelled, without restoring stock"""
+    order_id = test_orders_data[0]["id"]
+    stock_before = client.get(f"/products/{test_products[0]['id']}").json()["stock"]
+    client.put(f"/admin/orders/{order_id}/status", headers=admin_headers, json={"status": "delivered"})
+
+    response = client.put(f"/admin/orders/{order_id}/status", headers=admin_headers, json={"status": "cancelled"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert client.get(f"/products/{test_products[0]['id']}").json()["stock"] == stock_before
+
+
+def test_admin_bulk_update_order_status(client, admin_headers, test_orders_data):
+    """Test bulk status change reports per-order results in one call"""
+    shipped, pending, cancelled = (order["id"] for order in test_orders_data)
+    client.put(f"/admin/orders/{cancelled}/status", headers=admin_headers, json={"status": "cancelled"})
+    client.put(f"/admin/orders/{shipped}/status", headers=admin_headers, json={"status": "paid"})
+
+    response = client.put(
+        "/admin/orders/status",
+        headers=admin_headers,
+        json={"order_ids": [shipped, pending, cancelled, 999999], "status": "shipped"}
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["status"] == "shipped"
+    assert report["updated"] == 2
+    assert report["failed"] == 2
+
+    results = {result["order_id"]: result for result in report["results"]}
+    assert results[shipped]["updated"] and results[shipped]["previous_status"] == "paid"
+    assert results[pending]["updated"] and results[pending]["previous_status"] == "pending"
+    assert not results[cancelled]["updated"] and "cancelada" in results[cancelled]["error"]
+    assert not results[999999]["updated"] and results[999999]["previous_status"] is None
+
+    orders = {order["id"]: order for order in client.get("/admin/orders", headers=admin_headers).json()}
+    assert orders[shipped]["status"] == "shipped" and orders[shipped]["shipped_at"] is not None
+    assert orders[pending]["status"] == "shipped"
+    assert orders[cancelled]["status"] == "cancelled"
+
+
+def test_admin_bulk_cancel_restores_stock(client, admin_headers, test_orders_data, test_products):
+    """Test bulk cancel restores stock only for orders that had not shipped"""
+    first, second, third = (order["id"] for order in test_orders_data)
+    client.put(f"/admin/orders/{third}/status", headers=admin_headers, json={"status": "shipped"})
+
+    response = client.put(
+        "/admin/orders/status",
+        headers=admin_headers,
+        json={"order_ids": [first, second, third], "status": "cancelled"}
+    )
+
+    assert response.json()["updated"] == 3
+    product = client.get(f"/products/{test_products[0]['id']}").json()
+    assert product["stock"] == test_products[0]["stock"] - 1
+
+
+def test_admin_bulk_update_invalid_status(client, admin_headers, test_orders_data):
+    """Test bulk status change validates the target status"""
+    response = client.put(
+        "/admin/orders/status",
+        headers=admin_headers,
+        json={"order_ids": [test_orders_data[0]["id"]], "status": "lost"}
+    )
+
+    assert response.status_code == 400
+
+
 def test_admin_get_all_products(client, admin_headers, test_products):
     """Test admin can see all products"""
     response = client.get("/admin/products", headers=admin_headers)
@@ -434,4 +542,399 @@ def test_admin_filter_orders_by_user(client, admin_headers, test_user, test_orde
     
     # All orders should belong to the specified user
     for order in orders:
-        assert order["user_id"] == user_id
\ No newline at end of file
+        assert order["user_id"] == user_id
+
+
+def test_admin_import_products_csv(client, admin_headers):
+    """Test admin can bulk import products from CSV with per-row errors"""
+    csv_data = (
+        "name,description,price,stock,category\n"
+        "Crema Rosa,Hidratante,3500,50,facial\n"
+        "Sin Precio,Falta precio,,10,facial\n"
+        "Aceite Coco,Nutritivo,2990,40,corporal\n"
+        "Categoria Mala,Descripcion,1000,1,invalida\n"
+    )
+
+    response = client.post(
+        "/admin/products/import?chunk_size=1",
+        headers=admin_headers,
+        files={"file": ("catalogo.csv", csv_data, "text/csv")}
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["total_rows"] == 4
+    assert report["inserted"] == 2
+    assert report["failed"] == 2
+    assert [error["row"] for error in report["errors"]] == [3, 5]
+
+    names = {p["name"] for p in client.get("/products/").json()}
+    assert names == {"Crema Rosa", "Aceite Coco"}
+
+
+def test_admin_import_products_ndjson_upsert(client, admin_headers, test_products):
+    """Test NDJSON rows with an existing id update the product"""
+    product_id = test_products[0]["id"]
+    ndjson_data = "\n".join([
+        f'{{"id": {product_id}, "name": "Actualizado", "description": "Nueva", "price": 9900}}',
+        '{"name": "Nuevo", "description": "Producto nuevo", "price": 1500, "stock": 3}',
+        'no es json',
+    ])
+
+    response = client.post(
+        "/admin/products/import",
+        headers=admin_headers,
+        files={"file": ("catalogo.ndjson", ndjson_data, "application/x-ndjson")}
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["updated"] == 1
+    assert report["inserted"] == 1
+    assert report["failed"] == 1
+
+    product = client.get(f"/products/{product_id}").json()
+    assert product["name"] == "Actualizado"
+    assert product["price"] == 9900
+    assert product["stock"] == test_products[0]["stock"]
+
+
+def test_admin_import_products_reports_bad_bytes_and_rows(client, admin_headers):
+    """Test invalid UTF-8 and malformed rows late in the file are reported per row"""
+    csv_data = (
+        b"name,description,price,stock,category\n"
+        b"Crema Rosa,Hidratante,3500,50,facial\n"
+        b"Aceite Coco,Nutritivo,2990,40,corporal\n"
+        b"Jab\xf3n Mal Codificado,Latin-1,1000,1,facial\n"
+        b"Descripcion Gigante," + b"a" * 200000 + b",1000,1,facial\n"
+        b"Serum Final,Antioxidante,4500,5,facial\n"
+    )
+
+    response = client.post(
+        "/admin/products/import?chunk_size=1",
+        headers=admin_headers,
+        files={"file": ("catalogo.csv", csv_data, "text/csv")}
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["inserted"] == 3
+    assert report["committed"] == 3
+    assert report["completed"] is True
+    assert [error["row"] for error in report["errors"]] == [4, 5]
+    assert "UTF-8" in report["errors"][0]["errors"][0]
+
+    ndjson_data = b'{"name": "Nuevo", "description": "Ok", "price": 1500}\n{"name": "\xff"}\n'
+    response = client.post(
+        "/admin/products/import",
+        headers=admin_headers,
+        files={"file": ("catalogo.ndjson", ndjson_data, "application/x-ndjson")}
+    )
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 1
+    assert response.json()["errors"][0]["row"] == 2
+
+
+def test_admin_import_products_stops_on_failed_chunk(client, admin_headers, monkeypatch):
+    """Test a chunk that cannot be written stops the import with 207 and the committed count"""
+    from sqlalchemy.exc import OperationalError
+    from app.services.product_import import ProductImporter
+
+    write_chunk = ProductImporter._write_chunk
+    calls = []
+
+    def failing_write_chunk(self, chunk):
+        calls.append(len(chunk))
+        if len(calls) == 2:
+            raise OperationalError("INSERT", {}, Exception("disk I/O error"))
+        write_chunk(self, chunk)
+
+    monkeypatch.setattr(ProductImporter, "_write_chunk", failing_write_chunk)
+    csv_data = (
+        "name,description,price,stock,category\n"
+        "Crema Rosa,Hidratante,3500,50,facial\n"
+        "Aceite Coco,Nutritivo,2990,40,corporal\n"
+        "Serum Final,Antioxidante,4500,5,facial\n"
+    )
+
+    response = client.post(
+        "/admin/products/import?chunk_size=1",
+        headers=admin_headers,
+        files={"file": ("catalogo.csv", csv_data, "text/csv")}
+    )
+
+    assert response.status_code == 207
+    report = response.json()
+    assert report["completed"] is False
+    assert report["committed"] == 1
+    assert report["inserted"] == 1
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == 3
+    assert {p["name"] for p in client.get("/products/").json()} == {"Crema Rosa"}
+
+    # Falla el primer lote: nada confirmado
+    calls.clear()
+    calls.append(0)
+    response = client.post(
+        "/admin/products/import",
+        headers=admin_headers,
+        files={"file": ("catalogo.csv", csv_data, "text/csv")}
+    )
+    assert response.status_code == 400
+    assert response.json()["committed"] == 0
+
+
+def test_admin_import_products_unsupported_format(client, admin_headers):
+    """Test import rejects unknown file formats"""
+    response = client.post(
+        "/admin/products/import",
+        headers=admin_headers,
+        files={"file": ("catalogo.xlsx", b"...", "application/octet-stream")}
+    )
+
+    assert response.status_code == 400
+
+
+def test_non_admin_cannot_import_products(client, auth_headers):
+    """Test regular users cannot import products"""
+    response = client.post(
+        "/admin/products/import",
+        headers=auth_headers,
+        files={"file": ("catalogo.csv", "name\n", "text/csv")}
+    )
+
+    assert response.status_code == 403
+
+
+def test_admin_export_products_ndjson(client, admin_headers, test_products):
+    """Test admin can stream the catalog as NDJSON"""
+    import json
+
+    response = client.get("/admin/products/export", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == [p["id"] for p in test_products]
+    assert rows[0]["category"] == "facial"
+
+
+def test_admin_export_products_csv_roundtrip(client, admin_headers, test_products):
+    """Test CSV export can be re-imported as an upsert"""
+    client.delete(f"/products/{test_products[1]['id']}")
+
+    response = client.get("/admin/products/export?format=csv", headers=admin_headers)
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0].startswith("id,name,description,price")
+    assert len(lines) == 2  # header + producto activo
+
+    response = client.get("/admin/products/export?format=csv&include_inactive=true", headers=admin_headers)
+    assert len(response.text.splitlines()) == 3
+
+    report = client.post(
+        "/admin/products/import",
+        headers=admin_headers,
+        files={"file": ("productos.csv", response.text, "text/csv")}
+    ).json()
+    assert report["updated"] == 2
+    assert report["failed"] == 0
+
+
+def _age_cart(user_email, hours):
+    """Move the last activity of a user's cart into the past"""
+    from datetime import datetime, timedelta
+    from app.tests.conftest import TestingSessionLocal
+    from app.models.cart import CartItem
+    from app.models.user import User
+
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.email == user_email).first()
+        db.query(CartItem).filter(CartItem.user_id == user.id).update(
+            {CartItem.updated_at: datetime.now() - timedelta(hours=hours)}
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_admin_reap_abandoned_carts(client, admin_headers, auth_headers, test_user, test_products):
+    """Test idle carts are purged while recently active carts are kept"""
+    for product in test_products:
+        client.post("/cart/items", headers=auth_headers, json={"product_id": product["id"], "quantity": 1})
+    client.post("/cart/items", headers=admin_headers, json={"product_id": test_products[0]["id"], "quantity": 1})
+    _age_cart(test_user["email"], hours=24 * 30)
+
+    response = client.post("/admin/carts/reap", headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.json() == {"rows_purged": 2, "carts_purged": 1, "batches": 1, "reservations_released": 0}
+    assert client.get("/cart/", headers=auth_headers).json()["items_count"] == 0
+    assert client.get("/cart/", headers=admin_headers).json()["items_count"] == 1
+
+    stats = client.get("/admin/carts/reaper", headers=admin_headers).json()
+    assert stats["last_rows_purged"] == 2
+    assert stats["rows_purged"] >= 2
+
+
+def test_cart_reaper_deletes_in_bounded_batches(client, auth_headers, test_user, test_products):
+    """Test the reaper commits one batch at a time and stops at max_batches"""
+    from app.tests.conftest import TestingSessionLocal
+    from app.services.cart_reaper import CartReaper
+
+    for product in test_products:
+        client.post("/cart/items", headers=auth_headers, json={"product_id": product["id"], "quantity": 1})
+    _age_cart(test_user["email"], hours=24 * 30)
+
+    reaper = CartReaper(session_factory=TestingSessionLocal, ttl_hours=72, batch_size=1, max_batches=1)
+    assert reaper.run_once()["rows_purged"] == 1
+    assert reaper.run_once()["rows_purged"] == 1
+    assert reaper.run_once()["rows_purged"] == 0
+    assert reaper.stats()["rows_purged"] == 2
+
+
+def test_admin_job_queue_stats(client, admin_headers, auth_headers, test_products):
+    """Test checkout enqueues its confirmation job and the queue reports it"""
+    from app.services.job_queue import job_queue
+
+    client.post("/cart/items", headers=auth_headers, json={"product_id": test_products[0]["id"], "quantity": 1})
+    client.post("/orders/", headers=auth_headers, json={
+        "shipping_address": "Address",
+        "shipping_city": "Santiago",
+        "contact_email": "test@example.com"
+    })
+    assert job_queue.join(timeout=5)
+
+    response = client.get("/admin/jobs", headers=admin_headers)
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["running"] is True
+    assert stats["depth"] == 0
+    assert stats["succeeded"]["orders.send_confirmation"] >= 1
+    assert "orders.create_payment_intent" not in stats["enqueued"]
+
+
+def test_job_queue_retries_with_backoff():
+    """Test a failing job is retried with backoff and dead-lettered after max attempts"""
+    from app.services.job_queue import JobQueue, job
+
+    calls = []
+
+    @job("tests.flaky")
+    def flaky(fail_times: int):
+        calls.append(len(calls))
+        if len(calls) <= fail_times:
+            raise RuntimeError("falla transitoria")
+
+    queue = JobQueue(workers=1, max_attempts=3, backoff=0.01, backoff_max=0.05)
+    queue.start()
+    try:
+        queue.enqueue("tests.flaky", fail_times=2)
+        deadline = time.monotonic() + 5
+        while not queue.succeeded["tests.flaky"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert queue.succeeded["tests.flaky"] == 1
+        assert queue.retried["tests.flaky"] == 2
+        assert len(calls) == 3
+
+        calls.clear()
+        queue.enqueue("tests.flaky", fail_times=10)
+        deadline = time.monotonic() + 5
+        while not queue.dead and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert queue.dead[-1]["attempts"] == 3
+        assert queue.stats()["depth"] == 0
+    finally:
+        queue.stop()
+
+
+def test_jobs_enqueued_after_commit_only(client):
+    """Test jobs registered on a session run only if the transaction commits"""
+    from app.services.job_queue import enqueue_after_commit, job, job_queue
+    from app.tests.conftest import TestingSessionLocal
+
+    ran = []
+
+    @job("tests.record")
+    def record(value: str):
+        ran.append(value)
+
+    db = TestingSessionLocal()
+    try:
+        enqueue_after_commit(db, "tests.record", value="rollback")
+        db.rollback()
+        enqueue_after_commit(db, "tests.record", value="commit")
+        db.commit()
+    finally:
+        db.close()
+
+    assert job_queue.join(timeout=5)
+    assert ran == ["commit"]
+
+
+def test_job_queue_never_runs_jobs_inline():
+    """Test jobs wait for the workers while stopped and are dropped when disabled"""
+    import threading
+    from app.services.job_queue import JobQueue, job
+
+    threads = []
+
+    @job("tests.thread")
+    def record_thread():
+        threads.append(threading.current_thread().name)
+
+    queue = JobQueue(workers=1)
+    queue.enqueue("tests.thread")
+    assert threads == []
+    assert queue.stats()["depth"] == 1
+
+    queue.start()
+    try:
+        assert queue.join(timeout=5)
+    finally:
+        queue.stop()
+    assert threads == ["job-worker-0"]
+
+    queue.enqueue("tests.thread")
+    disabled = JobQueue(enabled=False)
+    disabled.enqueue("tests.thread")
+
+    assert threads == ["job-worker-0"]
+    assert queue.stats()["dropped"] == {"tests.thread": 1}
+    assert disabled.stats()["depth"] == 0
+    assert disabled.stats()["dropped"] == {"tests.thread": 1}
+
+
+def _job_database_url(expected: str):
+    """Handler de modulo (serializable) para el pool de procesos"""
+    from app.services.job_queue import job_queue
+
+    with job_queue.session() as db:
+        url = db.get_bind().url.render_as_string(hide_password=False)
+    if url != expected:
+        raise RuntimeError(f"Sesion contra {url}")
+
+
+def test_job_queue_processes_use_queue_database(monkeypatch):
+    """Test process-pool handlers open sessions against the queue's database"""
+    from app.core.database import SessionLocal
+    from app.services.job_queue import JobQueue, job, job_queue
+    from app.tests.conftest import DATABASE_URL, TestingSessionLocal
+
+    job("tests.database_url")(_job_database_url)
+    # El proceso hijo no debe heredar la sesion global sino la de la cola
+    monkeypatch.setattr(job_queue, "session_factory", SessionLocal)
+
+    queue = JobQueue(session_factory=TestingSessionLocal, workers=1, processes=1, max_attempts=1)
+    queue.start()
+    try:
+        queue.enqueue("tests.database_url", expected=DATABASE_URL)
+        assert queue.join(timeout=30)
+    finally:
+        queue.stop()
+
+    assert queue.succeeded["tests.database_url"] == 1, list(queue.dead)
@@ -1,5 +1,12 @@
 import pytest
 
+@pytest.fixture(autouse=True, params=["sql", "memory"])
+def cart_backend(request):
+    """Todos los tests del carrito corren contra ambos backends"""
+    if request.param == "memory":
+        request.getfixturevalue("memory_cart_store")
+    return request.param
+
 @pytest.fixture
 def test_product(client):
     response = client.post("/products/", json={
@@ -274,4 +281,513 @@ def test_cart_isolation_between_users(client, test_product):
         headers={"Authorization": f"Bearer {token1}"}
     ).json()
     
-    assert len(cart1["items"]) == 1
\ No newline at end of file
+    assert len(cart1["items"]) == 1
+
+def test_batch_update_cart(client, auth_headers, test_product):
+    product2 = client.post("/products/", json={
+        "name": "Test Serum",
+        "description": "Serum de prueba",
+        "price": 8000,
+        "stock": 15,
+        "category": "facial"
+    }).json()
+
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 2}
+    )
+
+    response = client.put(
+        "/cart/items",
+        headers=auth_headers,
+        json={"items": [
+            {"product_id": test_product["id"], "quantity": 5},
+            {"product_id": product2["id"], "quantity": 1}
+        ]}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    quantities = {item["product_id"]: item["quantity"] for item in data["items"]}
+    assert quantities == {test_product["id"]: 5, product2["id"]: 1}
+    assert data["subtotal"] == test_product["price"] * 5 + product2["price"]
+
+    response = client.put(
+        "/cart/items",
+        headers=auth_headers,
+        json={"items": [{"product_id": test_product["id"], "quantity": 0}]}
+    )
+    assert [item["product_id"] for item in response.json()["items"]] == [product2["id"]]
+
+def test_batch_update_cart_is_atomic(client, auth_headers, test_product):
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 2}
+    )
+
+    response = client.put(
+        "/cart/items",
+        headers=auth_headers,
+        json={"items": [
+            {"product_id": test_product["id"], "quantity": 3},
+            {"product_id": 99999, "quantity": 1}
+        ]}
+    )
+
+    assert response.status_code == 400
+    assert "no encontrado" in response.json()["detail"].lower()
+
+    cart = client.get("/cart/", headers=auth_headers).json()
+    assert cart["items"][0]["quantity"] == 2
+
+def test_batch_update_cart_insufficient_stock(client, auth_headers, test_product):
+    response = client.put(
+        "/cart/items",
+        headers=auth_headers,
+        json={"items": [{"product_id": test_product["id"], "quantity": 100}]}
+    )
+
+    assert response.status_code == 400
+    assert "stock insuficiente" in response.json()["detail"].lower()
+
+def test_add_to_cart_keeps_single_row_per_product(client, auth_headers, test_product):
+    first = client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 2}
+    ).json()
+    second = client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 3}
+    ).json()
+
+    assert second["id"] == first["id"]
+    assert second["quantity"] == 5
+    assert second["subtotal"] == test_product["price"] * 5
+
+    cart = client.get("/cart/", headers=auth_headers).json()
+    assert cart["items_count"] == 1
+
+def test_add_to_cart_accumulated_stock_check(client, auth_headers, test_product):
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 8}
+    )
+
+    response = client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 3}
+    )
+
+    assert response.status_code == 400
+    assert "en carrito: 8" in response.json()["detail"]
+
+    cart = client.get("/cart/", headers=auth_headers).json()
+    assert cart["items"][0]["quantity"] == 8
+
+def test_legacy_cart_table_is_upgraded(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+    from app.core.database import ensure_columns, ensure_indexes
+    from app.models.cart import CartItem
+    from app.services.cart_service import CART_UNIQUE_INDEX, merge_duplicate_cart_lines
+
+    legacy_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy_engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE cart_items (id INTEGER PRIMARY KEY, user_id INTEGER, product_id INTEGER, "
+            "quantity INTEGER, price_at_addition FLOAT, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO cart_items (user_id, product_id, quantity, price_at_addition) "
+            "VALUES (1, 1, 2, 100), (1, 1, 3, 100), (1, 2, 1, 50)"
+        ))
+
+    # Mismo orden que al iniciar la app
+    merge_duplicate_cart_lines(legacy_engine)
+    ensure_columns(CartItem.__table__, legacy_engine)
+    ensure_indexes(CartItem.__table__, legacy_engine)
+
+    with legacy_engine.connect() as conn:
+        rows = conn.execute(text("SELECT product_id, quantity FROM cart_items ORDER BY product_id")).all()
+        missing_activity = conn.execute(text("SELECT COUNT(*) FROM cart_items WHERE updated_at IS NULL")).scalar()
+    assert [tuple(row) for row in rows] == [(1, 5), (2, 1)]
+    assert missing_activity == 0
+    columns = {column["name"] for column in inspect(legacy_engine).get_columns("cart_items")}
+    assert "product_version" in columns
+    index_names = {index["name"] for index in inspect(legacy_engine).get_indexes("cart_items")}
+    assert CART_UNIQUE_INDEX in index_names
+    assert "ix_cart_items_user_updated" in index_names
+
+@pytest.mark.parametrize("url", ["sqlite://", "postgresql://"])
+def test_upsert_insert_follows_session_dialect(url):
+    from sqlalchemy import create_mock_engine
+    from sqlalchemy.orm import Session
+    from app.core.database import upsert_insert
+    from app.models.cart import CartItem
+
+    mock_engine = create_mock_engine(url, lambda *args, **kwargs: None)
+    statement = upsert_insert(Session(bind=mock_engine), CartItem).values(
+        user_id=1, product_id=1, quantity=1, price_at_addition=100
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[CartItem.user_id, CartItem.product_id],
+        set_={"quantity": CartItem.quantity + statement.excluded.quantity}
+    )
+
+    compiled = str(statement.compile(dialect=mock_engine.dialect))
+    assert "ON CONFLICT (user_id, product_id) DO UPDATE" in compiled
+
+def test_startup_rejects_database_without_upsert():
+    from sqlalchemy import create_mock_engine
+    from app.core.database import check_upsert_support
+
+    check_upsert_support(create_mock_engine("postgresql://", lambda *args, **kwargs: None))
+    with pytest.raises(RuntimeError, match="mssql"):
+        check_upsert_support(create_mock_engine("mssql://", lambda *args, **kwargs: None))
+
+def test_cart_store_requires_every_method():
+    from app.services.cart_store import CartStore
+
+    class PartialStore(CartStore):
+        def get_lines(self, user_id):
+            return []
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+def test_get_cart_totals(client, auth_headers, test_product):
+    empty = client.get("/cart/totals", headers=auth_headers).json()
+    assert empty == {"items_count": 0, "total_quantity": 0, "subtotal": 0, "tax": 0, "total": 0}
+
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 3}
+    )
+
+    totals = client.get("/cart/totals", headers=auth_headers).json()
+    cart = client.get("/cart/", headers=auth_headers).json()
+
+    assert totals["items_count"] == cart["items_count"] == 1
+    assert totals["total_quantity"] == 3
+    assert totals["subtotal"] == cart["subtotal"]
+    assert totals["tax"] == cart["tax"]
+    assert totals["total"] == cart["total"]
+
+def test_get_cart_is_cached_until_cart_changes(client, auth_headers, test_product):
+    from app.services.cart_service import cart_cache
+
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 1}
+    )
+    client.get("/cart/", headers=auth_headers)
+
+    hits = cart_cache.stats()["hits"]
+    client.get("/cart/", headers=auth_headers)
+    assert cart_cache.stats()["hits"] == hits + 1
+
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 1}
+    )
+    cart = client.get("/cart/", headers=auth_headers).json()
+    assert cart["items"][0]["quantity"] == 2
+
+def test_get_cart_invalidated_by_product_changes(client, auth_headers, test_product):
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 1}
+    )
+    client.get("/cart/", headers=auth_headers)
+
+    client.put(f"/products/{test_product['id']}", json={"name": "Crema Renovada"})
+    cart = client.get("/cart/", headers=auth_headers).json()
+    assert cart["items"][0]["product_name"] == "Crema Renovada"
+
+def test_get_cart_sees_writes_from_other_workers(client, auth_headers, test_product, cart_backend):
+    from sqlalchemy import text
+    from app.tests.conftest import TestingSessionLocal
+
+    if cart_backend == "memory":
+        pytest.skip("el carrito en proceso no se comparte entre workers")
+
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 1}
+    )
+    assert client.get("/cart/", headers=auth_headers).json()["items"][0]["quantity"] == 1
+
+    # Otro worker cambia el carrito y el producto: solo las filas de version
+    # (cart_state, catalog_state) avisan a este proceso
+    db = TestingSessionLocal()
+    try:
+        db.execute(text("UPDATE cart_items SET quantity = 4"))
+        db.execute(text("UPDATE cart_state SET version = version + 1"))
+        db.commit()
+        cart = client.get("/cart/", headers=auth_headers).json()
+        assert cart["items"][0]["quantity"] == 4
+
+        db.execute(text("UPDATE products SET name = 'Crema Renovada'"))
+        db.execute(text("UPDATE catalog_state SET generation = generation + 1"))
+        db.commit()
+        cart = client.get("/cart/", headers=auth_headers).json()
+        assert cart["items"][0]["product_name"] == "Crema Renovada"
+    finally:
+        db.close()
+
+    client.put(f"/products/{test_product['id']}", json={"is_active": False})
+    assert client.get("/cart/", headers=auth_headers).json()["items_count"] == 0
+
+    client.put(f"/products/{test_product['id']}", json={"is_active": True})
+    assert client.get("/cart/", headers=auth_headers).json()["items_count"] == 1
+
+def test_memory_cart_expires_when_idle(memory_cart_store, monkeypatch):
+    import time as time_module
+
+    memory_cart_store.hset("cart:1", "q:1", 2)
+    memory_cart_store.expire("cart:1", 60)
+    assert memory_cart_store.hget("cart:1", "q:1") == "2"
+
+    later = time_module.monotonic() + 61
+    monkeypatch.setattr("app.services.cart_store.time.monotonic", lambda: later)
+    assert memory_cart_store.purge_expired() == 1
+    assert memory_cart_store.hgetall("cart:1") == {}
+
+def test_memory_cart_concurrent_adds_respect_stock(memory_cart_store):
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+    from app.services.cart_store import KeyValueCartStore
+
+    store = KeyValueCartStore(None, memory_cart_store)
+    product = SimpleNamespace(id=1, price=5000, version=1)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        lines = list(pool.map(lambda _: store.add(1, product, 3, 10), range(8)))
+
+    added = [line for line in lines if line is not None]
+    assert len(added) == 3
+    assert sorted(line.quantity for line in added) == [3, 6, 9]
+    assert memory_cart_store.hget("cart:1", "q:1") == "9"
+
+def test_memory_cart_set_quantities_uses_one_pipeline(memory_cart_store, monkeypatch):
+    from types import SimpleNamespace
+    from app.services.cart_store import InMemoryPipeline, KeyValueCartStore
+
+    store = KeyValueCartStore(None, memory_cart_store)
+    products = {product_id: SimpleNamespace(id=product_id, price=1000, version=1) for product_id in (1, 2, 3)}
+    store.set_quantities(1, {1: 2, 2: 1}, products)
+
+    # Nada se escribe en el carrito antes del unico execute()
+    before_execute = []
+    original_execute = InMemoryPipeline.execute
+
+    def execute(pipe):
+        before_execute.append([(line.product_id, line.quantity) for line in store.get_lines(1)])
+        return original_execute(pipe)
+
+    monkeypatch.setattr(InMemoryPipeline, "execute", execute)
+    store.set_quantities(1, {1: 5, 2: 0, 3: 4}, products)
+
+    assert before_execute == [[(1, 2), (2, 1)]]
+    assert [(line.product_id, line.quantity) for line in store.get_lines(1)] == [(1, 5), (3, 4)]
+
+def test_redis_cart_add_uses_capped_script():
+    from types import SimpleNamespace
+    from app.services.cart_store import HINCRBY_CAPPED, KeyValueCartStore
+
+    calls = []
+
+    class FakeRedis:
+        def register_script(self, script):
+            assert script == HINCRBY_CAPPED
+            return lambda keys, args: calls.append((keys, args)) or -1
+
+    store = KeyValueCartStore(None, FakeRedis())
+    assert store.add(7, SimpleNamespace(id=3, price=1000, version=1), 2, 5) is None
+    assert calls == [(["cart:7"], ["q:3", 2, 5])]
+
+@pytest.fixture
+def reservations(monkeypatch):
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "STOCK_RESERVATIONS_ENABLED", True)
+
+@pytest.fixture
+def second_user_headers(client):
+    client.post("/auth/register", json={
+        "email": "shopper2@test.com",
+        "username": "shopper2",
+        "password": "TestPass123!"
+    })
+    token = client.post("/auth/login", data={
+        "username": "shopper2",
+        "password": "TestPass123!"
+    }).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def _expire_reservations():
+    from datetime import datetime, timedelta
+    from app.tests.conftest import TestingSessionLocal
+    from app.models.reservation import StockReservation
+
+    db = TestingSessionLocal()
+    try:
+        db.query(StockReservation).update(
+            {StockReservation.expires_at: datetime.now() - timedelta(minutes=1)}
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def test_reservation_holds_stock_for_other_carts(client, auth_headers, second_user_headers, test_product, reservations):
+    response = client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 8}
+    )
+    assert response.status_code == 201
+
+    response = client.post(
+        "/cart/items",
+        headers=second_user_headers,
+        json={"product_id": test_product["id"], "quantity": 3}
+    )
+    assert response.status_code == 400
+    assert "Disponible: 2" in response.json()["detail"]
+    assert client.get("/cart/", headers=second_user_headers).json()["items_count"] == 0
+
+    response = client.post(
+        "/cart/items",
+        headers=second_user_headers,
+        json={"product_id": test_product["id"], "quantity": 2}
+    )
+    assert response.status_code == 201
+
+def test_reservation_released_on_remove_and_expiry(client, auth_headers, second_user_headers, test_product, reservations):
+    item = client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 10}
+    ).json()
+
+    client.delete(f"/cart/items/{item['id']}", headers=auth_headers)
+    response = client.post(
+        "/cart/items",
+        headers=second_user_headers,
+        json={"product_id": test_product["id"], "quantity": 10}
+    )
+    assert response.status_code == 201
+
+    # Vencido el hold de shopper2, el stock vuelve a estar disponible sin esperar al sweeper
+    _expire_reservations()
+    response = client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 10}
+    )
+    assert response.status_code == 201
+
+def test_reservation_blocks_checkout_of_held_stock(client, auth_headers, second_user_headers, test_product, reservations):
+    client.post(
+        "/cart/items",
+        headers=second_user_headers,
+        json={"product_id": test_product["id"], "quantity": 4}
+    )
+    _expire_reservations()
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 8}
+    )
+    # shopper2 renueva su hold: ya solo quedan 2 para el resto
+    response = client.put(
+        "/cart/items",
+        headers=second_user_headers,
+        json={"items": [{"product_id": test_product["id"], "quantity": 3}]}
+    )
+    assert response.status_code == 400
+
+    checkout = {
+        "shipping_address": "Av. Libertador 123",
+        "shipping_city": "Santiago",
+        "contact_email": "test@example.com"
+    }
+    assert client.post("/orders/", headers=auth_headers, json=checkout).status_code == 201
+    assert client.get(f"/products/{test_product['id']}").json()["stock"] == 2
+
+def test_sweep_expired_reservations(client, auth_headers, test_product, reservations):
+    from app.tests.conftest import TestingSessionLocal
+    from app.services.stock_reservations import sweep_expired
+
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 1}
+    )
+    _expire_reservations()
+
+    db = TestingSessionLocal()
+    try:
+        assert sweep_expired(db) == 1
+        assert sweep_expired(db) == 0
+    finally:
+        db.close()
+
+def test_reserve_checks_the_flag_for_every_caller(client, test_product, monkeypatch):
+    from app.core.config import settings
+    from app.models.reservation import StockReservation
+    from app.services.stock_reservations import reserve
+    from app.tests.conftest import TestingSessionLocal
+
+    asked = []
+
+    def in_cart(product_id):
+        asked.append(product_id)
+        return 2
+
+    db = TestingSessionLocal()
+    try:
+        monkeypatch.setattr(settings, "STOCK_RESERVATIONS_ENABLED", False)
+        assert reserve(db, 1, {test_product["id"]: 3}, in_cart=in_cart) == {}
+        assert asked == []
+        assert db.query(StockReservation).count() == 0
+
+        monkeypatch.setattr(settings, "STOCK_RESERVATIONS_ENABLED", True)
+        assert reserve(db, 1, {test_product["id"]: 3}, in_cart=in_cart) == {}
+        assert asked == [test_product["id"]]
+        assert db.query(StockReservation.quantity).scalar() == 5
+    finally:
+        db.close()
+
+def test_cart_reports_stale_items_after_price_change(client, auth_headers, test_product):
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_product["id"], "quantity": 2}
+    )
+    assert client.get("/cart/", headers=auth_headers).json()["stale_items"] == []
+
+    # Cambios que no son de precio ni stock no desactualizan la linea
+    client.put(f"/products/{test_product['id']}", json={"name": "Crema Renovada"})
+    assert client.get("/cart/", headers=auth_headers).json()["stale_items"] == []
+
+    client.put(f"/products/{test_product['id']}", json={"price": 6000})
+    stale = client.get("/cart/", headers=auth_headers).json()["stale_items"]
+    assert len(stale) == 1
+    assert stale[0]["price_at_addition"] == test_product["price"]
+    assert stale[0]["current_price"] == 6000
+    assert stale[0]["product_version"] == test_product["version"] + 1
+
+    refreshed = client.post("/cart/refresh", headers=auth_headers).json()
+    assert refreshed["stale_items"] == []
+    assert refreshed["items"][0]["price_at_addition"] == 6000
+    assert refreshed["subtotal"] == 12000
@@ -536,3 +536,344 @@ def test_order_invalid_email(client, auth_headers, cart_with_items):
     
     assert response.status_code == 422
 
+def test_create_order_from_memory_cart(client, auth_headers, test_products, memory_cart_store):
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_products[0]["id"], "quantity": 3}
+    )
+
+    response = client.post("/orders/", headers=auth_headers, json={
+        "shipping_address": "Av. Libertador 123",
+        "shipping_city": "Santiago",
+        "shipping_postal_code": "8320000",
+        "contact_email": "test@example.com",
+        "contact_phone": "+56912345678"
+    })
+
+    assert response.status_code == 201
+    data = response.json()
+    assert data["items"][0]["quantity"] == 3
+    assert data["subtotal"] == test_products[0]["price"] * 3
+
+    assert client.get("/cart/", headers=auth_headers).json()["items_count"] == 0
+    product = client.get(f"/products/{test_products[0]['id']}").json()
+    assert product["stock"] == test_products[0]["stock"] - 3
+
+def test_failed_order_keeps_memory_cart(client, auth_headers, test_products, memory_cart_store, monkeypatch):
+    client.post(
+        "/cart/items",
+        headers=auth_headers,
+        json={"product_id": test_products[0]["id"], "quantity": 3}
+    )
+
+    def fail_release(db, user_id):
+        raise RuntimeError("fallo antes del commit")
+
+    monkeypatch.setattr("app.api.order.release", fail_release)
+    with pytest.raises(RuntimeError):
+        client.post("/orders/", headers=auth_headers, json={
+            "shipping_address": "Av. Libertador 123",
+            "shipping_city": "Santiago",
+            "shipping_postal_code": "8320000",
+            "contact_email": "test@example.com",
+            "contact_phone": "+56912345678"
+        })
+
+    cart = client.get("/cart/", headers=auth_headers).json()
+    assert cart["items_count"] == 1
+    assert cart["items"][0]["quantity"] == 3
+
+def test_concurrent_checkouts_do_not_oversell(client, test_products):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.tests.conftest import TestingSessionLocal
+    from app.core.security import create_access_token
+    from app.models.cart import CartItem
+    from app.models.user import User
+
+    product = test_products[1]
+    buyers = 12
+
+    db = TestingSessionLocal()
+    try:
+        users = [
+            User(email=f"buyer{i}@test.com", username=f"buyer{i}", hashed_password="-")
+            for i in range(buyers)
+        ]
+        db.add_all(users)
+        db.flush()
+        db.add_all([
+            CartItem(user_id=user.id, product_id=product["id"], quantity=1, price_at_addition=product["price"])
+            for user in users
+        ])
+        db.commit()
+        headers = [
+            {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
+            for user in users
+        ]
+    finally:
+        db.close()
+
+    def checkout(buyer_headers):
+        return client.post("/orders/", headers=buyer_headers, json={
+            "shipping_address": "Av. Libertador 123",
+            "shipping_city": "Santiago",
+            "contact_email": "test@example.com"
+        }).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(checkout, headers))
+
+    assert statuses.count(201) == product["stock"]
+    assert statuses.count(400) == buyers - product["stock"]
+    assert client.get(f"/products/{product['id']}").json()["stock"] == 0
+
+def test_create_order_with_many_lines(client, auth_headers):
+    products = [
+        client.post("/products/", json={
+            "name": f"Producto B2B {i}",
+            "description": "Venta mayorista",
+            "price": 1000 + i,
+            "stock": 50,
+            "category": "corporal"
+        }).json()
+        for i in range(35)
+    ]
+    client.put("/cart/items", headers=auth_headers, json={
+        "items": [{"product_id": product["id"], "quantity": 2} for product in products]
+    })
+
+    response = client.post("/orders/", headers=auth_headers, json={
+        "shipping_address": "Av. Libertador 123",
+        "shipping_city": "Santiago",
+        "contact_email": "test@example.com"
+    })
+
+    assert response.status_code == 201
+    created = response.json()
+    assert len(created["items"]) == 35
+    assert created["subtotal"] == sum(product["price"] * 2 for product in products)
+
+    detail = client.get(f"/orders/{created['id']}", headers=auth_headers).json()
+    assert detail["items"] == created["items"]
+    assert detail["created_at"] == created["created_at"]
+    assert client.get(f"/products/{products[0]['id']}").json()["stock"] == 48
+
+ORDER_PAYLOAD = {
+    "shipping_address": "Av. Libertador 123",
+    "shipping_city": "Santiago",
+    "contact_email": "test@example.com"
+}
+
+def test_create_order_idempotency_key_replays_response(client, auth_headers, test_products, cart_with_items):
+    headers = {**auth_headers, "Idempotency-Key": "checkout-1"}
+
+    first = client.post("/orders/", headers=headers, json=ORDER_PAYLOAD)
+    retry = client.post("/orders/", headers=headers, json=ORDER_PAYLOAD)
+
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+    assert len(client.get("/orders/", headers=auth_headers).json()) == 1
+    assert client.get(f"/products/{test_products[0]['id']}").json()["stock"] == 8
+
+def test_create_order_idempotency_key_with_other_body(client, auth_headers, cart_with_items):
+    headers = {**auth_headers, "Idempotency-Key": "checkout-1"}
+    client.post("/orders/", headers=headers, json=ORDER_PAYLOAD)
+
+    response = client.post("/orders/", headers=headers, json={**ORDER_PAYLOAD, "shipping_city": "Valparaíso"})
+
+    assert response.status_code == 422
+
+def test_create_order_idempotency_key_released_on_error(client, auth_headers, test_products):
+    headers = {**auth_headers, "Idempotency-Key": "checkout-1"}
+
+    # Carrito vacio: el error no se guarda y el reintento vuelve a ejecutarse
+    assert client.post("/orders/", headers=headers, json=ORDER_PAYLOAD).status_code == 400
+
+    client.post("/cart/items", headers=auth_headers, json={"product_id": test_products[0]["id"], "quantity": 1})
+    response = client.post("/orders/", headers=headers, json=ORDER_PAYLOAD)
+
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+
+def test_create_order_idempotency_key_completed_with_order(client, auth_headers, test_products, cart_with_items, monkeypatch):
+    from app.models.order import Order
+    from app.services import idempotency
+    from app.tests.conftest import TestingSessionLocal
+
+    headers = {**auth_headers, "Idempotency-Key": "checkout-1"}
+
+    # La respuesta se guarda antes del commit de la orden, en su transaccion
+    seen = []
+    store_response = idempotency._store_response
+
+    def spy(db, *args):
+        other = TestingSessionLocal()
+        try:
+            seen.append((db.query(Order).count(), other.query(Order).count()))
+        finally:
+            other.close()
+        return store_response(db, *args)
+
+    monkeypatch.setattr(idempotency, "_store_response", spy)
+    first = client.post("/orders/", headers=headers, json=ORDER_PAYLOAD)
+    retry = client.post("/orders/", headers=headers, json=ORDER_PAYLOAD)
+
+    assert first.status_code == 201
+    assert seen == [(1, 0)]
+    assert retry.status_code == 201
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(client.get("/orders/", headers=auth_headers).json()) == 1
+
+def test_expired_idempotency_keys_purged_without_cart_reaper(client, auth_headers, cart_with_items):
+    from datetime import datetime, timedelta
+    from app.services.idempotency import IdempotencyKeyReaper
+    from app.tests.conftest import TestingSessionLocal
+
+    client.post("/orders/", headers={**auth_headers, "Idempotency-Key": "checkout-1"}, json=ORDER_PAYLOAD)
+
+    reaper = IdempotencyKeyReaper(session_factory=TestingSessionLocal)
+    assert reaper.run_once() == 0
+    assert reaper.run_once(now=datetime.now() + timedelta(hours=25)) == 1
+
+def test_idempotency_reaper_starts_with_cart_reaper_disabled(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.core.config import settings
+    from app.main import app
+    from app.services.cart_reaper import cart_reaper
+    from app.services.idempotency import idempotency_reaper
+
+    monkeypatch.setattr(settings, "CART_REAPER_ENABLED", False)
+    with TestClient(app):
+        assert cart_reaper.stats()["running"] is False
+        assert idempotency_reaper._thread.is_alive()
+    assert idempotency_reaper._thread is None
+
+def test_concurrent_duplicate_checkouts_run_once(client, auth_headers, test_products, cart_with_items):
+    from concurrent.futures import ThreadPoolExecutor
+
+    headers = {**auth_headers, "Idempotency-Key": "checkout-retry"}
+
+    def checkout(_):
+        response = client.post("/orders/", headers=headers, json=ORDER_PAYLOAD)
+        return response.status_code, response.json().get("id")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(checkout, range(8)))
+
+    assert {status for status, _ in results} == {201}
+    assert len({order_id for _, order_id in results}) == 1
+    assert len(client.get("/orders/", headers=auth_headers).json()) == 1
+    assert client.get(f"/products/{test_products[0]['id']}").json()["stock"] == 8
+
+def test_order_serializer_matches_response_model(client, auth_headers, cart_with_items):
+    from app.tests.conftest import TestingSessionLocal
+    from sqlalchemy.orm import joinedload
+    from app.models.order import Order
+    from app.schemas.order import OrderResponse
+    from app.services.order_serializer import order_response
+
+    created = client.post("/orders/", headers=auth_headers, json=ORDER_PAYLOAD)
+    fetched = client.get(f"/orders/{created.json()['id']}", headers=auth_headers)
+
+    # El RETURNING del checkout y la lectura posterior serializan igual,
+    # byte a byte (2000.0 y no 2000 en los campos float)
+    assert created.content == fetched.content
+    assert b'"unit_price":5000.0' in created.content
+
+    db = TestingSessionLocal()
+    try:
+        order = db.query(Order).options(joinedload(Order.items)).first()
+        assert order_response(order).body == OrderResponse.model_validate(order).model_dump_json().encode()
+    finally:
+        db.close()
+
+def test_get_my_orders_cursor_pagination(client, auth_headers, test_products):
+    created = []
+    for lines in (1, 2, 1):
+        for product in test_products[:lines]:
+            client.post("/cart/items", headers=auth_headers, json={"product_id": product["id"], "quantity": 1})
+        created.append(client.post("/orders/", headers=auth_headers, json=ORDER_PAYLOAD).json())
+
+    first_page = client.get("/orders/?limit=2", headers=auth_headers)
+    assert first_page.status_code == 200
+    cursor = first_page.headers["X-Next-Cursor"]
+
+    second_page = client.get(f"/orders/?limit=2&after={cursor}", headers=auth_headers)
+    assert second_page.status_code == 200
+    assert "X-Next-Cursor" not in second_page.headers
+
+    orders = first_page.json() + second_page.json()
+    assert [order["id"] for order in orders] == [order["id"] for order in reversed(created)]
+    assert [order["items_count"] for order in orders] == [1, 2, 1]
+    assert orders == client.get("/orders/", headers=auth_headers).json()
+
+def test_get_my_orders_invalid_cursor(client, auth_headers):
+    response = client.get("/orders/?limit=2&after=no-es-un-cursor", headers=auth_headers)
+    assert response.status_code == 400
+
+def test_get_my_orders_uses_user_created_index(client):
+    from sqlalchemy import text
+    from app.tests.conftest import engine
+
+    with engine.connect() as conn:
+        plan = " ".join(str(row[-1]) for row in conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM orders WHERE user_id = 1 ORDER BY created_at DESC, id DESC LIMIT 21"
+        )))
+
+    assert "ix_orders_user_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_cancel_order_restores_stock_in_one_update(client, auth_headers, test_products, cart_with_items):
+    from sqlalchemy import event
+    from app.tests.conftest import TestingSessionLocal, engine
+    from app.models.stock_movement import StockMovement
+
+    order_id = client.post("/orders/", headers=auth_headers, json=ORDER_PAYLOAD).json()["id"]
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = client.put(f"/orders/{order_id}/cancel", headers=auth_headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert response.status_code == 200
+    product_writes = [s for s in statements if s.lstrip().upper().startswith("UPDATE PRODUCTS")]
+    assert len(product_writes) == 1
+    assert not any(s.lstrip().upper().startswith("SELECT") and "FROM products" in s for s in statements)
+
+    assert client.get(f"/products/{test_products[0]['id']}").json()["stock"] == test_products[0]["stock"]
+    assert client.get(f"/products/{test_products[1]['id']}").json()["stock"] == test_products[1]["stock"]
+
+    db = TestingSessionLocal()
+    try:
+        movements = sorted(
+            (m.product_id, m.quantity, m.reason.value)
+            for m in db.query(StockMovement).filter(StockMovement.order_id == order_id)
+        )
+    finally:
+        db.close()
+
+    assert movements == sorted([
+        (test_products[0]["id"], -2, "sale"),
+        (test_products[0]["id"], 2, "cancellation"),
+        (test_products[1]["id"], -1, "sale"),
+        (test_products[1]["id"], 1, "cancellation"),
+    ])
+
+def test_cancel_order_twice_restores_stock_once(client, auth_headers, test_products):
+    client.post("/cart/items", headers=auth_headers, json={"product_id": test_products[0]["id"], "quantity": 3})
+    order_id = client.post("/orders/", headers=auth_headers, json=ORDER_PAYLOAD).json()["id"]
+
+    assert client.put(f"/orders/{order_id}/cancel", headers=auth_headers).status_code == 200
+    assert client.put(f"/orders/{order_id}/cancel", headers=auth_headers).status_code == 400
+
+    assert client.get(f"/products/{test_products[0]['id']}").json()["stock"] == test_products[0]["stock"]
@@ -320,4 +320,123 @@ def test_create_payment_intent_other_user_order(client, test_products):
         json={"order_id": order["id"]}
     )
     
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+@patch('app.services.stripe_service.stripe.PaymentIntent.create')
+def test_create_payment_intent_idempotency_key(mock_create, client, auth_headers, test_order):
+    """A retried request with the same Idempotency-Key does not call Stripe again"""
+    mock_payment_intent = MagicMock()
+    mock_payment_intent.id = "pi_test_123"
+    mock_payment_intent.client_secret = "pi_test_123_secret_abc"
+    mock_payment_intent.amount = int(test_order["total"])
+    mock_payment_intent.currency = "clp"
+    mock_create.return_value = mock_payment_intent
+
+    headers = {**auth_headers, "Idempotency-Key": "pay-1"}
+    first = client.post("/payments/create-payment-intent", headers=headers, json={"order_id": test_order["id"]})
+    retry = client.post("/payments/create-payment-intent", headers=headers, json={"order_id": test_order["id"]})
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    mock_create.assert_called_once()
+
+
+@patch('app.services.stripe_service.stripe.Webhook.construct_event')
+def test_webhook_payment_succeeded_for_cancelled_order(mock_construct, client, auth_headers, test_order):
+    """A late payment webhook does not reopen a cancelled order"""
+    from app.tests.conftest import engine
+
+    mock_construct.return_value = {
+        'type': 'payment_intent.succeeded',
+        'data': {'object': {'id': 'pi_test_456', 'amount': int(test_order["total"]), 'currency': 'clp'}}
+    }
+    update_order_in_test_db(test_order["id"], {"payment_id": "pi_test_456"}, engine)
+    client.put(f"/orders/{test_order['id']}/cancel", headers=auth_headers)
+
+    response = client.post(
+        "/payments/webhook",
+        headers={"stripe-signature": "test_signature"},
+        content=b'{"type":"payment_intent.succeeded"}'
+    )
+
+    assert response.status_code == 200
+    order = client.get(f"/orders/{test_order['id']}", headers=auth_headers).json()
+    assert order["status"] == "cancelled"
+    assert order["paid_at"] is None
+
+
+@patch('app.services.stripe_service.stripe.PaymentIntent.retrieve')
+@patch('app.services.stripe_service.stripe.PaymentIntent.create')
+def test_stripe_checkout_precreates_payment_intent(mock_create, mock_retrieve, client, auth_headers, test_products):
+    """A Stripe checkout creates the Payment Intent in the job queue, off the request"""
+    from app.services.job_queue import job_queue
+
+    payment_intent = MagicMock()
+    payment_intent.id = "pi_precreated"
+    payment_intent.client_secret = "pi_precreated_secret"
+    payment_intent.amount = 11900
+    payment_intent.currency = "clp"
+    payment_intent.status = "requires_payment_method"
+    mock_create.return_value = payment_intent
+    mock_retrieve.return_value = payment_intent
+
+    client.post("/cart/items", headers=auth_headers, json={"product_id": test_products[0]["id"], "quantity": 1})
+    order = client.post("/orders/", headers=auth_headers, json={
+        "shipping_address": "Av. Libertador 123",
+        "shipping_city": "Santiago",
+        "contact_email": "test@example.com",
+        "payment_method": "stripe"
+    }).json()
+    assert job_queue.join(timeout=5)
+
+    response = client.post("/payments/create-payment-intent", headers=auth_headers, json={"order_id": order["id"]})
+
+    assert response.status_code == 200
+    assert response.json()["payment_intent_id"] == "pi_precreated"
+    mock_create.assert_called_once()
+
+
+@patch('app.services.stripe_service.stripe.PaymentIntent.retrieve')
+@patch('app.services.stripe_service.stripe.PaymentIntent.create')
+def test_payment_intent_job_and_endpoint_share_idempotency_key(mock_create, mock_retrieve, client, auth_headers, test_products):
+    """The checkout job and the endpoint racing it send the same Stripe idempotency key"""
+    from app.models.order import Order
+    from app.services.job_queue import job_queue
+    from app.tests.conftest import TestingSessionLocal
+
+    payment_intent = MagicMock()
+    payment_intent.id = "pi_shared"
+    payment_intent.client_secret = "pi_shared_secret"
+    payment_intent.amount = 11900
+    payment_intent.currency = "clp"
+    mock_create.return_value = payment_intent
+
+    client.post("/cart/items", headers=auth_headers, json={"product_id": test_products[0]["id"], "quantity": 1})
+    order = client.post("/orders/", headers=auth_headers, json={
+        "shipping_address": "Av. Libertador 123",
+        "shipping_city": "Santiago",
+        "contact_email": "test@example.com",
+        "payment_method": "stripe"
+    }).json()
+    assert job_queue.join(timeout=5)
+
+    # El endpoint leyo la orden antes de que el job guardara su intent
+    db = TestingSessionLocal()
+    try:
+        db.query(Order).filter(Order.id == order["id"]).update({Order.payment_id: None})
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.post("/payments/create-payment-intent", headers=auth_headers, json={"order_id": order["id"]})
+
+    assert response.status_code == 200
+    keys = [call.kwargs["idempotency_key"] for call in mock_create.call_args_list]
+    assert keys == [f"order-{order['id']}-payment-intent"] * 2
+
+    # Un intent que no se puede reutilizar se reemplaza con otra clave
+    mock_retrieve.return_value = MagicMock(status="canceled")
+    client.post("/payments/create-payment-intent", headers=auth_headers, json={"order_id": order["id"]})
+    assert mock_create.call_args.kwargs["idempotency_key"] == f"order-{order['id']}-payment-intent-replaces-pi_shared"
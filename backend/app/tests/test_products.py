@@ -1,3 +1,5 @@
+import pytest
+
 def test_get_products_empty(client):
     response = client.get("/products/")
     assert response.status_code == 200
@@ -157,3 +159,494 @@ def test_invalid_category(client):
     })
 
     assert response.status_code == 422
+
+def test_search_prefix_match(client):
+    client.post("/products/", json={
+        "name": "Crema Hidratante de Rosa",
+        "description": "Hidratación profunda",
+        "price": 3500,
+        "stock": 5,
+        "category": "facial"
+    })
+
+    response = client.get("/products/?search=hidra")
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+    response = client.get("/products/?search=hidratacion")
+    assert len(response.json()) == 1
+
+def test_search_ranks_name_matches_first(client):
+    client.post("/products/", json={
+        "name": "Aceite Corporal",
+        "description": "Con extracto de argán",
+        "price": 2990,
+        "stock": 5,
+        "category": "corporal"
+    })
+    client.post("/products/", json={
+        "name": "Champú de Argán",
+        "description": "Cabello suave",
+        "price": 10000,
+        "stock": 5,
+        "category": "cabello"
+    })
+
+    response = client.get("/products/?search=argan")
+    results = response.json()
+    assert len(results) == 2
+    assert results[0]["name"] == "Champú de Argán"
+
+def test_search_index_follows_updates(client):
+    create_response = client.post("/products/", json={
+        "name": "Serum Vitamina C",
+        "description": "Antioxidante",
+        "price": 4500,
+        "stock": 5,
+        "category": "facial"
+    })
+    product_id = create_response.json()["id"]
+
+    client.put(f"/products/{product_id}", json={"name": "Serum Niacinamida"})
+
+    assert client.get("/products/?search=vitamina").json() == []
+    assert len(client.get("/products/?search=niacinamida").json()) == 1
+
+def test_search_index_rebuilds_only_when_out_of_sync(client):
+    from sqlalchemy import event, text
+    from app.services.catalog_cache import catalog_cache
+    from app.services.search_service import FTS_TABLE, ensure_search_index
+    from app.tests.conftest import engine
+
+    client.post("/products/", json={
+        "name": "Aceite de Rosa Mosqueta",
+        "description": "Regenerador",
+        "price": 5200,
+        "stock": 5,
+        "category": "facial"
+    })
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        # Indice al dia: no se reconstruye
+        ensure_search_index(engine)
+        assert not any("'rebuild'" in statement for statement in statements)
+
+        # Una fila que el indice no tiene (ej. escrita antes del trigger)
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+                "SELECT 'delete', id, name, description FROM products"
+            ))
+        assert client.get("/products/?search=mosqueta").json() == []
+
+        ensure_search_index(engine)
+        assert any("'rebuild'" in statement for statement in statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    catalog_cache.clear()
+    assert len(client.get("/products/?search=mosqueta").json()) == 1
+
+def _create_catalog(client, prices):
+    for i, price in enumerate(prices):
+        client.post("/products/", json={
+            "name": f"Producto {i}",
+            "description": "Test Description",
+            "price": price,
+            "stock": 5,
+            "category": "facial"
+        })
+
+def test_paginate_products_by_price(client):
+    _create_catalog(client, [5000, 1000, 3000, 3000, 2000])
+
+    seen = []
+    response = client.get("/products/?sort=price&limit=2")
+    while True:
+        assert response.status_code == 200
+        seen.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        response = client.get(f"/products/?sort=price&limit=2&after={cursor}")
+
+    assert [p["price"] for p in seen] == [1000, 2000, 3000, 3000, 5000]
+    assert len({p["id"] for p in seen}) == 5
+
+def test_paginate_products_descending(client):
+    _create_catalog(client, [5000, 1000, 3000])
+
+    first_page = client.get("/products/?sort=-price&limit=2")
+    assert [p["price"] for p in first_page.json()] == [5000, 3000]
+    assert 'rel="next"' in first_page.headers["Link"]
+
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get(f"/products/?sort=-price&limit=2&after={cursor}")
+    assert [p["price"] for p in second_page.json()] == [1000]
+    assert "X-Next-Cursor" not in second_page.headers
+
+def test_paginate_products_invalid_cursor(client):
+    response = client.get("/products/?limit=2&after=no-es-un-cursor")
+    assert response.status_code == 400
+
+def test_paginate_products_cursor_sort_mismatch(client):
+    _create_catalog(client, [5000, 1000, 3000])
+
+    cursor = client.get("/products/?sort=price&limit=1").headers["X-Next-Cursor"]
+    response = client.get(f"/products/?sort=name&limit=1&after={cursor}")
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("sort,value,last_id", [
+    ("price", "caro", 1),
+    ("price", True, 1),
+    ("-name", 3000, 1),
+    ("price", 3000, "1"),
+    ("id", None, None),
+])
+def test_paginate_products_cursor_value_type_mismatch(client, sort, value, last_id):
+    from app.core.pagination import encode_cursor
+
+    _create_catalog(client, [5000, 1000, 3000])
+
+    cursor = encode_cursor({"sort": sort, "value": value, "id": last_id})
+    response = client.get(f"/products/?sort={sort}&limit=1&after={cursor}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor de paginación inválido"
+
+def test_sort_by_relevance_requires_search(client):
+    response = client.get("/products/?sort=relevance")
+    assert response.status_code == 400
+
+def test_paginate_search_results_by_relevance(client):
+    _create_catalog(client, [1000, 2000, 3000])
+
+    first_page = client.get("/products/?search=producto&limit=2")
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get(f"/products/?search=producto&limit=2&after={cursor}")
+
+    ids = [p["id"] for p in first_page.json() + second_page.json()]
+    assert len(ids) == 3
+    assert len(set(ids)) == 3
+
+def test_catalog_cache_hits_and_invalidation(client):
+    from app.services.catalog_cache import catalog_cache
+
+    create_response = client.post("/products/", json={
+        "name": "Test Product Facial",
+        "description": "Test Description",
+        "price": 7000,
+        "stock": 5,
+        "category": "facial"
+    })
+    product_id = create_response.json()["id"]
+
+    before = catalog_cache.stats()["lists"]
+    client.get("/products/?category=facial")
+    client.get("/products/?category=facial")
+    after = catalog_cache.stats()["lists"]
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+    client.put(f"/products/{product_id}", json={"price": 9000})
+
+    response = client.get("/products/?category=facial")
+    assert response.json()[0]["price"] == 9000
+    assert client.get(f"/products/{product_id}").json()["price"] == 9000
+
+def test_catalog_cache_follows_writes_from_other_workers(client):
+    from app.models.product import Product
+    from app.services.catalog_cache import CatalogCache
+    from app.tests.conftest import TestingSessionLocal
+
+    create_response = client.post("/products/", json={
+        "name": "Test Product Facial",
+        "description": "Test Description",
+        "price": 7000,
+        "stock": 5,
+        "category": "facial"
+    })
+    product_id = create_response.json()["id"]
+    assert client.get("/products/?category=facial").json()[0]["price"] == 7000
+    assert client.get(f"/products/{product_id}").json()["price"] == 7000
+
+    # Otro worker: su propia cache, la misma base
+    other_worker = CatalogCache(maxsize=10, ttl=60)
+    db = TestingSessionLocal()
+    db.query(Product).filter(Product.id == product_id).update({Product.price: 9000})
+    other_worker.mark_changed(db, [product_id])
+    db.commit()
+    db.close()
+
+    assert client.get("/products/?category=facial").json()[0]["price"] == 9000
+    assert client.get(f"/products/{product_id}").json()["price"] == 9000
+
+def test_catalog_cache_keeps_entries_on_rollback(client):
+    from app.services.catalog_cache import catalog_cache
+    from app.tests.conftest import TestingSessionLocal
+
+    _create_catalog(client, [1000])
+    client.get("/products/")
+    generation = catalog_cache.stats()["generation"]
+
+    db = TestingSessionLocal()
+    catalog_cache.mark_changed(db)
+    db.rollback()
+    db.close()
+
+    before = catalog_cache.stats()["lists"]
+    client.get("/products/")
+    assert catalog_cache.stats()["lists"]["hits"] - before["hits"] == 1
+    assert catalog_cache.stats()["generation"] == generation
+
+def test_catalog_cache_is_bounded():
+    from app.services.catalog_cache import LRUCache
+
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+def test_products_conditional_get(client):
+    client.post("/products/", json={
+        "name": "Test Product Facial",
+        "description": "Test Description",
+        "price": 7000,
+        "stock": 5,
+        "category": "facial"
+    })
+
+    _age_catalog_change(seconds=2)
+
+    response = client.get("/products/")
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    cached = client.get("/products/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    cached = client.get("/products/", headers={"If-Modified-Since": response.headers["Last-Modified"]})
+    assert cached.status_code == 304
+
+def _age_catalog_change(seconds):
+    """Mover la hora del ultimo cambio del catalogo hacia atras"""
+    from datetime import timedelta
+    from app.models.catalog_state import CatalogState
+    from app.tests.conftest import TestingSessionLocal
+
+    db = TestingSessionLocal()
+    state = db.query(CatalogState).one()
+    state.changed_at -= timedelta(seconds=seconds)
+    db.commit()
+    db.close()
+
+def test_products_last_modified_waits_for_the_second_to_end(client):
+    from datetime import datetime, timezone
+    from app.core.http_cache import stable_last_modified
+
+    changed_at = datetime(2024, 5, 1, 12, 0, 0, 300000, tzinfo=timezone.utc)
+    assert stable_last_modified(changed_at, now=changed_at.replace(microsecond=900000)) is None
+    assert stable_last_modified(changed_at, now=changed_at.replace(second=1)) == changed_at.replace(microsecond=0)
+
+    # Recien escrito: sin Last-Modified, solo ETag
+    _create_catalog(client, [1000])
+    response = client.get("/products/")
+    assert "Last-Modified" not in response.headers
+    assert "ETag" in response.headers
+
+def test_products_etag_is_stable_across_workers(client):
+    from app.services.catalog_cache import catalog_cache
+
+    _create_catalog(client, [1000, 2000])
+    etag = client.get("/products/").headers["ETag"]
+
+    # Otro worker o un reinicio: cache vacia, misma base
+    catalog_cache.clear()
+    assert client.get("/products/", headers={"If-None-Match": etag}).status_code == 304
+
+def test_product_if_none_match_star(client):
+    _create_catalog(client, [1000])
+    product_id = client.get("/products/").json()[0]["id"]
+
+    assert client.get(f"/products/{product_id}", headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get("/products/5000", headers={"If-None-Match": "*"}).status_code == 404
+
+def test_product_etag_changes_after_write(client):
+    create_response = client.post("/products/", json={
+        "name": "Test Product Facial",
+        "description": "Test Description",
+        "price": 7000,
+        "stock": 5,
+        "category": "facial"
+    })
+    product_id = create_response.json()["id"]
+
+    etag = client.get(f"/products/{product_id}").headers["ETag"]
+    assert client.get(f"/products/{product_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(f"/products/{product_id}", json={"stock": 1})
+
+    response = client.get(f"/products/{product_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["stock"] == 1
+    assert response.headers["ETag"] != etag
+
+@pytest.mark.parametrize("category,min_price,max_price,sort", [
+    ("facial", None, None, "price"),
+    ("facial", 1000, 5000, "price"),
+    ("facial", 1000, None, "-price"),
+    (None, 1000, 5000, "price"),
+    (None, None, None, "name"),
+])
+def test_product_filters_use_indexes(client, category, min_price, max_price, sort):
+    from sqlalchemy import event
+    from app.api.products import build_products_query
+    from app.schemas.product import ProductCategoryEnum
+    from app.tests.conftest import TestingSessionLocal, engine
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    db = TestingSessionLocal()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        query, _, _ = build_products_query(
+            db,
+            ProductCategoryEnum(category) if category else None,
+            None, min_price, max_price, sort
+        )
+        query.limit(24).all()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[0]
+    plan = [row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+    db.close()
+
+    assert any("USING INDEX ix_products_active" in step for step in plan)
+
+def test_startup_analyze_runs_only_after_new_indexes(client):
+    from sqlalchemy import event
+    from app.core.database import analyze_database
+    from app.tests.conftest import engine
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        analyze_database(engine, indexes_created=True)
+        assert "ANALYZE" in statements
+
+        # Arranque normal con estadisticas vigentes: sin ANALYZE completo
+        statements.clear()
+        analyze_database(engine)
+        assert "PRAGMA optimize" in statements
+        assert "ANALYZE" not in statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+def test_get_products_batch(client):
+    ids = []
+    for name in ["Producto A", "Producto B", "Producto C"]:
+        ids.append(client.post("/products/", json={
+            "name": name,
+            "description": "Test Description",
+            "price": 7000,
+            "stock": 5,
+            "category": "facial"
+        }).json()["id"])
+
+    requested = [ids[2], 99999, ids[0], ids[2]]
+    response = client.get(f"/products/batch?ids={','.join(map(str, requested))}")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [p["id"] for p in data["items"]] == [ids[2], ids[0]]
+    assert data["missing"] == [99999]
+
+def test_get_products_batch_limits(client):
+    response = client.get("/products/batch?ids=1,a")
+    assert response.status_code == 422
+
+    too_many = ",".join(str(i) for i in range(1, 202))
+    response = client.get(f"/products/batch?ids={too_many}")
+    assert response.status_code == 400
+
+def test_product_facets(client):
+    for name, price, category in [
+        ("Crema A", 3000, "facial"),
+        ("Crema B", 7000, "facial"),
+        ("Aceite", 12000, "corporal"),
+        ("Champu", 4000, "cabello"),
+    ]:
+        client.post("/products/", json={
+            "name": name,
+            "description": "Test Description",
+            "price": price,
+            "stock": 5,
+            "category": category
+        })
+
+    response = client.get("/products/facets?bucket_size=5000")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 4
+    assert data["min_price"] == 3000
+    assert data["max_price"] == 12000
+    assert {c["category"]: c["count"] for c in data["categories"]} == {
+        "facial": 2, "corporal": 1, "cabello": 1
+    }
+    assert [(b["min_price"], b["count"]) for b in data["histogram"]] == [
+        (0, 2), (5000, 1), (10000, 1)
+    ]
+
+def test_product_facets_exclude_own_filter(client):
+    for name, price, category in [
+        ("Crema A", 3000, "facial"),
+        ("Crema B", 7000, "facial"),
+        ("Aceite", 4000, "corporal"),
+    ]:
+        client.post("/products/", json={
+            "name": name,
+            "description": "Test Description",
+            "price": price,
+            "stock": 5,
+            "category": category
+        })
+
+    data = client.get("/products/facets?category=facial&max_price=5000").json()
+
+    # Conteo de categorias con el rango de precio pero sin filtro de categoria
+    assert {c["category"]: c["count"] for c in data["categories"]} == {"facial": 1, "corporal": 1}
+    # Histograma de la categoria sin filtro de precio
+    assert sum(b["count"] for b in data["histogram"]) == 2
+    assert data["total"] == 1
+    assert data["min_price"] == data["max_price"] == 3000
+
+def test_product_version_bumps_on_price_and_stock_changes(client):
+    product = client.post("/products/", json={
+        "name": "Tonico",
+        "description": "Tonico facial",
+        "price": 4000,
+        "stock": 10,
+        "category": "facial"
+    }).json()
+    assert product["version"] == 1
+
+    assert client.put(f"/products/{product['id']}", json={"description": "Nuevo"}).json()["version"] == 1
+    assert client.put(f"/products/{product['id']}", json={"price": 4500}).json()["version"] == 2
+    assert client.put(f"/products/{product['id']}", json={"stock": 3}).json()["version"] == 3
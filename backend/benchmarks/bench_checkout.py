@@ -0,0 +1,119 @@
+"""
+Benchmark de checkouts concurrentes (POST /orders/)
+
+Crea en una base SQLite temporal un catalogo con poco stock y un carrito
+por comprador, lanza todos los checkouts desde un pool de hilos y reporta
+throughput, pedidos aceptados/rechazados y unidades sobrevendidas (debe
+ser 0: el descuento de stock es un UPDATE condicional).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_checkout --buyers 400 --threads 1 4 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, get_db
+from app.core.security import create_access_token
+from app.main import app
+from app.models import CartItem, Order, Product, User
+
+ORDER = {
+    "shipping_address": "Av. Libertador 123",
+    "shipping_city": "Santiago",
+    "contact_email": "bench@example.com"
+}
+
+
+def seed(session, products: int, stock: int, buyers: int, lines: int):
+    random.seed(42)
+    session.add_all([
+        Product(name=f"Producto {i}", description="Bench", price=1000 + i, stock=stock)
+        for i in range(products)
+    ])
+    users = [User(email=f"bench{i}@example.com", username=f"bench{i}", hashed_password="-") for i in range(buyers)]
+    session.add_all(users)
+    session.flush()
+
+    product_ids = [product_id for (product_id,) in session.query(Product.id)]
+    session.add_all([
+        CartItem(user_id=user.id, product_id=product_id, quantity=1, price_at_addition=1000)
+        for user in users
+        for product_id in random.sample(product_ids, lines)
+    ])
+    session.commit()
+    return [{"Authorization": f"Bearer {create_access_token({'sub': user.username})}"} for user in users]
+
+
+def run(threads: int, args) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), "bench_checkout.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=threads, max_overflow=threads)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    with Session() as session:
+        headers = seed(session, args.products, args.stock, args.buyers, args.lines)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(lambda h: client.post("/orders/", headers=h, json=ORDER).status_code, headers))
+    elapsed = time.perf_counter() - started
+
+    app.dependency_overrides.pop(get_db, None)
+    with Session() as session:
+        sold = session.query(func.coalesce(func.sum(args.stock - Product.stock), 0)).scalar()
+        negative = session.query(func.count(Product.id)).filter(Product.stock < 0).scalar()
+        orders = session.query(func.count(Order.id)).scalar()
+    engine.dispose()
+
+    return {
+        "threads": threads,
+        "elapsed": elapsed,
+        "throughput": len(statuses) / elapsed,
+        "accepted": statuses.count(201),
+        "rejected": statuses.count(400),
+        "errors": len(statuses) - statuses.count(201) - statuses.count(400),
+        "orders": orders,
+        "units_sold": sold,
+        "negative_stock": negative,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=400)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--stock", type=int, default=30)
+    parser.add_argument("--lines", type=int, default=3, help="lineas por carrito")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{args.buyers} compradores, {args.products} productos x {args.stock} unidades, {args.lines} lineas por carrito")
+    print(f"{'hilos':>6}{'checkouts/s':>14}{'aceptados':>11}{'rechazados':>12}{'errores':>9}{'vendidas':>10}{'stock<0':>9}")
+    for threads in args.threads:
+        r = run(threads, args)
+        print(
+            f"{r['threads']:>6}{r['throughput']:>14.1f}{r['accepted']:>11}{r['rejected']:>12}"
+            f"{r['errors']:>9}{r['units_sold']:>10}{r['negative_stock']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
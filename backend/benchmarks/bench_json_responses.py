@@ -0,0 +1,122 @@
+"""
+Benchmark de serializacion de respuestas JSON
+
+Compara, sobre los payloads mas grandes de la API, el camino estandar de
+FastAPI (validar contra response_model + jsonable + json.dumps), el mismo
+camino con ORJSONResponse, y json_response (model_dump_json directo).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_json_responses
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.core.responses import json_response
+from app.schemas.cart import CartItemResponse, CartSummary
+from app.schemas.order import OrderItemResponse, OrderResponse
+from app.schemas.product import ProductResponse
+
+
+def build_products(count: int) -> List[ProductResponse]:
+    return [
+        ProductResponse(
+            id=i,
+            name=f"Crema Hidratante {i}",
+            description="Crema facial con extracto de rosa orgánica. Hidratación profunda.",
+            price=3500 + i,
+            stock=50,
+            category="facial",
+            image_url="https://example.com/image.jpg",
+            image_urls=None,
+            is_active=True
+        )
+        for i in range(count)
+    ]
+
+
+def build_orders(count: int, items: int) -> List[OrderResponse]:
+    now = datetime.now()
+    return [
+        OrderResponse(
+            id=i, user_id=1, subtotal=10000, tax=1900, total=11900, status="pending",
+            shipping_address="Av. Libertador 123", shipping_city="Santiago",
+            shipping_postal_code="8320000", contact_email="test@example.com",
+            contact_phone="+56912345678", created_at=now, updated_at=now,
+            paid_at=None, shipped_at=None, delivered_at=None, cancelled_at=None,
+            payment_method="stripe", payment_id="pi_123",
+            items=[
+                OrderItemResponse(
+                    id=i * items + j, product_id=j, product_name=f"Producto {j}",
+                    product_description="Descripción", product_image_url=None,
+                    unit_price=1000, quantity=1, subtotal=1000
+                )
+                for j in range(items)
+            ]
+        )
+        for i in range(count)
+    ]
+
+
+def build_cart(items: int) -> CartSummary:
+    return CartSummary(
+        items=[
+            CartItemResponse(
+                id=i, product_id=i, product_name=f"Producto {i}", product_price=1000,
+                product_image_url=None, quantity=2, price_at_addition=1000, subtotal=2000
+            )
+            for i in range(items)
+        ],
+        subtotal=2000 * items, tax=380 * items, total=2380 * items, items_count=items
+    )
+
+
+def fastapi_path(response_model, response_class, loop):
+    field = create_model_field(name="Response", type_=response_model, mode="serialization")
+
+    def render(content):
+        serialized = loop.run_until_complete(serialize_response(field=field, response_content=content))
+        return response_class(serialized).body
+
+    return render
+
+
+def measure(render, content, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(content)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    payloads = [
+        ("GET /products (1000 productos)", List[ProductResponse], build_products(1000)),
+        ("GET /admin/orders (100 órdenes x 10 items)", List[OrderResponse], build_orders(100, 10)),
+        ("GET /cart (50 items)", CartSummary, build_cart(50)),
+    ]
+
+    loop = asyncio.new_event_loop()
+    print(f"{'payload':<45}{'JSONResponse':>14}{'ORJSON':>12}{'json_response':>15}{'speedup':>10}")
+    for label, response_model, content in payloads:
+        baseline = measure(fastapi_path(response_model, JSONResponse, loop), content, args.repeat)
+        orjson_default = measure(fastapi_path(response_model, ORJSONResponse, loop), content, args.repeat)
+        direct = measure(lambda c: json_response(c).body, content, args.repeat)
+        print(f"{label:<45}{baseline:>11.2f} ms{orjson_default:>9.2f} ms{direct:>12.2f} ms{baseline / direct:>9.1f}x")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
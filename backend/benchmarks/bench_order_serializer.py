@@ -0,0 +1,102 @@
+"""
+Benchmark de serializacion de ordenes
+
+Compara, para ordenes de 1, 10 y 100 items y para el listado admin de 100
+ordenes, tres formas de pasar de objetos ORM a JSON: construir OrderResponse
+y OrderItemResponse campo a campo (lo que hacian las rutas), validar con
+OrderResponse.model_validate (from_attributes) y el serializador compartido
+de app.services.order_serializer (__dict__ + orjson). Los objetos se
+arman con todos sus atributos, como quedan al cargarlos de la base.
+Verifica que los tres produzcan los mismos bytes.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_order_serializer
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+from typing import List
+
+from app.core.responses import dump_json
+from app.models import Order, OrderItem, OrderStatus
+from app.schemas.order import OrderItemResponse, OrderResponse
+from app.services.order_serializer import ITEM_FIELDS, ORDER_FIELDS, orders_response
+
+
+def build_order(order_id: int, items: int) -> Order:
+    now = datetime.now()
+    order = Order(
+        id=order_id, user_id=1, subtotal=10000.0, tax=1900.0, total=11900.0,
+        status=OrderStatus.PAID, shipping_address="Av. Libertador 123",
+        shipping_city="Santiago", shipping_postal_code="8320000",
+        contact_email="test@example.com", contact_phone="+56912345678",
+        created_at=now, updated_at=now, paid_at=now,
+        shipped_at=None, delivered_at=None, cancelled_at=None,
+        payment_method="stripe", payment_id="pi_123"
+    )
+    order.items = [
+        OrderItem(
+            id=order_id * items + j, order_id=order_id, product_id=j,
+            product_name=f"Producto {j}", product_description="Descripción",
+            product_image_url=None, unit_price=1000.0, quantity=1, subtotal=1000.0
+        )
+        for j in range(items)
+    ]
+    return order
+
+
+def hand_built(order: Order) -> OrderResponse:
+    return OrderResponse(
+        **{name: getattr(order, name) for name in ORDER_FIELDS},
+        items=[
+            OrderItemResponse(**{name: getattr(item, name) for name in ITEM_FIELDS})
+            for item in order.items
+        ]
+    )
+
+
+def render_hand_built(orders: List[Order]) -> bytes:
+    return dump_json([hand_built(order) for order in orders])
+
+
+def render_validated(orders: List[Order]) -> bytes:
+    return dump_json([OrderResponse.model_validate(order) for order in orders])
+
+
+def render_serializer(orders: List[Order]) -> bytes:
+    return orders_response(orders).body
+
+
+def measure(render, orders, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(orders)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    payloads = [
+        ("1 orden x 1 item", [build_order(1, 1)]),
+        ("1 orden x 10 items", [build_order(1, 10)]),
+        ("1 orden x 100 items", [build_order(1, 100)]),
+        ("GET /admin/orders (100 ordenes x 10 items)", [build_order(i, 10) for i in range(100)]),
+    ]
+
+    print(f"{'payload':<45}{'a mano':>11}{'validate':>12}{'serializer':>13}{'speedup':>10}")
+    for label, orders in payloads:
+        assert render_hand_built(orders) == render_validated(orders) == render_serializer(orders)
+        baseline = measure(render_hand_built, orders, args.repeat)
+        validated = measure(render_validated, orders, args.repeat)
+        direct = measure(render_serializer, orders, args.repeat)
+        print(f"{label:<45}{baseline:>8.3f} ms{validated:>9.3f} ms{direct:>10.3f} ms{baseline / direct:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark de los filtros de GET /products
+
+Crea un catalogo sintetico en una base SQLite temporal, recorre todas las
+combinaciones de filtros/orden que acepta get_products y para cada una
+muestra el EXPLAIN QUERY PLAN y la latencia mediana de la primera pagina.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_product_filters --rows 50000
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, analyze_database
+from app.models import Product, ProductCategory
+from app.schemas.product import ProductCategoryEnum
+from app.api.products import build_products_query
+
+WORDS = ["crema", "serum", "aceite", "champu", "exfoliante", "rosa", "coco", "argan", "cafe", "vitamina"]
+
+CATEGORIES = [None, ProductCategoryEnum.FACIAL]
+SEARCHES = [None, "crema"]
+MIN_PRICES = [None, 5000.0]
+MAX_PRICES = [None, 15000.0]
+SORTS = ["id", "price", "-price", "name"]
+
+
+def seed_catalog(session, rows: int, inactive_ratio: float):
+    random.seed(42)
+    categories = list(ProductCategory)
+    session.bulk_insert_mappings(Product, [
+        {
+            "name": " ".join(random.sample(WORDS, 3)) + f" {i}",
+            "description": " ".join(random.choices(WORDS, k=12)),
+            "price": float(random.randint(1000, 20000)),
+            "stock": random.randint(0, 100),
+            "is_active": random.random() >= inactive_ratio,
+            "category": random.choice(categories),
+        }
+        for i in range(rows)
+    ])
+    session.commit()
+
+
+def capture_statement(engine, session, query):
+    """Ejecutar la query y devolver el SQL y los parametros que envio el driver"""
+    captured = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.setdefault("statement", (statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        query.all()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return captured["statement"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--inactive-ratio", type=float, default=0.1)
+    parser.add_argument("--page-size", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_products.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+        seed_catalog(session, args.rows, args.inactive_ratio)
+    analyze_database(engine)
+
+    print(f"Catalogo: {args.rows} productos ({args.inactive_ratio:.0%} inactivos), pagina de {args.page_size}\n")
+
+    unindexed = 0
+    combinations = list(itertools.product(CATEGORIES, SEARCHES, MIN_PRICES, MAX_PRICES, SORTS))
+    with Session() as session:
+        for category, search, min_price, max_price, sort in combinations:
+            query, _, _ = build_products_query(session, category, search, min_price, max_price, sort)
+            query = query.limit(args.page_size)
+
+            statement, parameters = capture_statement(engine, session, query)
+            with engine.connect() as conn:
+                plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                query.all()
+                timings.append((time.perf_counter() - started) * 1000)
+            session.expunge_all()
+
+            # Recorrer products sin indice solo es aceptable si el orden de la
+            # clave primaria permite cortar en la primera pagina
+            if "SCAN products" in plan and any(step.startswith("USE TEMP B-TREE") for step in plan):
+                unindexed += 1
+
+            label = ", ".join(
+                f"{name}={value.value if hasattr(value, 'value') else value}"
+                for name, value in [("category", category), ("search", search),
+                                    ("min_price", min_price), ("max_price", max_price), ("sort", sort)]
+                if value is not None
+            )
+            print(f"{label}\n    {statistics.median(timings):.3f} ms (mediana)")
+            for step in plan:
+                print(f"    {step}")
+
+    print(f"\n{len(combinations)} combinaciones, {unindexed} recorren products completo sin indice")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,4 +10,14 @@ export const productsAPI = {
     const response = await api.get(`/products/${id}`);
     return response.data;
   },
+
+  getFacets: async (params = {}) => {
+    const response = await api.get('/products/facets', { params });
+    return response.data;
+  },
+
+  getProductsBatch: async (ids) => {
+    const response = await api.get('/products/batch', { params: { ids: ids.join(',') } });
+    return response.data;
+  },
 };
\ No newline at end of file